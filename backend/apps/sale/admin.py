@@ -0,0 +1,483 @@
+"""
+Admin for sale models, built for tables with millions of rows.
+
+- Changelists never run an unbounded ``COUNT(*)``: ``EstimatedCountPaginator``
+  reads the planner's row estimate for a whole table and stops counting a
+  filtered list at ``ADMIN_EXACT_COUNT_LIMIT``.
+- Foreign keys to large tables use autocomplete or raw-id widgets, never a
+  ``<select>`` of every row, and changelists ``select_related`` whatever
+  ``__str__`` and the columns touch.
+- Searches are exact or prefix matches on indexed columns (a number also
+  finds the row by id). Filters and sortable columns are indexed ones.
+- Bulk actions are queryset updates; deletes are soft (``softdelete``).
+"""
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import DateFieldListFilter
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections, models, transaction
+from django.db.models import Max, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import softdelete, storefront, suggest
+from .models import (
+    ArchivedRow,
+    Category,
+    Comment,
+    ImageAsset,
+    ImageVariant,
+    News,
+    Product,
+    ProductImage,
+    ProductPrice,
+    Promotion,
+    PromotionProduct,
+    RelatedProduct,
+    Role,
+    StockReservation,
+    Tombstone,
+    User,
+)
+
+
+def estimated_row_count(model, using):
+    """
+    The database's estimate of the rows in ``model``'s table, or None if it has none.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)'
+        params = [connection.ops.quote_name(table)]
+    elif connection.vendor == 'mysql':
+        sql = (
+            'SELECT table_rows FROM information_schema.tables '
+            'WHERE table_schema = DATABASE() AND table_name = %s'
+        )
+        params = [table]
+    elif isinstance(model._meta.pk, models.AutoField):
+        # No statistics to read; the highest id is one index lookup and an upper bound
+        return model._base_manager.using(using).aggregate(top=Max('pk'))['top'] or 0
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    # PostgreSQL reports -1 until the table is first analyzed
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def _whole_table(queryset):
+    where = queryset.query.where
+    # Hiding soft-deleted rows still counts: they are few until archived
+    return not where or where == queryset.model._default_manager.all().query.where
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts more than ``ADMIN_EXACT_COUNT_LIMIT`` rows.
+
+    Past the limit an unfiltered list reports the estimated table size, so
+    the last pages may come up short or empty. A filtered list reports at most
+    the limit and pages no further than that; narrow the filter to see more.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        if _whole_table(queryset):
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > limit:
+                return estimate
+        # COUNT(*) over a LIMITed subquery stops reading at the limit
+        return queryset.order_by()[:limit].count()
+
+
+class ScaledAdminMixin:
+    """
+    Changelist settings shared by every sale admin.
+    """
+    paginator = EstimatedCountPaginator
+    # The "(N total)" next to a filtered count is a second full COUNT(*)
+    show_full_result_count = False
+    # Searched with the whole term when it is a number
+    number_search_fields = ('pk',)
+
+    def get_ordering(self, request):
+        # The changelist falls back to -pk anyway;
+        # autocomplete needs an order of its own
+        return super().get_ordering(request) or ('-pk',)
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not (term.isdigit() and len(term) <= 18):
+            return super().get_search_results(request, queryset, search_term)
+        results, may_have_duplicates = queryset.none(), False
+        if self.get_search_fields(request):
+            results, may_have_duplicates = super().get_search_results(
+                request, queryset, search_term
+            )
+        for field in self.number_search_fields:
+            results |= queryset.filter(**{field: int(term)})
+        return results, may_have_duplicates
+
+
+class DeletedListFilter(admin.SimpleListFilter):
+    """
+    Live rows by default; soft-deleted ones come from the partial ``deleted_at`` index.
+    """
+    title = 'status'
+    parameter_name = 'deleted'
+
+    def lookups(self, request, model_admin):
+        return [('yes', 'Deleted'), ('all', 'All')]
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'Live',
+        }
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': self.value() == lookup,
+                'query_string': changelist.get_query_string(
+                    {self.parameter_name: lookup}
+                ),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(deleted_at__isnull=False)
+        if self.value() == 'all':
+            return queryset
+        return queryset.filter(deleted_at__isnull=True)
+
+
+class SoftDeleteModelForm(forms.ModelForm):
+    """
+    Unique checks also see soft-deleted rows, which keep their values until archived.
+    """
+
+    def validate_unique(self):
+        super().validate_unique()
+        unique_checks, _ = self.instance._get_unique_checks(
+            exclude=self._get_validation_exclusions()
+        )
+        for model_class, field_names in unique_checks:
+            fields = [model_class._meta.get_field(name) for name in field_names]
+            lookup = {
+                field.attname: getattr(self.instance, field.attname) for field in fields
+            }
+            if None in lookup.values() or self.has_error(field_names[0]):
+                continue
+            deleted = model_class.all_objects.filter(
+                deleted_at__isnull=False, **lookup
+            ).exclude(pk=self.instance.pk)
+            if deleted.exists():
+                labels = ', '.join(str(field.verbose_name) for field in fields)
+                self.add_error(
+                    field_names[0] if len(field_names) == 1 else None,
+                    f'A deleted {model_class._meta.verbose_name} '
+                    f'with this {labels} still exists.',
+                )
+
+
+class SoftDeleteAdmin(ScaledAdminMixin, admin.ModelAdmin):
+    """
+    Admin of a soft-deletable model with ``created_by``/``updated_by``.
+
+    Deleting soft-deletes, with dependants, in a few UPDATEs; the
+    ``DeletedListFilter`` shows deleted rows until they are archived.
+    """
+    form = SoftDeleteModelForm
+    readonly_fields = (
+        'created_by',
+        'updated_by',
+        'created_at',
+        'updated_at',
+        'deleted_at',
+    )
+    list_filter = (DeletedListFilter,)
+    actions = ['delete_selected']
+
+    def get_queryset(self, request):
+        if getattr(request.resolver_match, 'url_name', None) == 'autocomplete':
+            # Choices for other objects' foreign keys, which only accept live rows
+            return super().get_queryset(request)
+        queryset = self.model.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        return queryset.order_by(*ordering) if ordering else queryset
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.updated_by = request.user
+        else:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        softdelete.soft_delete(obj)
+
+    def delete_queryset(self, request, queryset):
+        softdelete.soft_delete_many(queryset)
+
+    def get_deleted_objects(self, objs, request):
+        # Dependants go in the same UPDATEs; collecting them all to list them would not
+        count = objs.count() if isinstance(objs, QuerySet) else len(objs)
+        listed = [] if isinstance(objs, QuerySet) else [str(obj) for obj in objs]
+        return listed, {self.opts.verbose_name_plural: count}, set(), []
+
+    @admin.action(
+        description='Delete selected %(verbose_name_plural)s', permissions=['delete']
+    )
+    def delete_selected(self, request, queryset):
+        # Replaces Django's action, which saves a log entry
+        # per row and walks every dependant
+        count = softdelete.soft_delete_many(queryset)
+        self.message_user(
+            request,
+            f'Deleted {count} {self.opts.verbose_name_plural} '
+            'and the rows depending on them.',
+            messages.SUCCESS,
+        )
+
+
+class ReadOnlyAdmin(ScaledAdminMixin, admin.ModelAdmin):
+    """
+    Admin of rows maintained by background jobs: browsable, not editable.
+    """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Role)
+class RoleAdmin(ScaledAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'created_at')
+    search_fields = ('name__startswith',)
+    search_help_text = 'Name prefix or id.'
+    sortable_by = ('name',)
+
+
+@admin.register(User)
+class UserAdmin(ScaledAdminMixin, BaseUserAdmin):
+    list_display = ('username', 'email', 'role', 'is_staff', 'is_active', 'date_joined')
+    list_select_related = ('role',)
+    list_filter = ('role',)
+    search_fields = ('username__startswith',)
+    search_help_text = 'Username prefix or id.'
+    sortable_by = ('username',)
+    autocomplete_fields = ('role',)
+    fieldsets = BaseUserAdmin.fieldsets + (('Role', {'fields': ('role',)}),)
+    add_fieldsets = BaseUserAdmin.add_fieldsets + (('Role', {'fields': ('role',)}),)
+
+
+@admin.register(Category)
+class CategoryAdmin(SoftDeleteAdmin):
+    list_display = ('name', 'slug', 'parent', 'created_at')
+    list_select_related = ('parent',)
+    search_fields = ('slug__startswith',)
+    search_help_text = 'Slug prefix or id.'
+    sortable_by = ('slug',)
+    autocomplete_fields = ('parent',)
+
+
+@admin.register(Product)
+class ProductAdmin(SoftDeleteAdmin):
+    list_display = (
+        'name',
+        'sku',
+        'category',
+        'price',
+        'stock_quantity',
+        'is_active',
+        'created_at',
+    )
+    list_select_related = ('category',)
+    list_filter = SoftDeleteAdmin.list_filter + (('created_at', DateFieldListFilter),)
+    search_fields = ('sku__startswith', 'slug__startswith')
+    search_help_text = 'SKU or slug prefix, or id.'
+    sortable_by = ('sku', 'price', 'created_at')
+    autocomplete_fields = ('category',)
+    raw_id_fields = ('image_asset',)
+    readonly_fields = SoftDeleteAdmin.readonly_fields + (
+        'comment_count',
+        'view_count',
+        'popularity',
+    )
+    actions = SoftDeleteAdmin.actions + ['make_active', 'make_inactive']
+
+    @admin.action(
+        description='Mark selected products as active', permissions=['change']
+    )
+    def make_active(self, request, queryset):
+        self.set_active(request, queryset, True)
+
+    @admin.action(
+        description='Mark selected products as inactive', permissions=['change']
+    )
+    def make_inactive(self, request, queryset):
+        self.set_active(request, queryset, False)
+
+    def set_active(self, request, queryset, active):
+        now = timezone.now()
+        pks = list(queryset.filter(is_active=not active).values_list('pk', flat=True))
+        with transaction.atomic():
+            for start in range(0, len(pks), softdelete.UPDATE_BATCH_SIZE):
+                batch = pks[start:start + softdelete.UPDATE_BATCH_SIZE]
+                # updated_at by hand: update() skips auto_now,
+                # and the change feed keys on it
+                Product.all_objects.filter(pk__in=batch).update(
+                    is_active=active, updated_at=now
+                )
+            # What the save signals would have cleared
+            cache.delete_many([f'product_{pk}' for pk in pks])
+            transaction.on_commit(suggest.invalidate)
+            transaction.on_commit(storefront.mark_dirty)
+        state = 'active' if active else 'inactive'
+        self.message_user(
+            request, f'Marked {len(pks)} products as {state}.', messages.SUCCESS
+        )
+
+
+@admin.register(ProductImage)
+class ProductImageAdmin(SoftDeleteAdmin):
+    list_display = ('id', 'product', 'image_url', 'created_at')
+    list_select_related = ('product',)
+    search_fields = ('product__sku__exact',)
+    search_help_text = 'Product SKU or image id.'
+    autocomplete_fields = ('product',)
+    raw_id_fields = ('asset',)
+
+
+@admin.register(News)
+class NewsAdmin(SoftDeleteAdmin):
+    list_display = ('title', 'slug', 'comment_count', 'created_at')
+    search_fields = ('slug__startswith',)
+    search_help_text = 'Slug prefix or id.'
+    sortable_by = ('slug',)
+    readonly_fields = SoftDeleteAdmin.readonly_fields + (
+        'comment_count',
+        'view_count',
+        'popularity',
+    )
+
+
+@admin.register(Promotion)
+class PromotionAdmin(SoftDeleteAdmin):
+    list_display = (
+        'title',
+        'slug',
+        'discount_type',
+        'discount_value',
+        'start_date',
+        'end_date',
+        'priority',
+    )
+    list_filter = SoftDeleteAdmin.list_filter + (
+        ('start_date', DateFieldListFilter), ('end_date', DateFieldListFilter),
+    )
+    search_fields = ('slug__startswith',)
+    search_help_text = 'Slug prefix or id.'
+    sortable_by = ('slug', 'start_date', 'end_date')
+
+
+@admin.register(Comment)
+class CommentAdmin(SoftDeleteAdmin):
+    list_display = ('id', 'user', 'target_type', 'target_id', 'rating', 'created_at')
+    list_select_related = ('user',)
+    list_filter = SoftDeleteAdmin.list_filter + ('target_type',)
+    search_fields = ('user__username__exact',)
+    search_help_text = 'Username, or a comment or target id.'
+    number_search_fields = ('pk', 'target_id')
+    autocomplete_fields = ('user',)
+
+
+@admin.register(PromotionProduct)
+class PromotionProductAdmin(SoftDeleteAdmin):
+    list_display = ('promotion', 'product', 'created_at')
+    list_select_related = ('promotion', 'product')
+    search_fields = ('product__sku__exact', 'promotion__slug__exact')
+    search_help_text = 'Product SKU, promotion slug or id.'
+    autocomplete_fields = ('promotion', 'product')
+
+
+@admin.register(ImageAsset)
+class ImageAssetAdmin(ReadOnlyAdmin):
+    list_display = ('sha256', 'width', 'height', 'format', 'size', 'created_at')
+    search_fields = ('sha256__startswith',)
+    search_help_text = 'SHA-256 prefix or id.'
+
+
+@admin.register(ImageVariant)
+class ImageVariantAdmin(ReadOnlyAdmin):
+    list_display = ('asset', 'width', 'format', 'size', 'created_at')
+    list_select_related = ('asset',)
+    search_fields = ('asset__sha256__startswith',)
+    search_help_text = 'Asset SHA-256 prefix or id.'
+
+
+@admin.register(ProductPrice)
+class ProductPriceAdmin(ReadOnlyAdmin):
+    list_display = ('product', 'price', 'promotion', 'updated_at')
+    list_select_related = ('product', 'promotion')
+    search_fields = ('product__sku__exact',)
+    search_help_text = 'Product SKU or id.'
+
+
+@admin.register(RelatedProduct)
+class RelatedProductAdmin(ReadOnlyAdmin):
+    list_display = ('product', 'rank', 'related', 'score')
+    list_select_related = ('product', 'related')
+    search_fields = ('product__sku__exact',)
+    search_help_text = 'Product SKU or id.'
+    number_search_fields = ('product_id',)
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(ReadOnlyAdmin):
+    list_display = (
+        'id',
+        'product',
+        'user',
+        'quantity',
+        'status',
+        'expires_at',
+        'created_at',
+    )
+    list_select_related = ('product', 'user')
+    list_filter = ('status',)
+    search_fields = ('product__sku__exact',)
+    search_help_text = 'Product SKU or id.'
+    number_search_fields = ('product_id',)
+
+
+@admin.register(Tombstone)
+class TombstoneAdmin(ReadOnlyAdmin):
+    list_display = ('model', 'object_id', 'deleted_at')
+    search_fields = ('model__exact',)
+    search_help_text = 'Model label (e.g. sale.product) or object id.'
+    number_search_fields = ('object_id',)
+
+
+@admin.register(ArchivedRow)
+class ArchivedRowAdmin(ReadOnlyAdmin):
+    list_display = ('model', 'object_id', 'deleted_at', 'archived_at')
+    search_fields = ('model__exact',)
+    search_help_text = 'Model label (e.g. sale.product) or object id.'
+    number_search_fields = ('object_id',)
@@ -0,0 +1,354 @@
+"""
+Async list/retrieve endpoints for sale viewsets.
+
+When ``ASYNC_SERVING`` is enabled these views are mounted in front of the
+router URLs. JSON ``GET`` requests are answered with the async ORM so an
+ASGI worker can keep many of them in flight at once; every other request
+(writes, HEAD/OPTIONS, the browsable API) is handed to the regular DRF
+viewset unchanged.
+"""
+import re
+
+import django_filters
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.models import Session
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.http import HttpResponse
+from django.urls import re_path
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import exceptions, relations, serializers, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import fragments, popularity
+from .models import User
+
+DB_SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+
+class AsyncFilterSet(django_filters.FilterSet):
+    """
+    FilterSet that never touches the database while validating input.
+
+    Foreign keys are filtered by raw id instead of a ``ModelChoiceFilter``,
+    which would run a blocking existence query during validation.
+    """
+
+    FILTER_DEFAULTS = {
+        **django_filters.FilterSet.FILTER_DEFAULTS,
+        models.ForeignKey: {'filter_class': django_filters.NumberFilter},
+        models.OneToOneField: {'filter_class': django_filters.NumberFilter},
+    }
+
+
+class AsyncFilterBackend(DjangoFilterBackend):
+    filterset_base = AsyncFilterSet
+
+
+def _select_related_paths(serializer_class):
+    """
+    Relations read through dotted ``source`` paths, e.g. ``category.name``.
+
+    They have to be joined up front: lazy loading is a blocking query that
+    is not allowed from async code.
+    """
+    paths = set()
+    for field in serializer_class().fields.values():
+        if '.' in field.source:
+            paths.add('__'.join(field.source.split('.')[:-1]))
+    return sorted(paths)
+
+
+def renders_flat(serializer):
+    """
+    Whether ``serializer`` can be rendered without extra queries.
+
+    Many-to-many and nested list fields need ``prefetch_related``, which the
+    async ORM does not support on Django 4.2.
+    """
+    for field in serializer.fields.values():
+        if isinstance(field, (relations.ManyRelatedField, serializers.ListSerializer)):
+            return False
+    return True
+
+
+def supports_async(viewset_class):
+    return renders_flat(viewset_class.serializer_class())
+
+
+async def aget_user(request, viewset_class):
+    """
+    Resolve the authenticated user without blocking the event loop.
+
+    Database-backed sessions are read with the async ORM; other credentials
+    (e.g. HTTP Basic) fall back to the viewset's DRF authenticators.
+    """
+    if (
+        'HTTP_AUTHORIZATION' in request.META
+        or settings.SESSION_ENGINE != DB_SESSION_ENGINE
+    ):
+        return await sync_to_async(_authenticate)(request, viewset_class)
+
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    session = await Session.objects.filter(
+        session_key=session_key, expire_date__gt=timezone.now()
+    ).afirst()
+    if session is None:
+        return None
+    data = session.get_decoded()
+    if data.get(BACKEND_SESSION_KEY) not in settings.AUTHENTICATION_BACKENDS:
+        return None
+    user = await User.objects.filter(pk=data.get(SESSION_KEY), is_active=True).afirst()
+    if user is None or not constant_time_compare(
+        data.get(HASH_SESSION_KEY, ''), user.get_session_auth_hash()
+    ):
+        return None
+    return user
+
+
+def _authenticate(request, viewset_class):
+    drf_request = Request(
+        request,
+        authenticators=[auth() for auth in viewset_class.authentication_classes],
+    )
+    try:
+        user = drf_request.user
+    except exceptions.APIException:
+        return None
+    return user if user.is_authenticated else None
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        content_type='application/json',
+        status=status_code,
+    )
+
+
+class AsyncReadView:
+    """
+    Async ``list`` or ``retrieve`` for one DRF viewset.
+
+    Requests using any of the viewset's ``sync_only_params`` (features the
+    async path does not implement) are handed to the sync view.
+    """
+
+    def __init__(self, viewset_class, detail):
+        self.viewset_class = viewset_class
+        self.detail = detail
+        self.action = 'retrieve' if detail else 'list'
+        actions = (
+            {
+                'get': 'retrieve',
+                'put': 'update',
+                'patch': 'partial_update',
+                'delete': 'destroy',
+            }
+            if detail
+            else {'get': 'list', 'post': 'create'}
+        )
+        # Read-mostly viewsets (e.g. reservations) answer the rest with 405
+        actions = {
+            method: action
+            for method, action in actions.items()
+            if hasattr(viewset_class, action)
+        }
+        self.sync_view = sync_to_async(viewset_class.as_view(actions))
+        self.select_related = _select_related_paths(viewset_class.serializer_class)
+        self.filter_backends = [
+            AsyncFilterBackend if backend is DjangoFilterBackend else backend
+            for backend in viewset_class.filter_backends
+        ]
+        # DRF enforces CSRF itself for session-authenticated writes
+        self.csrf_exempt = True
+        markcoroutinefunction(self)
+
+    async def __call__(self, request, *args, **kwargs):
+        if (
+            request.method != 'GET'
+            or 'text/html' in request.headers.get('Accept', '')
+            or any(
+                param in request.GET
+                for param in getattr(self.viewset_class, 'sync_only_params', ())
+            )
+        ):
+            return await self.sync_view(request, *args, **kwargs)
+
+        viewset = self.viewset_class(
+            action=self.action, format_kwarg=None, args=args, kwargs=kwargs
+        )
+        drf_request = Request(request)
+        viewset.request = drf_request
+        context = viewset.get_serializer_context()
+        if not renders_flat(viewset.get_serializer_class()(context=context)):
+            # e.g. opt-in nested relations (``?include=``) that need prefetching
+            return await self.sync_view(request, *args, **kwargs)
+        drf_request.user = await aget_user(request, self.viewset_class)
+
+        if drf_request.user is None:
+            return _json(
+                {'detail': str(exceptions.NotAuthenticated.default_detail)},
+                status.HTTP_403_FORBIDDEN,
+            )
+        permissions = [permission() for permission in viewset.permission_classes]
+        if not all(
+            permission.has_permission(drf_request, viewset)
+            for permission in permissions
+        ):
+            return _json(
+                {'detail': str(exceptions.PermissionDenied.default_detail)},
+                status.HTTP_403_FORBIDDEN,
+            )
+
+        queryset = viewset.get_queryset()
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        try:
+            for backend in self.filter_backends:
+                queryset = backend().filter_queryset(drf_request, queryset, viewset)
+        except exceptions.ValidationError as e:
+            return _json(e.detail, status.HTTP_400_BAD_REQUEST)
+
+        if self.detail:
+            lookup_url_kwarg = viewset.lookup_url_kwarg or viewset.lookup_field
+            try:
+                obj = await queryset.filter(
+                    **{viewset.lookup_field: kwargs[lookup_url_kwarg]}
+                ).afirst()
+            except (TypeError, ValueError, ValidationError):
+                # A lookup of the wrong type, e.g. /products/abc/:
+                # a 404 as from get_object_or_404
+                obj = None
+            if obj is None or not all(
+                permission.has_object_permission(drf_request, viewset, obj)
+                for permission in permissions
+            ):
+                return _json(
+                    {'detail': str(exceptions.NotFound.default_detail)},
+                    status.HTTP_404_NOT_FOUND,
+                )
+            if getattr(viewset, 'popularity_target', None):
+                await sync_to_async(popularity.record)(
+                    viewset.popularity_target, obj.pk
+                )
+            return _json(viewset.get_serializer_class()(obj, context=context).data)
+
+        return await self.paginated(request, queryset, viewset, context)
+
+    async def paginated(self, request, queryset, viewset, context):
+        """
+        Same response shape as ``PageNumberPagination``.
+        """
+        page_size = api_settings.PAGE_SIZE
+        try:
+            page = int(request.GET.get('page', 1))
+        except ValueError:
+            page = 0
+        count = await queryset.acount()
+        last_page = max(1, -(-count // page_size))
+        if page < 1 or page > last_page:
+            return _json({'detail': 'Invalid page.'}, status.HTTP_404_NOT_FOUND)
+
+        offset = (page - 1) * page_size
+        url = request.build_absolute_uri()
+        previous = None
+        if page > 1:
+            previous = (
+                remove_query_param(url, 'page')
+                if page == 2
+                else replace_query_param(url, 'page', page - 1)
+            )
+        envelope = {
+            'count': count,
+            'next': (
+                replace_query_param(url, 'page', page + 1) if page < last_page else None
+            ),
+            'previous': previous,
+        }
+
+        if getattr(viewset, 'fragment_cacheable', lambda: False)():
+            rows = queryset.values_list('pk', *viewset.fragment_version_fields)[
+                offset : offset + page_size
+            ]
+            parts = await self.fragments(
+                [row async for row in rows], queryset, viewset, context
+            )
+            return HttpResponse(
+                fragments.splice(JSONRenderer().render(envelope), parts),
+                content_type='application/json',
+            )
+
+        objs = [obj async for obj in queryset[offset:offset + page_size]]
+        envelope['results'] = viewset.get_serializer_class()(
+            objs, many=True, context=context
+        ).data
+        return _json(envelope)
+
+    async def fragments(self, rows, queryset, viewset, context):
+        """
+        Rendered rows for a page of ``(pk, *version)`` rows; see
+        ``views.FragmentListMixin``.
+        """
+        prefix = viewset.batch_cache_prefix
+        versions = {
+            row[0]: viewset.fragment_version(viewset.request, row[1:]) for row in rows
+        }
+        found = await sync_to_async(fragments.get_many)(prefix, versions)
+
+        missing = [pk for pk in versions if pk not in found]
+        if missing:
+            objs = [obj async for obj in queryset.filter(pk__in=missing)]
+            rendered = dict(
+                zip(
+                    (obj.pk for obj in objs),
+                    fragments.render(
+                        viewset.get_serializer_class()(
+                            objs, many=True, context=context
+                        ).data
+                    ),
+                )
+            )
+            await sync_to_async(fragments.set_many)(prefix, versions, rendered)
+            found.update(rendered)
+        return [found[pk] for pk in versions if pk in found]
+
+
+def async_urlpatterns(router):
+    """
+    URL patterns that shadow the router's list/detail routes with async views.
+    """
+    patterns = []
+    for prefix, viewset_class, basename in router.registry:
+        if not supports_async(viewset_class):
+            continue
+        lookup = viewset_class.lookup_url_kwarg or viewset_class.lookup_field
+        # List routes such as products/suggest/ must still reach the router
+        list_actions = '|'.join(
+            re.escape(extra.url_path)
+            for extra in viewset_class.get_extra_actions()
+            if not extra.detail
+        )
+        exclude = rf'(?!(?:{list_actions})/$)' if list_actions else ''
+        patterns += [
+            re_path(
+                rf'^{prefix}/$',
+                AsyncReadView(viewset_class, detail=False),
+                name=f'{basename}-list-async',
+            ),
+            re_path(
+                rf'^{prefix}/{exclude}(?P<{lookup}>[^/.]+)/$',
+                AsyncReadView(viewset_class, detail=True),
+                name=f'{basename}-detail-async',
+            ),
+        ]
+    return patterns
@@ -0,0 +1,99 @@
+"""
+Comment counters and first-page caching for commentable objects.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from rest_framework.pagination import CursorPagination
+
+from .models import Comment, News, Product
+
+COMMENT_TARGETS = {
+    'product': Product,
+    'news': News,
+}
+
+FIRST_PAGE_CACHE_TIMEOUT = 60 * 15
+
+
+class CommentCursorPagination(CursorPagination):
+    """
+    Keyset pagination for comment feeds, newest first.
+
+    Walks the ``(target_type, target_id, created_at)`` index instead of
+    counting and offsetting, so deep pages cost the same as the first one.
+    """
+    ordering = ('-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        # Fixed by the index, not by the host viewset's ordering filter
+        return self.ordering
+
+
+class _FirstPageRequest:
+    """
+    What ``CursorPagination`` reads from a request, for the first page: no cursor, links
+    relative to the feed.
+    """
+    query_params = {}
+
+    def build_absolute_uri(self):
+        return ''
+
+
+def comment_page_cache_key(target_type, target_id):
+    """
+    Cache key of a target's first comment page, expired by ``signals.py``.
+    """
+    return f'{target_type}_{target_id}_comments'
+
+
+def feed_queryset(target_type, target_id):
+    return Comment.objects.filter(
+        target_type=target_type, target_id=target_id, deleted_at__isnull=True
+    ).select_related('user', 'created_by', 'updated_by')
+
+
+def first_page(target_type, target_id):
+    """
+    A target's first comment page, built without a request so it can be warmed by
+    Celery.
+
+    ``next`` is relative to the feed URL (``?cursor=...``).
+    """
+    from .serializers import CommentSerializer
+
+    paginator = CommentCursorPagination()
+    page = paginator.paginate_queryset(
+        feed_queryset(target_type, target_id), _FirstPageRequest()
+    )
+    return {
+        'next': paginator.get_next_link(),
+        'previous': None,
+        'results': CommentSerializer(page, many=True).data,
+    }
+
+
+def adjust_comment_count(target_type, target_id, delta):
+    """
+    Atomically add ``delta`` to a target's denormalized ``comment_count``.
+    """
+    model = COMMENT_TARGETS.get(target_type)
+    if model is None or not delta:
+        return
+    model.objects.filter(pk=target_id).update(
+        comment_count=Greatest(F('comment_count') + delta, 0)
+    )
+
+
+def recount_comment_counts(target_type):
+    """
+    Recompute ``comment_count`` for every target of a type in one statement.
+
+    For bulk loads, which bypass the signals that keep counts current.
+    """
+    live = Comment.objects.filter(
+        target_type=target_type, target_id=OuterRef('pk'), deleted_at__isnull=True
+    ).order_by().values('target_id').annotate(total=Count('id')).values('total')
+    return COMMENT_TARGETS[target_type].objects.update(
+        comment_count=Coalesce(Subquery(live), 0)
+    )
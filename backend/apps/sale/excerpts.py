@@ -0,0 +1,79 @@
+"""
+Stored plain-text excerpts of long text columns.
+
+``Product.description``, ``News.content`` and ``Promotion.description`` are
+unbounded. List endpoints defer them and serve the ``excerpt`` column
+instead, which ``save()`` keeps in step. Rows written without ``save()``
+(``bulk_create``, ``update()``) are fixed up by the ``backfill_excerpts``
+management command.
+"""
+from django.db import connection, transaction
+from django.utils.html import strip_tags
+
+EXCERPT_LENGTH = 200
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def make_excerpt(text):
+    """
+    The first ``EXCERPT_LENGTH`` characters of ``text`` as one line of plain text.
+    """
+    text = text or ''
+    if '<' in text:
+        text = strip_tags(text)
+    text = ' '.join(text.split())
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    return text[:EXCERPT_LENGTH - 1].rstrip() + '\u2026'
+
+
+def _write(model, rows):
+    """
+    Store ``(excerpt, pk)`` pairs with one ``executemany`` in one transaction.
+
+    ``bulk_update`` would build a ``CASE`` expression per row, which costs
+    more than computing the excerpts.
+    """
+    quote = connection.ops.quote_name
+    sql = (
+        f'UPDATE {quote(model._meta.db_table)} SET {quote("excerpt")} = %s '
+        f'WHERE {quote(model._meta.pk.column)} = %s'
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def backfill(model, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Recompute ``excerpt`` for every row of ``model``; returns the number of rows
+    changed.
+
+    Walks the table in primary key order and only writes rows whose excerpt
+    is out of date. ``updated_at`` is left alone, so a backfill does not
+    show up in the change feeds.
+    """
+    from . import fragments
+
+    source = model.excerpt_source
+    changed = 0
+    last_pk = 0
+    while True:
+        rows = list(
+            model.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', source, 'excerpt')[:batch_size]
+        )
+        if not rows:
+            return changed
+        stale = []
+        for pk, text, current in rows:
+            excerpt = make_excerpt(text)
+            if current != excerpt:
+                stale.append((excerpt, pk))
+        if stale:
+            _write(model, stale)
+            # The version check cannot see the change, as updated_at is kept
+            fragments.invalidate(model._meta.model_name, [pk for _, pk in stale])
+            changed += len(stale)
+        last_pk = rows[-1][0]
@@ -0,0 +1,169 @@
+"""
+Facet counts for product listings.
+
+Counts are grouped by category, price bucket, stock and promotion status in
+a single aggregate query, cached briefly per filter combination. Listings
+filtered at most by ``category`` and ``is_active`` are answered from a cached
+per-category summary instead, which Celery beat keeps warm, so the common
+storefront views cost no facet query at all however large the catalog is.
+"""
+import hashlib
+from collections import defaultdict
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db.models import BooleanField, Case, Count, IntegerField, Value, When
+
+from . import hotcache
+from .models import Product
+
+SUMMARY_CACHE_KEY = 'products_facet_summary'
+
+# Listing parameters that never change which products are counted
+NEUTRAL_PARAMS = {'page', 'ordering', 'facets', 'include', 'format'}
+
+SUMMARY_PARAMS = {'category', 'is_active'}
+
+TRUE_VALUES = {'true', 'True', '1'}
+FALSE_VALUES = {'false', 'False', '0'}
+
+
+def price_buckets():
+    """
+    ``(min, max)`` price ranges; the last one is open-ended.
+    """
+    edges = [Decimal('0')] + [
+        Decimal(str(edge)) for edge in settings.PRODUCT_PRICE_BUCKETS
+    ]
+    return list(zip(edges, edges[1:] + [None]))
+
+
+def _grouped(queryset, *fields):
+    bucket = Case(
+        *[
+            When(price__lt=upper, then=Value(i))
+            for i, (_, upper) in enumerate(price_buckets())
+            if upper is not None
+        ],
+        default=Value(len(price_buckets()) - 1),
+        output_field=IntegerField(),
+    )
+    return (
+        queryset.order_by()
+        .annotate(
+            price_bucket=bucket,
+            in_stock=Case(
+                When(stock_quantity__gt=0, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+            on_promotion=Case(
+                When(effective__isnull=False, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+        )
+        .values(*fields, 'price_bucket', 'in_stock', 'on_promotion')
+        .annotate(total=Count('id'))
+    )
+
+
+def _fold(rows):
+    """
+    Turn grouped ``rows`` into the facet block of a listing response.
+    """
+    categories = defaultdict(int)
+    prices = defaultdict(int)
+    in_stock = {True: 0, False: 0}
+    on_promotion = {True: 0, False: 0}
+    for row in rows:
+        categories[row['category_id']] += row['total']
+        prices[row['price_bucket']] += row['total']
+        in_stock[bool(row['in_stock'])] += row['total']
+        on_promotion[bool(row['on_promotion'])] += row['total']
+
+    return {
+        'category': [
+            {'value': category_id, 'count': count}
+            for category_id, count in sorted(
+                categories.items(), key=lambda item: (-item[1], item[0])
+            )
+        ],
+        'price': [
+            {
+                'min': str(lower),
+                'max': str(upper) if upper is not None else None,
+                'count': prices[i],
+            }
+            for i, (lower, upper) in enumerate(price_buckets())
+        ],
+        'in_stock': {'true': in_stock[True], 'false': in_stock[False]},
+        'on_promotion': {'true': on_promotion[True], 'false': on_promotion[False]},
+    }
+
+
+def build_summary():
+    """
+    Grouped counts for the whole catalog, also split by ``is_active``.
+    """
+    return hotcache.refresh(
+        SUMMARY_CACHE_KEY, _summary_rows, settings.PRODUCT_FACET_SUMMARY_TIMEOUT
+    )
+
+
+def _summary_rows():
+    return list(_grouped(Product.objects.all(), 'category_id', 'is_active'))
+
+
+def _summary_filters(params):
+    """
+    ``(category_id, is_active)`` if the summary can answer ``params``, else None.
+    """
+    active = {
+        key
+        for key, value in params.items()
+        if value != '' and key not in NEUTRAL_PARAMS
+    }
+    if not active <= SUMMARY_PARAMS:
+        return None
+    category = params.get('category') or None
+    is_active = params.get('is_active') or None
+    if category is not None:
+        if not category.isdigit():
+            return None
+        category = int(category)
+    if is_active is not None:
+        if is_active not in TRUE_VALUES | FALSE_VALUES:
+            return None
+        is_active = is_active in TRUE_VALUES
+    return category, is_active
+
+
+def facets(queryset, params):
+    """
+    Facet block for a filtered product ``queryset`` built from request ``params``.
+    """
+    filters = _summary_filters(params)
+    if filters is None:
+        relevant = sorted(
+            (key, value) for key, value in params.items() if key not in NEUTRAL_PARAMS
+        )
+        key = (
+            f'products_facets_{hashlib.sha1(urlencode(relevant).encode()).hexdigest()}'
+        )
+        return hotcache.get_or_compute(
+            key,
+            lambda: _fold(_grouped(queryset, 'category_id')),
+            settings.PRODUCT_FACET_CACHE_TIMEOUT,
+        )
+
+    category, is_active = filters
+    rows = hotcache.get_or_compute(
+        SUMMARY_CACHE_KEY, _summary_rows, settings.PRODUCT_FACET_SUMMARY_TIMEOUT
+    )
+    return _fold(
+        row for row in rows
+        if (category is None or row['category_id'] == category)
+        and (is_active is None or row['is_active'] == is_active)
+    )
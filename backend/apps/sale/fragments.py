@@ -0,0 +1,123 @@
+"""
+Per-object serialized fragments for list responses.
+
+Filter, search and ordering combinations are too many for whole list pages
+to be worth caching, but the rows on them repeat from page to page. Each
+row's rendered JSON is cached on its own under ``{prefix}_{pk}_fragment``,
+together with the version it was rendered at: the values of the viewset's
+``fragment_version_fields`` (``updated_at`` plus the columns that bulk
+updates change without touching it, e.g. counters and joined prices).
+
+A list request then reads only ids and versions for its page, fetches the
+fragments with one ``get_many``, serializes the rows that are missing or
+out of date, and splices the bytes into the response. The save and delete
+signals drop fragments as well, so memory is freed as soon as a row changes;
+the version check catches writes that send no signal.
+"""
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+class VersionRows:
+    """
+    What a list page is paginated over: ``(pk, *fields)`` rows of ``queryset``, counted
+    on ``queryset``.
+
+    Counting the ``values_list`` itself would keep the joins that related
+    version fields (e.g. ``effective__price``) need, which makes the count
+    several times slower on large tables.
+    """
+
+    def __init__(self, queryset, fields):
+        self.queryset = queryset
+        self.rows = queryset.values_list('pk', *fields)
+        # Read by the paginator's unordered-pagination warning
+        self.model = queryset.model
+        self.ordered = queryset.ordered
+
+    def count(self):
+        return self.queryset.count()
+
+    def __getitem__(self, index):
+        return self.rows[index]
+
+
+def key(prefix, pk):
+    return f'{prefix}_{pk}_fragment'
+
+
+def invalidate(prefix, pks):
+    cache.delete_many([key(prefix, pk) for pk in pks])
+
+
+def get_many(prefix, versions):
+    """
+    Cached fragments for ``versions`` (``{pk: version}``) that are still current, as
+    ``{pk: bytes}``.
+    """
+    cached = cache.get_many([key(prefix, pk) for pk in versions])
+    found = {}
+    for pk, version in versions.items():
+        entry = cached.get(key(prefix, pk))
+        if entry is not None and entry[0] == version:
+            found[pk] = entry[1]
+    return found
+
+
+def set_many(prefix, versions, rendered):
+    """
+    Cache ``rendered`` (``{pk: bytes}``) at the versions the page was read at.
+
+    A row updated in between is stored under its old version and simply
+    rendered again by the next request that sees the new one.
+    """
+    cache.set_many(
+        {
+            key(prefix, pk): (versions[pk], fragment)
+            for pk, fragment in rendered.items()
+        },
+        settings.FRAGMENT_CACHE_TIMEOUT,
+    )
+
+
+def render(rows):
+    """
+    Each serialized row as its own JSON document.
+    """
+    renderer = JSONRenderer()
+    return [renderer.render(row) for row in rows]
+
+
+def splice(envelope, fragments):
+    """
+    ``envelope`` (a rendered JSON object) with ``fragments`` added as its ``results``
+    array.
+    """
+    body = envelope.rstrip()[:-1]
+    separator = b',' if body.rstrip() != b'{' else b''
+    return body + separator + b'"results":[' + b','.join(fragments) + b']}'
+
+
+class FragmentResponse(Response):
+    """
+    A list ``Response`` whose ``results`` are already-rendered fragments.
+
+    ``data`` holds the rest of the page (``count``, ``next``, ...), so views
+    can still add keys to it. Renderers other than JSON get the rows decoded
+    back into ``data``.
+    """
+
+    def __init__(self, data, fragments, **kwargs):
+        super().__init__(data, **kwargs)
+        self.fragments = fragments
+
+    @property
+    def rendered_content(self):
+        if type(getattr(self, 'accepted_renderer', None)) is not JSONRenderer:
+            self.data['results'] = [json.loads(fragment) for fragment in self.fragments]
+            return super().rendered_content
+        return splice(super().rendered_content, self.fragments)
@@ -0,0 +1,185 @@
+"""
+Stampede-safe caching for hot keys that are expensive to compute.
+
+``get_or_compute`` stores a value with a soft expiry and keeps it for
+``HOT_CACHE_STALE_SECONDS`` past it. Once the value is due, one process (the
+one that wins ``cache.add`` on the key's lock) recomputes it. The others keep
+serving the stale value; only a reader with nothing at all to serve waits
+for the winner. Values are also recomputed a little early at random
+(XFetch). The chance of that grows as expiry nears and with the time the
+last computation took, so a key read constantly is refreshed by one reader
+before it expires rather than by all of them after.
+
+``expire`` is the invalidation. Instead of deleting, it marks entries due
+once the transaction commits, so readers keep getting the old value while
+it is recomputed. Keys that are read often and were stored with a ``warm``
+recipe are then recomputed by the ``warm_cache`` Celery task straight away,
+before a reader has to.
+"""
+import logging
+import math
+import random
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Weight of the last computation time in early recomputation; >1 refreshes earlier
+EARLY_EXPIRY_BETA = 1.0
+
+# One read in this many is counted towards a key's heat
+HIT_SAMPLE = 10
+HIT_WINDOW = 60
+
+POLL_INTERVAL = 0.05
+
+# ``warm`` is ``(dotted path, args)`` of a function that
+# recomputes the value without a request
+Entry = namedtuple('Entry', 'value expires delta timeout warm')
+
+
+def _lock_key(key):
+    return f'{key}_lock'
+
+
+def _hits_key(key):
+    return f'{key}_hits'
+
+
+def _due(entry, now):
+    # -log(u) is exponentially distributed: early recomputations
+    # are rare until expiry is close
+    return (
+        now - entry.delta * EARLY_EXPIRY_BETA * math.log(1.0 - random.random())
+        >= entry.expires
+    )
+
+
+def _count_hit(key):
+    if random.random() * HIT_SAMPLE >= 1:
+        return
+    hits = _hits_key(key)
+    if not cache.add(hits, 1, HIT_WINDOW):
+        try:
+            cache.incr(hits)
+        except ValueError:
+            pass
+
+
+def refresh(key, compute, timeout, warm=None):
+    """
+    Compute and store ``key`` unconditionally; returns the value.
+    """
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    cache.set(
+        key, Entry(value, time.time() + timeout, delta, timeout, warm),
+        timeout + settings.HOT_CACHE_STALE_SECONDS,
+    )
+    return value
+
+
+def get_or_compute(key, compute, timeout, warm=None):
+    """
+    ``compute()`` cached under ``key`` for ``timeout`` seconds, recomputed by one
+    process at a time.
+    """
+    entry = cache.get(key)
+    if not isinstance(entry, Entry):
+        entry = None
+    if entry is not None:
+        _count_hit(key)
+        if not _due(entry, time.time()):
+            return entry.value
+
+    lock = _lock_key(key)
+    if cache.add(lock, True, settings.HOT_CACHE_LOCK_SECONDS):
+        try:
+            return refresh(key, compute, timeout, warm)
+        finally:
+            cache.delete(lock)
+    if entry is not None:
+        # Being recomputed elsewhere
+        return entry.value
+
+    deadline = time.monotonic() + settings.HOT_CACHE_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if isinstance(entry, Entry):
+            return entry.value
+    # The process holding the lock died or is stuck
+    logger.warning(f'Gave up waiting for {key} to be computed elsewhere')
+    return refresh(key, compute, timeout, warm)
+
+
+def expire(keys):
+    """
+    Mark ``keys`` due once the current transaction commits, and warm the hot ones.
+
+    Waiting for the commit matters: a reader recomputing before it would
+    cache the old data again as fresh.
+    """
+    keys = list(keys)
+    transaction.on_commit(lambda: _expire(keys))
+
+
+def _expire(keys):
+    entries = cache.get_many(keys)
+    hits = cache.get_many([_hits_key(key) for key in keys])
+    hot = []
+    for key in keys:
+        entry = entries.get(key)
+        if not isinstance(entry, Entry):
+            cache.delete(key)
+            continue
+        cache.set(key, entry._replace(expires=0), settings.HOT_CACHE_STALE_SECONDS)
+        if (
+            entry.warm
+            and hits.get(_hits_key(key), 0) * HIT_SAMPLE
+            >= settings.HOT_CACHE_WARM_READS
+        ):
+            hot.append(key)
+    # One pending warm-up per key, however many writes invalidate it meanwhile
+    hot = [
+        key
+        for key in hot
+        if cache.add(f'{key}_warm', True, settings.HOT_CACHE_LOCK_SECONDS)
+    ]
+    if hot:
+        from .tasks import warm_cache
+        warm_cache.delay(hot)
+
+
+def warm(keys):
+    """
+    Recompute due ``keys`` from their ``warm`` recipes; returns how many were refreshed.
+
+    Keys that are fresh again, or being recomputed by a reader, are skipped.
+    """
+    cache.delete_many([f'{key}_warm' for key in keys])
+    refreshed = 0
+    for key in keys:
+        entry = cache.get(key)
+        if (
+            not isinstance(entry, Entry)
+            or entry.warm is None
+            or entry.expires > time.time()
+        ):
+            continue
+        lock = _lock_key(key)
+        if not cache.add(lock, True, settings.HOT_CACHE_LOCK_SECONDS):
+            continue
+        try:
+            path, args = entry.warm
+            refresh(key, lambda: import_string(path)(*args), entry.timeout, entry.warm)
+            refreshed += 1
+        finally:
+            cache.delete(lock)
+    return refreshed
@@ -0,0 +1,298 @@
+"""
+Image ingestion, deduplication and variant rendering.
+
+Uploaded or linked images are stored once per content hash as an
+``ImageAsset``. Resized WebP/AVIF/JPEG renditions are produced on demand by
+Celery the first time a client asks for them and then served from storage.
+"""
+import hashlib
+import http.client
+import io
+import ipaddress
+import socket
+import time
+import urllib.parse
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError
+from django.http.request import validate_host
+from django.urls import reverse
+from PIL import Image, ImageOps, features
+
+from .models import ImageAsset, ImageVariant
+
+MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+PIL_FORMATS = {
+    'avif': 'AVIF',
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+VARIANT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Redirects followed when fetching a linked image, each checked like the first URL
+FETCH_REDIRECTS = 3
+FETCH_CHUNK_SIZE = 64 * 1024
+
+
+def variant_widths():
+    return settings.IMAGE_VARIANT_WIDTHS
+
+
+@lru_cache(maxsize=None)
+def variant_formats():
+    """Configured formats that this Pillow build can encode."""
+    return [
+        fmt
+        for fmt in settings.IMAGE_VARIANT_FORMATS
+        if fmt == 'jpeg' or features.check(fmt)
+    ]
+
+
+def variant_cache_key(digest, width, fmt):
+    return f'image_variant_{digest}_{width}_{fmt}'
+
+
+def variant_path(digest, width, fmt):
+    return f'images/variants/{digest[:2]}/{digest}/{width}.{fmt}'
+
+
+def read_source(location, max_bytes):
+    """
+    Read an image from a storage path or an http(s) URL.
+    """
+    if location.startswith(('http://', 'https://')):
+        data = fetch(location, max_bytes)
+    else:
+        with default_storage.open(location, 'rb') as fh:
+            data = fh.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f'Image {location} is larger than {max_bytes} bytes')
+    return data
+
+
+def _public_address(host, port):
+    """
+    An address of ``host`` to connect to; raises ``ValueError`` if it resolves to
+    anything not publicly routable.
+    """
+    try:
+        addresses = [
+            info[4][0]
+            for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        ]
+    except socket.gaierror as e:
+        raise ValueError(f'Cannot resolve image host {host}: {e}')
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if getattr(ip, 'ipv4_mapped', None):
+            ip = ip.ipv4_mapped
+        # Private, loopback, link-local (cloud metadata), reserved, ...
+        if not ip.is_global:
+            raise ValueError(
+                f'Image host {host} resolves to non-public address {address}'
+            )
+    return addresses[0]
+
+
+def fetch(url, max_bytes):
+    """
+    GET an image from a host in ``IMAGE_FETCH_HOSTS``; returns at most ``max_bytes + 1``
+    bytes.
+
+    ``ProductImage.image_url`` is user input fetched from a worker inside
+    the network, so each URL, redirects included, must name an allowed host
+    that resolves to public addresses only. The connection goes to the
+    address that was checked, so the name cannot be re-resolved elsewhere
+    in between. The whole download must finish within
+    ``IMAGE_FETCH_TIMEOUT``.
+    """
+    deadline = time.monotonic() + settings.IMAGE_FETCH_TIMEOUT
+    for _ in range(FETCH_REDIRECTS + 1):
+        parts = urllib.parse.urlsplit(url)
+        host = parts.hostname
+        if (
+            parts.scheme not in ('http', 'https')
+            or not host
+            or not validate_host(host, settings.IMAGE_FETCH_HOSTS)
+        ):
+            raise ValueError(f'Image host {host or url!r} is not in IMAGE_FETCH_HOSTS')
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        address = _public_address(host, port)
+
+        connection_class = (
+            http.client.HTTPSConnection
+            if parts.scheme == 'https'
+            else http.client.HTTPConnection
+        )
+        connection = connection_class(host, port, timeout=settings.IMAGE_FETCH_TIMEOUT)
+        connection._create_connection = (
+            lambda _, timeout, source_address=None: socket.create_connection(
+                (address, port), timeout, source_address
+            )
+        )
+        try:
+            connection.request(
+                'GET',
+                urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, '')),
+            )
+            response = connection.getresponse()
+            if response.status in (301, 302, 303, 307, 308) and response.getheader(
+                'Location'
+            ):
+                url = urllib.parse.urljoin(url, response.getheader('Location'))
+                continue
+            if response.status != 200:
+                raise ValueError(
+                    f'Fetching image {url} failed with HTTP {response.status}'
+                )
+            length = response.getheader('Content-Length', '')
+            if length.isdigit() and int(length) > max_bytes:
+                raise ValueError(f'Image {url} is larger than {max_bytes} bytes')
+
+            chunks = []
+            received = 0
+            while received <= max_bytes:
+                if time.monotonic() > deadline:
+                    raise ValueError(
+                        f'Fetching image {url} took longer than '
+                        f'{settings.IMAGE_FETCH_TIMEOUT}s'
+                    )
+                chunk = response.read(min(FETCH_CHUNK_SIZE, max_bytes + 1 - received))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                received += len(chunk)
+            return b''.join(chunks)
+        finally:
+            connection.close()
+    raise ValueError(
+        f'Fetching image {url} was redirected more than {FETCH_REDIRECTS} times'
+    )
+
+
+def ingest(data, filename):
+    """
+    Return the ``ImageAsset`` for ``data``, creating it only if the content is new.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    asset = ImageAsset.objects.filter(sha256=digest).first()
+    if asset is not None:
+        return asset
+
+    with Image.open(io.BytesIO(data)) as image:
+        image_format = (image.format or filename.rsplit('.', 1)[-1]).lower()
+        width, height = ImageOps.exif_transpose(image).size
+
+    asset = ImageAsset(
+        sha256=digest, width=width, height=height, format=image_format, size=len(data)
+    )
+    asset.original.save(f'{digest}.{image_format}', ContentFile(data), save=False)
+    try:
+        asset.save()
+    except IntegrityError:
+        # A concurrent worker stored the same content first
+        default_storage.delete(asset.original.name)
+        asset = ImageAsset.objects.get(sha256=digest)
+    return asset
+
+
+def render_variant(asset, width, fmt):
+    """
+    Resize ``asset`` to ``width`` (never upscaling) and encode it as ``fmt``.
+    """
+    key = variant_cache_key(asset.sha256, width, fmt)
+    # Variants are stored under the width they really have: a source
+    # narrower than ``width`` is kept as is
+    output_width = min(width, asset.width)
+    variant = ImageVariant.objects.filter(
+        asset=asset, width=output_width, format=fmt
+    ).first()
+    if variant is None:
+        with default_storage.open(asset.original.name, 'rb') as fh:
+            with Image.open(fh) as image:
+                image = ImageOps.exif_transpose(image)
+                if image.width > output_width:
+                    image = image.resize(
+                        (
+                            output_width,
+                            max(1, round(image.height * output_width / image.width)),
+                        ),
+                        Image.LANCZOS,
+                    )
+                if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                buffer = io.BytesIO()
+                image.save(
+                    buffer, PIL_FORMATS[fmt], quality=settings.IMAGE_VARIANT_QUALITY
+                )
+                output_width, output_height = image.width, image.height
+
+        name = default_storage.save(
+            variant_path(asset.sha256, output_width, fmt),
+            ContentFile(buffer.getvalue()),
+        )
+        variant, created = ImageVariant.objects.get_or_create(
+            asset=asset, width=output_width, format=fmt,
+            defaults={'height': output_height, 'file': name, 'size': buffer.tell()},
+        )
+        if not created:
+            default_storage.delete(name)
+
+    url = default_storage.url(variant.file.name)
+    cache.set(key, url, VARIANT_CACHE_TIMEOUT)
+    return url
+
+
+@lru_cache(maxsize=None)
+def _variant_url_prefix():
+    placeholder = '0' * 64
+    path = reverse(
+        'sale:image_variant', kwargs={'digest': placeholder, 'width': 1, 'fmt': 'jpeg'}
+    )
+    return path[:path.index(placeholder)]
+
+
+def srcset(asset, request=None):
+    """
+    ``<picture>``-ready URLs for ``asset``.
+
+    URLs point at the lazy variant endpoint, so building them costs no
+    queries and no image work; the first client to request a rendition
+    triggers its generation.
+    """
+    if asset is None:
+        return None
+
+    prefix = _variant_url_prefix()
+    if request is not None:
+        prefix = request.build_absolute_uri(prefix)
+    widths = [
+        width for width in variant_widths() if width <= asset.width
+    ] or variant_widths()[:1]
+
+    def candidates(fmt):
+        return ', '.join(
+            f'{prefix}{asset.sha256}/{width}.{fmt} {width}w' for width in widths
+        )
+
+    formats = variant_formats()
+    return {
+        'width': asset.width,
+        'height': asset.height,
+        'src': f'{prefix}{asset.sha256}/{widths[-1]}.jpeg',
+        'srcset': candidates('jpeg'),
+        'sources': [
+            {'type': MIME_TYPES[fmt], 'srcset': candidates(fmt)}
+            for fmt in formats if fmt != 'jpeg'
+        ],
+    }
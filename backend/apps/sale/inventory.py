@@ -0,0 +1,375 @@
+"""
+Stock reservations for checkout.
+
+A checkout ``reserve``s units while payment runs, then ``commit``s or
+``release``s them. Holds nobody commits expire after
+``INVENTORY_HOLD_SECONDS`` and are swept back by Celery beat
+(``expire_holds``). Retrying a reservation with the same idempotency key
+returns the original one, so a client may safely resend it.
+
+What can still be reserved is ``stock_quantity`` minus held units minus
+committed units not yet reconciled. During a flash sale thousands of
+checkouts hit the same product, so a reservation does not lock the product
+row. The reservable units are split over ``INVENTORY_SHARDS`` ``StockShard``
+rows instead. A hold is a conditional ``UPDATE`` of one random shard plus
+an ``INSERT``, so concurrent checkouts mostly lock different rows. Only when
+no shard has enough left does a reservation take the slow path: it locks
+every shard of the product and recomputes them from the reservations.
+Commits do not touch ``Product`` at all. ``reconcile`` takes committed units
+off ``stock_quantity`` in batches.
+
+Locks are always taken reservation rows first, then shards, and shards of
+several products in product order. The slow path only reads reservations
+while it holds the shards.
+"""
+import logging
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import popularity, push
+from .models import Product, StockReservation, StockShard
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+# Below this many units per shard, fewer shards are filled so that
+# multi-unit holds still fit in one
+SHARD_MIN_UNITS = 10
+
+# At most one slow-path rebalance per product in this many seconds;
+# others are told it is sold out
+REBALANCE_INTERVAL = 1
+
+
+class InventoryError(Exception):
+    pass
+
+
+class InsufficientStock(InventoryError):
+    pass
+
+
+class ReservationConflict(InventoryError):
+    pass
+
+
+def claimed(product_ids):
+    """
+    Units held or sold but not yet reconciled, as ``{product_id: units}``.
+    """
+    rows = (
+        StockReservation.objects.filter(
+            Q(status=StockReservation.STATUS_HELD)
+            | Q(status=StockReservation.STATUS_COMMITTED, reconciled=False),
+            product_id__in=product_ids,
+        )
+        .values('product_id')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+    )
+    return {row['product_id']: row['units'] for row in rows}
+
+
+def availability(product_ids):
+    """
+    Units that can still be reserved, as ``{product_id: units}``.
+    """
+    stock = dict(
+        Product.all_objects.filter(pk__in=product_ids).values_list(
+            'pk', 'stock_quantity'
+        )
+    )
+    taken = claimed(list(stock))
+    return {pk: max(0, quantity - taken.get(pk, 0)) for pk, quantity in stock.items()}
+
+
+def _shards_with(product_id, quantity):
+    """
+    Indexes of the product's shards holding at least ``quantity``, shuffled.
+    """
+    indexes = list(StockShard.objects.filter(
+        product_id=product_id, available__gte=quantity
+    ).values_list('index', flat=True))
+    random.shuffle(indexes)
+    return indexes
+
+
+def _debit(product_id, quantity, indexes):
+    """
+    Take ``quantity`` from the first of the shards ``indexes`` that still has it;
+    returns whether one did.
+    """
+    for index in indexes:
+        if StockShard.objects.filter(
+            product_id=product_id, index=index, available__gte=quantity
+        ).update(available=F('available') - quantity):
+            return True
+    return False
+
+
+def _credit(product_id, quantity):
+    # A shard missing after INVENTORY_SHARDS grew leaves the units
+    # unlisted until the next rebalance
+    StockShard.objects.filter(
+        product_id=product_id, index=random.randrange(settings.INVENTORY_SHARDS)
+    ).update(available=F('available') + quantity)
+
+
+def _spread(units, count):
+    """
+    ``units`` split over ``count`` shards, leaving shards empty rather than thinner than
+    ``SHARD_MIN_UNITS``.
+    """
+    filled = max(1, min(count, units // SHARD_MIN_UNITS))
+    share, rest = divmod(units, filled)
+    return [share + (index < rest) for index in range(filled)] + [0] * (count - filled)
+
+
+def rebalance(product_id, take=0, create=False):
+    """
+    Recompute a product's shards from its stock and reservations, after setting aside
+    ``take`` units.
+
+    Returns the units left, or ``None`` when the product has no shards (and
+    ``create`` is false). Raises ``InsufficientStock`` if fewer than
+    ``take`` units are left. Whatever uses the units set aside belongs in
+    the same transaction as this call.
+    """
+    count = settings.INVENTORY_SHARDS
+    with transaction.atomic():
+        if create:
+            StockShard.objects.bulk_create(
+                [
+                    StockShard(product_id=product_id, index=index)
+                    for index in range(count)
+                ],
+                ignore_conflicts=True,
+            )
+        shards = list(
+            StockShard.objects.select_for_update()
+            .filter(product_id=product_id)
+            .order_by('index')
+        )
+        if not shards:
+            return None
+
+        stock = (
+            Product.all_objects.filter(pk=product_id)
+            .values_list('stock_quantity', flat=True)
+            .first()
+            or 0
+        )
+        left = stock - claimed([product_id]).get(product_id, 0) - take
+        if left < 0 and take:
+            raise InsufficientStock(f'Only {left + take} left')
+        amounts = _spread(max(left, 0), count)
+        for shard in shards:
+            # Shards beyond INVENTORY_SHARDS, if it shrank, are emptied
+            shard.available = amounts[shard.index] if shard.index < count else 0
+        StockShard.objects.bulk_update(shards, ['available'])
+    return left
+
+
+def set_stock(product, quantity):
+    """
+    Set ``product``'s stock count, e.g. after a delivery, and recompute its shards.
+
+    Only ``stock_quantity`` is written, so other fields of a copy read
+    earlier are not put back. The save signal rebalances the shards in the
+    same transaction.
+    """
+    with transaction.atomic():
+        product.stock_quantity = quantity
+        product.save(update_fields=['stock_quantity', 'updated_at'])
+    return product
+
+
+def reserve(user, product_id, quantity, key, now=None):
+    """
+    Hold ``quantity`` units of a product for ``user``; returns ``(reservation,
+    created)``.
+
+    A retry with the same ``key`` returns the reservation the first call
+    made, or raises ``ReservationConflict`` if it asked for something else.
+    """
+    now = now or timezone.now()
+    reservation = StockReservation(
+        user=user, product_id=product_id, quantity=quantity, key=key,
+        expires_at=now + timedelta(seconds=settings.INVENTORY_HOLD_SECONDS),
+    )
+    # Read before the transaction: a sold-out product costs one SELECT and no
+    # write. SQLite also cannot upgrade a read transaction to a write one
+    # while another writer is active.
+    indexes = _shards_with(product_id, quantity)
+    try:
+        with transaction.atomic():
+            if _debit(product_id, quantity, indexes):
+                reservation.save()
+                return reservation, True
+    except IntegrityError:
+        # Same key as an earlier reservation; the debit was rolled back with the insert
+        return _existing(user, product_id, quantity, key), False
+
+    # No single shard had enough: expired holds may still sit on units,
+    # or the shards are fragmented, missing or empty. One caller per
+    # product per interval recomputes them.
+    lock = f'inventory_{product_id}_rebalance'
+    if not cache.add(lock, True, REBALANCE_INTERVAL) and (
+        StockShard.objects.filter(product_id=product_id).exists()
+    ):
+        raise InsufficientStock('Not enough stock left')
+    if StockReservation.objects.filter(user=user, key=key).exists():
+        # A retry of a reservation that already took the last units
+        return _existing(user, product_id, quantity, key), False
+    expire_holds(now=now, product_id=product_id)
+    logger.debug(f'Rebalancing stock shards of product {product_id}')
+    try:
+        with transaction.atomic():
+            rebalance(product_id, take=quantity, create=True)
+            reservation.save()
+    except IntegrityError:
+        return _existing(user, product_id, quantity, key), False
+    return reservation, True
+
+
+def _existing(user, product_id, quantity, key):
+    reservation = StockReservation.objects.get(user=user, key=key)
+    if reservation.product_id != product_id or reservation.quantity != quantity:
+        raise ReservationConflict(
+            'Idempotency key was already used for a different reservation'
+        )
+    return reservation
+
+
+def commit(reservation, now=None):
+    """
+    Turn a live hold into a sale; committing twice is a no-op.
+    """
+    now = now or timezone.now()
+    committed = StockReservation.objects.filter(
+        pk=reservation.pk, status=StockReservation.STATUS_HELD, expires_at__gt=now
+    ).update(status=StockReservation.STATUS_COMMITTED, updated_at=now)
+    reservation.refresh_from_db()
+    if committed:
+        popularity.record(
+            'product', reservation.product_id, 'sale', reservation.quantity
+        )
+    elif reservation.status == StockReservation.STATUS_HELD:
+        # Lapsed, and not swept yet
+        raise ReservationConflict('Reservation is expired')
+    elif reservation.status != StockReservation.STATUS_COMMITTED:
+        raise ReservationConflict(f'Reservation is {reservation.status}')
+    return reservation
+
+
+def release(reservation, now=None):
+    """
+    Give a hold's units back; releasing twice, or after expiry, is a no-op.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        released = StockReservation.objects.filter(
+            pk=reservation.pk, status=StockReservation.STATUS_HELD
+        ).update(status=StockReservation.STATUS_RELEASED, updated_at=now)
+        if released:
+            _credit(reservation.product_id, reservation.quantity)
+    reservation.refresh_from_db()
+    if reservation.status == StockReservation.STATUS_COMMITTED:
+        raise ReservationConflict('Reservation is committed')
+    return reservation
+
+
+def expire_holds(now=None, product_id=None, batch_size=BATCH_SIZE):
+    """
+    Expire lapsed holds and give their units back; returns how many expired.
+    """
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            lapsed = StockReservation.objects.filter(
+                status=StockReservation.STATUS_HELD, expires_at__lte=now
+            )
+            if product_id is not None:
+                lapsed = lapsed.filter(product_id=product_id)
+            # Holds being committed or released right now are left to the next sweep
+            rows = list(
+                lapsed.select_for_update(skip_locked=True).values_list(
+                    'pk', 'product_id', 'quantity'
+                )[:batch_size]
+            )
+            if not rows:
+                return expired
+            StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(
+                status=StockReservation.STATUS_EXPIRED, updated_at=now
+            )
+            units = Counter()
+            for _, held_product_id, quantity in rows:
+                units[held_product_id] += quantity
+            for held_product_id in sorted(units):
+                _credit(held_product_id, units[held_product_id])
+        expired += len(rows)
+
+
+def reconcile(batch_size=BATCH_SIZE):
+    """
+    Take committed units off ``Product.stock_quantity``; returns the number of products
+    updated.
+
+    Each product row is written once per batch instead of once per sale.
+    What can be reserved does not change: the units move from "sold, not
+    reconciled" to gone from stock.
+    """
+    updated = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                StockReservation.objects.filter(
+                    status=StockReservation.STATUS_COMMITTED, reconciled=False
+                )
+                .select_for_update(skip_locked=True)
+                .values_list('pk', 'product_id', 'quantity')[:batch_size]
+            )
+            if not rows:
+                return updated
+            StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(
+                reconciled=True
+            )
+            sold = Counter()
+            for _, product_id, quantity in rows:
+                sold[product_id] += quantity
+
+            product_ids = sorted(sold)
+            Product.all_objects.filter(pk__in=product_ids).update(
+                stock_quantity=Greatest(
+                    F('stock_quantity')
+                    - Case(
+                        *[
+                            When(pk=product_id, then=Value(sold[product_id]))
+                            for product_id in product_ids
+                        ],
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    ),
+                    Value(0),
+                ),
+                # Moves list fragments and the change feed along
+                updated_at=timezone.now(),
+            )
+            updates = [
+                push.product_update(product, ['stock_quantity'])
+                for product in Product.all_objects.filter(pk__in=product_ids).only(
+                    'id', 'category_id', 'stock_quantity'
+                )
+            ]
+            transaction.on_commit(lambda updates=updates: push.publish(updates))
+        updated += len(product_ids)
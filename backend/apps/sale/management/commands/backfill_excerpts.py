@@ -0,0 +1,40 @@
+"""
+Recompute the stored excerpts served by list endpoints.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.sale import excerpts
+from apps.sale.models import News, Product, Promotion
+
+MODELS = {
+    'product': Product,
+    'news': News,
+    'promotion': Promotion,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Backfill Product, News and Promotion excerpts, '
+        'e.g. after a migration or a bulk import.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(MODELS), action='append',
+                            help='Only backfill this model (repeatable; default: all).')
+        parser.add_argument(
+            '--batch-size', type=int, default=excerpts.BACKFILL_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        for name in options['model'] or MODELS:
+            started = time.monotonic()
+            changed = excerpts.backfill(MODELS[name], batch_size=options['batch_size'])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{name}: updated {changed} excerpts '
+                    f'in {time.monotonic() - started:.1f}s'
+                )
+            )
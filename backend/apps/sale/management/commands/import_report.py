@@ -0,0 +1,174 @@
+"""
+Report what each process role imports at boot and how long it takes.
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myproject import boot
+
+BASELINE_PATH = settings.BASE_DIR / 'benchmarks' / 'baselines' / 'imports.json'
+
+# Run in a fresh interpreter per role, as the role's entry point would
+SCRIPT = (
+    'import django; django.setup(); from myproject import boot; '
+    'boot.import_role({role!r})'
+)
+
+
+def measure(role):
+    """
+    ``{'total_ms', 'modules', 'packages': {top-level package: ms}}`` from one ``-X
+    importtime`` run.
+    """
+    env = {**os.environ, 'PROCESS_ROLE': role, 'BOOT_WARMUP': 'False'}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', SCRIPT.format(role=role)],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode:
+        raise CommandError(
+            f'Importing the {role} role failed:\n{result.stderr[-2000:]}'
+        )
+
+    packages = defaultdict(int)
+    modules = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        packages[name.strip().split('.')[0]] += int(self_us)
+        modules += 1
+    return {
+        'total_ms': round(sum(packages.values()) / 1000, 1),
+        'modules': modules,
+        'packages': {name: round(us / 1000, 1) for name, us in packages.items()},
+    }
+
+
+def fastest(runs):
+    """
+    Per-value minimum over several ``measure`` results, which filters out scheduler
+    noise.
+    """
+    names = set().union(*(run['packages'] for run in runs))
+    return {
+        'total_ms': min(run['total_ms'] for run in runs),
+        'modules': min(run['modules'] for run in runs),
+        'packages': {
+            name: min(run['packages'].get(name, 0) for run in runs)
+            for name in sorted(names)
+        },
+    }
+
+
+def regressions(current, baseline):
+    """
+    What got worse in ``current`` than in ``baseline``, as messages.
+
+    Module counts and packages are the same on every machine, so they are
+    safe to fail on wherever the baseline was recorded.
+    """
+    problems = []
+    if current['modules'] > baseline['modules']:
+        problems.append(
+            f'{current["modules"] - baseline["modules"]} more modules than the baseline'
+        )
+    added = sorted(set(current['packages']) - set(baseline['packages']))
+    if added:
+        problems.append(f'new top-level packages: {", ".join(added)}')
+    return problems
+
+
+def slowdown(current, baseline, tolerance):
+    """
+    A message if ``current`` imports slower than ``baseline`` allows, else ``None``.
+
+    Wall-clock time only compares between runs on the same machine.
+    """
+    limit = baseline['total_ms'] * (1 + tolerance)
+    if current['total_ms'] > limit:
+        return (f'import time {current["total_ms"]}ms is over {limit:.1f}ms '
+                f'(baseline {baseline["total_ms"]}ms + {tolerance:.0%})')
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure boot imports per process role (web, worker, beat) '
+        'with python -X importtime and fail on new modules or packages '
+        'against benchmarks/baselines/imports.json.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--role', choices=boot.ROLES, action='append',
+                            help='Only report this role (repeatable; default: all).')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Interpreter runs per role; the fastest is kept.')
+        parser.add_argument(
+            '--top', type=int, default=15, help='Packages listed per role.'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Import time growth over the baseline worth reporting, as a fraction.',
+        )
+        parser.add_argument(
+            '--fail-on-time',
+            action='store_true',
+            help='Fail on import time growth too '
+            '(only against a baseline from this machine).',
+        )
+        parser.add_argument(
+            '--update-baseline',
+            action='store_true',
+            help='Store these results as the new baseline instead of comparing.',
+        )
+
+    def handle(self, *args, **options):
+        baseline = {}
+        if BASELINE_PATH.exists():
+            baseline = json.loads(BASELINE_PATH.read_text())
+
+        problems = []
+        for role in options['role'] or boot.ROLES:
+            current = fastest([measure(role) for _ in range(max(1, options['repeat']))])
+            self.stdout.write(
+                f'{role}: {current["total_ms"]}ms, {current["modules"]} modules'
+            )
+            top = sorted(current['packages'].items(), key=lambda item: -item[1])[
+                : options['top']
+            ]
+            for name, ms in top:
+                self.stdout.write(f'  {name:<32} {ms:>8.1f}ms')
+
+            if options['update_baseline']:
+                baseline[role] = current
+            elif role in baseline:
+                for problem in regressions(current, baseline[role]):
+                    problems.append(f'{role}: {problem}')
+                slower = slowdown(current, baseline[role], options['tolerance'])
+                if slower and options['fail_on_time']:
+                    problems.append(f'{role}: {slower}')
+                elif slower:
+                    self.stdout.write(
+                        self.style.WARNING(f'  {slower} (advisory, see --fail-on-time)')
+                    )
+
+        if options['update_baseline']:
+            BASELINE_PATH.write_text(
+                json.dumps(baseline, indent=2, sort_keys=True) + '\n'
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f'Baseline written to {BASELINE_PATH}')
+            )
+        elif problems:
+            raise CommandError('Import regressions:\n' + '\n'.join(problems))
+        else:
+            self.stdout.write(self.style.SUCCESS('No import regressions'))
@@ -0,0 +1,419 @@
+"""
+Generate a large synthetic catalog for load testing.
+"""
+import math
+import multiprocessing
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from apps.sale import pricing
+from apps.sale.excerpts import make_excerpt
+from apps.sale.models import (
+    Role, User, Category, Product, ProductImage,
+    Promotion, Comment, PromotionProduct
+)
+
+ADJECTIVES = [
+    'classic', 'compact', 'deluxe', 'eco', 'essential', 'heavy-duty', 'lightweight',
+    'modern', 'organic', 'portable', 'premium', 'rugged', 'slim', 'smart', 'vintage',
+]
+MATERIALS = [
+    'bamboo', 'canvas', 'ceramic', 'cotton', 'glass', 'leather', 'linen', 'maple',
+    'nylon', 'oak', 'steel', 'titanium', 'walnut', 'wool',
+]
+NOUNS = [
+    'backpack', 'blender', 'bottle', 'chair', 'desk', 'headphones', 'jacket', 'kettle',
+    'lamp', 'mug', 'notebook', 'pan', 'rug', 'sneakers', 'speaker', 'tent', 'watch',
+]
+DEPARTMENTS = [
+    'Home', 'Kitchen', 'Outdoor', 'Fashion', 'Electronics', 'Sports', 'Office',
+    'Garden', 'Toys', 'Beauty', 'Automotive', 'Books',
+]
+REVIEW_WORDS = [
+    'great', 'quality', 'fast', 'shipping', 'would', 'buy', 'again', 'broke', 'after',
+    'week', 'exactly', 'as', 'described', 'love', 'it', 'small', 'price', 'value',
+]
+
+
+def _rng(seed, stream, index=0):
+    """Independent, reproducible random stream per phase and chunk."""
+    return random.Random(f'{seed}:{stream}:{index}')
+
+
+def _next_id(model):
+    return (model._base_manager.aggregate(value=Max('id'))['value'] or 0) + 1
+
+
+def zipf_counts(total, n, s, rng):
+    """
+    Split ``total`` items over ``n`` owners following Zipf's law.
+
+    Owner ranks are shuffled so popularity does not follow insertion order.
+    Shares are rounded by largest remainder, so the counts add up to ``total``.
+    """
+    if n == 0:
+        return []
+    harmonic = sum(1 / (rank ** s) for rank in range(1, n + 1))
+    shares = [total / (rank ** s) / harmonic for rank in range(1, n + 1)]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(n), key=lambda i: (counts[i] - shares[i], i))
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    rng.shuffle(counts)
+    return counts
+
+
+def _bulk(model, objs, batch_size):
+    model.objects.bulk_create(objs, batch_size=batch_size)
+    return len(objs)
+
+
+def _seed_products(job):
+    """
+    Insert one chunk of products together with their images and comments.
+
+    Runs in the parent process or in a forked worker; everything it needs
+    is in ``job`` so the output only depends on the seed and chunk index.
+    """
+    rng = _rng(job['seed'], 'products', job['index'])
+    batch_size = job['batch_size']
+    prefix = job['prefix']
+    user_ids = range(job['first_user'], job['first_user'] + job['users'])
+    categories = job['leaf_categories']
+
+    products = []
+    images = []
+    comments = []
+    image_id = job['first_image']
+    comment_id = job['first_comment']
+    for offset, comment_count in enumerate(job['comment_counts']):
+        number = job['start'] + offset
+        product_id = job['first_product'] + number
+        words = (rng.choice(ADJECTIVES), rng.choice(MATERIALS), rng.choice(NOUNS))
+        name = ' '.join(words).title()
+        price = max(Decimal('0.01'), round(Decimal(rng.lognormvariate(3.4, 0.9)), 2))
+        description = ' '.join(
+            rng.choice(REVIEW_WORDS) for _ in range(rng.randint(10, 80))
+        )
+        products.append(Product(
+            id=product_id,
+            name=name,
+            slug=f'{slugify(name)}-{prefix}-{number:x}',
+            description=description,
+            # bulk_create skips save(), which maintains the excerpt
+            excerpt=make_excerpt(description),
+            price=price,
+            category_id=rng.choice(categories),
+            created_by_id=rng.choice(user_ids),
+            stock_quantity=int(rng.expovariate(1 / 80)),
+            sku=f'{prefix.upper()}-{number:09d}',
+            is_active=rng.random() > 0.05,
+            comment_count=comment_count,
+        ))
+        for position in range(rng.choice((0, 1, 1, 2, 3, 4))):
+            images.append(ProductImage(
+                id=image_id,
+                product_id=product_id,
+                image_url=f'products/{prefix}/{number:x}-{position}.jpg',
+                created_by_id=products[-1].created_by_id,
+            ))
+            image_id += 1
+        for _ in range(comment_count):
+            user_id = rng.choice(user_ids)
+            comments.append(
+                Comment(
+                    id=comment_id,
+                    user_id=user_id,
+                    target_type='product',
+                    target_id=product_id,
+                    rating=min(5, max(1, round(rng.gauss(4, 1.1)))),
+                    comment=' '.join(
+                        rng.choice(REVIEW_WORDS) for _ in range(rng.randint(3, 30))
+                    ),
+                    created_by_id=user_id,
+                )
+            )
+            comment_id += 1
+
+    counts = (
+        _bulk(Product, products, batch_size),
+        _bulk(ProductImage, images, batch_size),
+        _bulk(Comment, comments, batch_size),
+    )
+    return counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic catalog (nested categories, products, images, '
+        'Zipf-distributed comments and overlapping promotions) with bulk inserts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--products', type=int, default=10000, help='Number of products'
+        )
+        parser.add_argument(
+            '--categories',
+            type=int,
+            default=None,
+            help='Number of categories (default: products / 200, at least 20)',
+        )
+        parser.add_argument(
+            '--depth', type=int, default=6, help='Depth of the category tree'
+        )
+        parser.add_argument(
+            '--users', type=int, default=500, help='Number of reviewer accounts'
+        )
+        parser.add_argument('--comments', type=int, default=None,
+                            help='Total comments (default: 3 per product)')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Zipf exponent for comments per product')
+        parser.add_argument(
+            '--promotions',
+            type=int,
+            default=None,
+            help='Number of promotions (default: products / 1000, at least 10)',
+        )
+        parser.add_argument('--products-per-promotion', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--chunk-size', type=int, default=50000,
+                            help='Products generated per unit of work')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Worker processes for product chunks (not supported on SQLite)',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default=None,
+                            help='Token embedded in slugs and SKUs (default: s<seed>)')
+
+    def handle(self, *args, **options):
+        seed = options['seed']
+        product_total = options['products']
+        prefix = slugify(options['prefix'] or f's{seed}')
+        if options['users'] < 1:
+            raise CommandError('--users must be at least 1')
+        if options['depth'] < 2:
+            raise CommandError('--depth must be at least 2')
+        batch_size = options['batch_size']
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(
+                self.style.WARNING('SQLite allows a single writer; using --workers 1')
+            )
+            workers = 1
+
+        # One query instead of a uniqueness check per generated slug/SKU
+        if Product.all_objects.filter(sku__startswith=f'{prefix.upper()}-').exists():
+            raise CommandError(
+                f"Catalog with prefix '{prefix}' already exists; "
+                "pass a different --prefix"
+            )
+
+        started = time.monotonic()
+        rng = _rng(seed, 'catalog')
+        today = timezone.now().date()
+
+        role, _ = Role.objects.get_or_create(name='customer')
+        first_user = _next_id(User)
+        password = make_password(None)
+        _bulk(User, [
+            User(
+                id=first_user + i,
+                username=f'{prefix}-user-{i}',
+                email=f'{prefix}-user-{i}@example.com',
+                password=password,
+                role=role,
+            )
+            for i in range(options['users'])
+        ], batch_size)
+        self._report('users', options['users'], started)
+
+        categories = self._seed_categories(
+            options['categories'] or max(20, product_total // 200),
+            options['depth'], prefix, first_user, rng, batch_size,
+        )
+        self._report('categories', len(categories), started)
+        leaf_categories = [
+            category_id for category_id, level in categories if level > 0
+        ]
+        leaf_categories = leaf_categories or [
+            category_id for category_id, _ in categories
+        ]
+
+        comment_total = (
+            options['comments']
+            if options['comments'] is not None
+            else product_total * 3
+        )
+        comment_counts = zipf_counts(comment_total, product_total, options['zipf'], rng)
+
+        first_product = _next_id(Product)
+        first_image = _next_id(ProductImage)
+        first_comment = _next_id(Comment)
+        chunk_size = options['chunk_size']
+        jobs = []
+        for index, start in enumerate(range(0, product_total, chunk_size)):
+            counts = comment_counts[start:start + chunk_size]
+            jobs.append({
+                'seed': seed,
+                'index': index,
+                'prefix': prefix,
+                'start': start,
+                'comment_counts': counts,
+                'batch_size': batch_size,
+                'first_user': first_user,
+                'users': options['users'],
+                'leaf_categories': leaf_categories,
+                'first_product': first_product,
+                # Each chunk owns a disjoint id range, so workers never collide
+                'first_image': first_image + start * 4,
+                'first_comment': first_comment + sum(comment_counts[:start]),
+            })
+
+        totals = [0, 0, 0]
+        if workers > 1:
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                for counts in pool.imap_unordered(_seed_products, jobs):
+                    totals = [a + b for a, b in zip(totals, counts)]
+                    self._report('products', totals[0], started)
+        else:
+            for job in jobs:
+                counts = _seed_products(job)
+                totals = [a + b for a, b in zip(totals, counts)]
+                self._report('products', totals[0], started)
+        self._report('product images', totals[1], started)
+        self._report('comments', totals[2], started)
+
+        links = self._seed_promotions(
+            options['promotions'] or max(10, product_total // 1000),
+            options['products_per_promotion'], prefix, today, rng,
+            first_user, options['users'], first_product, product_total, batch_size,
+        )
+        self._report('promotion products', links, started)
+        self._report('effective prices', pricing.rebuild(today), started)
+
+        self._reset_sequences()
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {product_total} products in {time.monotonic() - started:.1f}s'
+        ))
+
+    def _seed_categories(self, total, depth, prefix, owner_id, rng, batch_size):
+        """
+        Build a category forest ``depth`` levels deep.
+
+        Roots are departments; the remaining categories are spread over the
+        lower levels, each attached to a random node of the level above.
+        """
+        first_id = _next_id(Category)
+        roots = min(len(DEPARTMENTS), max(1, total // 10))
+        per_level = max(1, math.ceil((total - roots) / max(1, depth - 1)))
+        objs = []
+        levels = [[]]
+        for i in range(roots):
+            objs.append(Category(
+                id=first_id + i,
+                name=DEPARTMENTS[i],
+                slug=f'{slugify(DEPARTMENTS[i])}-{prefix}',
+                created_by_id=owner_id,
+            ))
+            levels[0].append(first_id + i)
+
+        for i in range(roots, total):
+            level = min(depth - 1, 1 + (i - roots) // per_level)
+            if level == len(levels):
+                levels.append([])
+            name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}s'.title()
+            objs.append(Category(
+                id=first_id + i,
+                name=name,
+                slug=f'{slugify(name)}-{prefix}-{i:x}',
+                parent_id=rng.choice(levels[level - 1]),
+                created_by_id=owner_id,
+            ))
+            levels[level].append(first_id + i)
+
+        # Parents always precede children, so ordered batches satisfy FKs
+        _bulk(Category, objs, batch_size)
+        return [
+            (category_id, level)
+            for level, ids in enumerate(levels)
+            for category_id in ids
+        ]
+
+    def _seed_promotions(self, total, per_promotion, prefix, today, rng,
+                         first_user, users, first_product, product_total, batch_size):
+        """
+        Create promotions with overlapping windows around today.
+        """
+        first_id = _next_id(Promotion)
+        promotions = []
+        for i in range(total):
+            start = today + timedelta(days=rng.randint(-90, 30))
+            title = f'{rng.choice(ADJECTIVES).title()} {rng.choice(DEPARTMENTS)} Sale'
+            discount = rng.choice((10, 20, 30, 50))
+            description = f'{discount}% off selected items.'
+            promotions.append(
+                Promotion(
+                    id=first_id + i,
+                    title=title,
+                    slug=f'{slugify(title)}-{prefix}-{i:x}',
+                    description=description,
+                    excerpt=make_excerpt(description),
+                    start_date=start,
+                    end_date=start
+                    + timedelta(days=max(1, int(rng.lognormvariate(2.3, 0.8)))),
+                    discount_type=Promotion.DISCOUNT_PERCENT,
+                    discount_value=discount,
+                    created_by_id=first_user,
+                )
+            )
+        _bulk(Promotion, promotions, batch_size)
+
+        links = 0
+        product_ids = range(first_product, first_product + product_total)
+        for promotion in promotions:
+            sample = rng.sample(product_ids, min(per_promotion, product_total))
+            links += _bulk(PromotionProduct, [
+                PromotionProduct(
+                    promotion_id=promotion.id,
+                    product_id=product_id,
+                    created_by_id=first_user + rng.randrange(users),
+                )
+                for product_id in sample
+            ], batch_size)
+        return links
+
+    def _reset_sequences(self):
+        """Move id sequences past the explicitly assigned primary keys."""
+        models = [
+            User,
+            Category,
+            Product,
+            ProductImage,
+            Comment,
+            Promotion,
+            PromotionProduct,
+        ]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def _report(self, label, count, started):
+        self.stdout.write(
+            f'  {label:<20} {count:>10}  ({time.monotonic() - started:.1f}s)'
+        )
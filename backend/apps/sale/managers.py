@@ -0,0 +1,17 @@
+"""
+Managers for sale models.
+"""
+from django.db import models
+
+
+class LiveManager(models.Manager):
+    """
+    Default manager of soft-deletable models: rows with ``deleted_at`` set are hidden.
+
+    Use ``all_objects`` where deleted rows matter, e.g. change feeds and archival.
+    Forward relations (``product.category``) go through the base manager and
+    still reach deleted rows.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:25
+
+import apps.sale.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sale', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('original', models.FileField(max_length=255, upload_to=apps.sale.models.image_asset_path)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(max_length=10)),
+                ('size', models.PositiveIntegerField()),
+            ],
+            options={
+                'db_table': 'sale_image_asset',
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_asset',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='sale.imageasset'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='asset',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='product_images', to='sale.imageasset'),
+        ),
+        migrations.CreateModel(
+            name='ImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(choices=[('avif', 'AVIF'), ('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=10)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('size', models.PositiveIntegerField()),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='sale.imageasset')),
+            ],
+            options={
+                'db_table': 'sale_image_variant',
+                'unique_together': {('asset', 'width', 'format')},
+            },
+        ),
+    ]
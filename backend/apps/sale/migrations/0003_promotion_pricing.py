@@ -0,0 +1,65 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:36
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sale', '0002_image_assets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPrice',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='effective', serialize=False, to='sale.product')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'sale_product_price',
+            },
+        ),
+        migrations.AddField(
+            model_name='promotion',
+            name='bundle_quantity',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(2)]),
+        ),
+        migrations.AddField(
+            model_name='promotion',
+            name='discount_type',
+            field=models.CharField(choices=[('percent', 'Percent off'), ('fixed', 'Fixed amount off'), ('bundle', 'Bundle price')], default='percent', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='promotion',
+            name='discount_value',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0'))]),
+        ),
+        migrations.AddField(
+            model_name='promotion',
+            name='priority',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='promotion',
+            name='stackable',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='promotion',
+            index=models.Index(fields=['start_date', 'end_date'], name='sale_promotion_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promotion',
+            index=models.Index(fields=['end_date'], name='sale_promotion_end_idx'),
+        ),
+        migrations.AddField(
+            model_name='productprice',
+            name='promotion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='sale.promotion'),
+        ),
+    ]
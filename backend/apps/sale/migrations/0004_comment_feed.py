@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_comment_counts(apps, schema_editor):
+    Comment = apps.get_model('sale', 'Comment')
+    for target_type, model_name in (('product', 'Product'), ('news', 'News')):
+        live = Comment.objects.filter(
+            target_type=target_type, target_id=OuterRef('pk'), deleted_at__isnull=True
+        ).order_by().values('target_id').annotate(total=Count('id')).values('total')
+        apps.get_model('sale', model_name).objects.update(comment_count=Coalesce(Subquery(live), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sale', '0003_promotion_pricing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['target_type', 'target_id', 'created_at'], name='sale_comment_target_idx'),
+        ),
+        migrations.RunPython(backfill_comment_counts, migrations.RunPython.noop),
+    ]
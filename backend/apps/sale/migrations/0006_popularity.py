@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sale', '0005_product_range_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='popularity',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='view_count',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='popularity',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='view_count',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['-popularity'], name='sale_news_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-popularity'], name='sale_product_popular_idx'),
+        ),
+    ]
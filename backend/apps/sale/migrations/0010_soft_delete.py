@@ -0,0 +1,81 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:13
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sale', '0009_excerpts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('deleted_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'sale_archived_row',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='news',
+            name='sale_news_popular_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='sale_product_popular_idx',
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='sale_category_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='sale_comment_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['-popularity'], name='sale_news_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='sale_news_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['-popularity'], name='sale_product_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['category', 'id'], name='sale_product_live_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='sale_product_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='sale_product_image_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promotion',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='sale_promotion_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promotionproduct',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='sale_promo_product_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedrow',
+            index=models.Index(fields=['model', 'object_id'], name='sale_archived_row_object_idx'),
+        ),
+    ]
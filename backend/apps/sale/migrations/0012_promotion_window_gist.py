@@ -0,0 +1,28 @@
+from django.db import migrations
+
+INDEX = 'sale_promotion_window_gist'
+
+
+def create_window_index(apps, schema_editor):
+    # Interval index for pricing.active_links; other databases keep the B-tree window indexes
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {INDEX} ON sale_promotion "
+            f"USING gist (daterange(start_date, end_date, '[]'))"
+        )
+
+
+def drop_window_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sale', '0011_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_window_index, drop_window_index),
+    ]
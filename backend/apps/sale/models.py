@@ -2,12 +2,17 @@
 Sale models for the application.
 """
 from decimal import Decimal
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Q
 from django.core.validators import MinValueValidator
 from django.utils.text import slugify
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
+from .excerpts import EXCERPT_LENGTH, make_excerpt
+from .managers import LiveManager
+
 
 class TimeStampedModel(models.Model):
     """
@@ -20,6 +25,33 @@ class TimeStampedModel(models.Model):
         abstract = True
 
 
+class ExcerptModel(models.Model):
+    """
+    Abstract base model that stores a short plain-text excerpt of ``excerpt_source``.
+
+    List endpoints serve the excerpt and defer the full text column.
+    """
+    excerpt = models.CharField(
+        max_length=EXCERPT_LENGTH, blank=True, default='', editable=False
+    )
+
+    excerpt_source = None
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        # A deferred source was not loaded and so cannot have changed
+        if self.excerpt_source not in self.get_deferred_fields() and (
+            update_fields is None or self.excerpt_source in update_fields
+        ):
+            self.excerpt = make_excerpt(getattr(self, self.excerpt_source))
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'excerpt'}
+        super().save(*args, **kwargs)
+
+
 class Role(TimeStampedModel):
     """
     User role model.
@@ -57,21 +89,85 @@ class Category(TimeStampedModel):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_categories')
     updated_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='updated_categories')
     deleted_at = models.DateTimeField(null=True, blank=True)
-    
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
     class Meta:
         db_table = 'sale_category'
         verbose_name_plural = 'Categories'
-        
+        indexes = [
+            # Change feed keyset
+            models.Index(fields=['updated_at', 'id'], name='sale_category_changes_idx'),
+            # Archival scan; only ever holds the few rows awaiting it
+            models.Index(
+                fields=['deleted_at'],
+                name='sale_category_deleted_idx',
+                condition=Q(deleted_at__isnull=False),
+            ),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
-        
+
     def __str__(self):
         return self.name
 
 
-class Product(TimeStampedModel):
+def image_asset_path(instance, filename):
+    """Content-addressed storage path, e.g. images/originals/ab/abcdef....jpg."""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else 'bin'
+    return f'images/originals/{instance.sha256[:2]}/{instance.sha256}.{extension}'
+
+
+class ImageAsset(TimeStampedModel):
+    """
+    Deduplicated source image, keyed by the SHA-256 of its content.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    original = models.FileField(upload_to=image_asset_path, max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)
+    size = models.PositiveIntegerField()
+
+    class Meta:
+        db_table = 'sale_image_asset'
+
+    def __str__(self):
+        return self.sha256
+
+
+class ImageVariant(TimeStampedModel):
+    """
+    Resized and re-encoded rendition of an image asset.
+    """
+    FORMAT_CHOICES = [
+        ('avif', 'AVIF'),
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    ]
+
+    asset = models.ForeignKey(
+        ImageAsset, on_delete=models.CASCADE, related_name='variants'
+    )
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    file = models.FileField(max_length=255)
+    size = models.PositiveIntegerField()
+
+    class Meta:
+        db_table = 'sale_image_variant'
+        unique_together = ['asset', 'width', 'format']
+
+    def __str__(self):
+        return f"{self.asset.sha256} {self.width}w {self.format}"
+
+
+class Product(ExcerptModel, TimeStampedModel):
     """
     Product model.
     """
@@ -91,18 +187,80 @@ class Product(TimeStampedModel):
     sku = models.CharField(max_length=50, unique=True)
     is_active = models.BooleanField(default=True)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    image_asset = models.ForeignKey(
+        ImageAsset,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='products',
+    )
+    comment_count = models.PositiveIntegerField(default=0)
+    # Maintained in batches by ``popularity.flush``
+    view_count = models.PositiveBigIntegerField(default=0)
+    popularity = models.FloatField(default=0)
+
+    excerpt_source = 'description'
+
+    objects = LiveManager()
+    all_objects = models.Manager()
 
     class Meta:
         db_table = 'sale_product'
+        indexes = [
+            # Range filters on the listing
+            models.Index(fields=['price'], name='sale_product_price_idx'),
+            models.Index(fields=['created_at'], name='sale_product_created_idx'),
+            # ordering=popular, which only ever lists live rows
+            models.Index(
+                fields=['-popularity'],
+                name='sale_product_popular_idx',
+                condition=Q(deleted_at__isnull=True),
+            ),
+            # Category listings
+            models.Index(
+                fields=['category', 'id'],
+                name='sale_product_live_category_idx',
+                condition=Q(deleted_at__isnull=True),
+            ),
+            # Change feed keyset
+            models.Index(fields=['updated_at', 'id'], name='sale_product_changes_idx'),
+            # Archival scan
+            models.Index(
+                fields=['deleted_at'],
+                name='sale_product_deleted_idx',
+                condition=Q(deleted_at__isnull=False),
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so saves can tell which fields changed,
+        # e.g. to skip the pricing refresh
+        instance._loaded_values = dict(zip(field_names, values))
+        instance._loaded_price = instance._loaded_values.get('price')
+        return instance
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        if adding:
+            # A new product is on no promotion, so there is no price row to look up
+            self._state.fields_cache['effective'] = None
 
     def __str__(self):
         return f"{self.name} - {self.sku}"
 
+    @property
+    def effective_price(self):
+        """
+        Price after today's promotions, read from the precomputed ``ProductPrice`` row.
+        """
+        effective = getattr(self, 'effective', None)
+        return effective.price if effective is not None else self.price
+
 
 class ProductImage(TimeStampedModel):
     """
@@ -110,18 +268,33 @@ class ProductImage(TimeStampedModel):
     """
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image_url = models.CharField(max_length=255)
+    asset = models.ForeignKey(
+        ImageAsset,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='product_images',
+    )
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_product_images')
     updated_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='updated_product_images')
     deleted_at = models.DateTimeField(null=True, blank=True)
-    
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
     class Meta:
         db_table = 'sale_product_image'
-        
+        indexes = [
+            # Archival scan
+            models.Index(fields=['deleted_at'], name='sale_product_image_deleted_idx',
+                         condition=Q(deleted_at__isnull=False)),
+        ]
+
     def __str__(self):
         return f"Image for {self.product.name}"
 
 
-class News(TimeStampedModel):
+class News(ExcerptModel, TimeStampedModel):
     """
     News model.
     """
@@ -131,41 +304,111 @@ class News(TimeStampedModel):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_news')
     updated_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='updated_news')
     deleted_at = models.DateTimeField(null=True, blank=True)
-    
+    comment_count = models.PositiveIntegerField(default=0)
+    # Maintained in batches by ``popularity.flush``
+    view_count = models.PositiveBigIntegerField(default=0)
+    popularity = models.FloatField(default=0)
+
+    excerpt_source = 'content'
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
     class Meta:
         db_table = 'sale_news'
         verbose_name_plural = 'News'
-        
+        indexes = [
+            # ordering=popular, which only ever lists live rows
+            models.Index(
+                fields=['-popularity'],
+                name='sale_news_popular_idx',
+                condition=Q(deleted_at__isnull=True),
+            ),
+            # Change feed keyset
+            models.Index(fields=['updated_at', 'id'], name='sale_news_changes_idx'),
+            # Archival scan
+            models.Index(
+                fields=['deleted_at'],
+                name='sale_news_deleted_idx',
+                condition=Q(deleted_at__isnull=False),
+            ),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
         super().save(*args, **kwargs)
-        
+
     def __str__(self):
         return self.title
 
 
-class Promotion(TimeStampedModel):
+class Promotion(ExcerptModel, TimeStampedModel):
     """
     Promotion model.
     """
+    DISCOUNT_PERCENT = 'percent'
+    DISCOUNT_FIXED = 'fixed'
+    DISCOUNT_BUNDLE = 'bundle'
+    DISCOUNT_TYPE_CHOICES = [
+        (DISCOUNT_PERCENT, 'Percent off'),
+        (DISCOUNT_FIXED, 'Fixed amount off'),
+        (DISCOUNT_BUNDLE, 'Bundle price'),
+    ]
+
     title = models.CharField(max_length=255)
     slug = models.SlugField(max_length=255, unique=True)
     description = models.TextField(blank=True, null=True)
     start_date = models.DateField()
     end_date = models.DateField()
+    discount_type = models.CharField(
+        max_length=10, choices=DISCOUNT_TYPE_CHOICES, default=DISCOUNT_PERCENT
+    )
+    discount_value = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal('0'),
+        validators=[MinValueValidator(Decimal('0'))]
+    )
+    bundle_quantity = models.PositiveSmallIntegerField(
+        blank=True, null=True, validators=[MinValueValidator(2)]
+    )
+    priority = models.IntegerField(default=0)
+    stackable = models.BooleanField(default=False)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_promotions')
     updated_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='updated_promotions')
     deleted_at = models.DateTimeField(null=True, blank=True)
-    
+
+    excerpt_source = 'description'
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
     class Meta:
         db_table = 'sale_promotion'
-        
+        indexes = [
+            # Active-window lookups and the daily start/end boundary scans
+            models.Index(
+                fields=['start_date', 'end_date'], name='sale_promotion_window_idx'
+            ),
+            models.Index(fields=['end_date'], name='sale_promotion_end_idx'),
+            # Change feed keyset
+            models.Index(
+                fields=['updated_at', 'id'], name='sale_promotion_changes_idx'
+            ),
+            # Archival scan
+            models.Index(
+                fields=['deleted_at'],
+                name='sale_promotion_deleted_idx',
+                condition=Q(deleted_at__isnull=False),
+            ),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
         super().save(*args, **kwargs)
-        
+
     def __str__(self):
         return self.title
 
@@ -178,7 +421,7 @@ class Comment(TimeStampedModel):
         ('product', 'Product'),
         ('news', 'News'),
     ]
-    
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
     target_type = models.CharField(max_length=10, choices=TARGET_TYPE_CHOICES)
     target_id = models.BigIntegerField()
@@ -187,10 +430,37 @@ class Comment(TimeStampedModel):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_comments')
     updated_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='updated_comments')
     deleted_at = models.DateTimeField(null=True, blank=True)
-    
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
     class Meta:
         db_table = 'sale_comment'
-        
+        indexes = [
+            models.Index(
+                fields=['target_type', 'target_id', 'created_at'],
+                name='sale_comment_target_idx',
+            ),
+            # Archival scan
+            models.Index(
+                fields=['deleted_at'],
+                name='sale_comment_deleted_idx',
+                condition=Q(deleted_at__isnull=False),
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so updates can move the target's comment_count correctly
+        loaded = dict(zip(field_names, values))
+        instance._loaded_target = (
+            loaded.get('target_type'),
+            loaded.get('target_id'),
+            loaded.get('deleted_at') is None,
+        )
+        return instance
+
     def __str__(self):
         return f"Comment by {self.user.username} on {self.target_type}"
 
@@ -204,10 +474,209 @@ class PromotionProduct(TimeStampedModel):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_promotion_products')
     updated_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='updated_promotion_products')
     deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
     
     class Meta:
         db_table = 'sale_promotion_product'
         unique_together = ['promotion', 'product']
+        indexes = [
+            # Archival scan
+            models.Index(fields=['deleted_at'], name='sale_promo_product_deleted_idx',
+                         condition=Q(deleted_at__isnull=False)),
+        ]
         
     def __str__(self):
-        return f"{self.promotion.title} - {self.product.name}" 
\ No newline at end of file
+        return f"{self.promotion.title} - {self.product.name}"
+
+
+class ProductPrice(models.Model):
+    """
+    Precomputed promotional price of a product.
+
+    Only products with at least one active promotion have a row; everything
+    else sells at ``Product.price``. Rows are maintained by
+    ``apps.sale.pricing.refresh``.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='effective'
+    )
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    promotion = models.ForeignKey(
+        Promotion, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'sale_product_price'
+
+    def __str__(self):
+        return f"{self.product_id}: {self.price}"
+
+
+class Tombstone(models.Model):
+    """
+    Marker of a hard-deleted row for the change feeds in ``apps.sale.changes``.
+    """
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'sale_tombstone'
+        indexes = [
+            models.Index(
+                fields=['model', 'deleted_at', 'id'], name='sale_tombstone_feed_idx'
+            ),
+            models.Index(fields=['deleted_at'], name='sale_tombstone_purge_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
+
+
+class RelatedProduct(models.Model):
+    """
+    Precomputed "customers also liked" neighbour of a product.
+
+    Rows are rebuilt in bulk by ``apps.sale.recommendations.build``; the
+    ``(product, rank)`` key serves a product's strip in order.
+    """
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='related_products',
+        db_index=False,
+    )
+    related = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='related_to'
+    )
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        db_table = 'sale_related_product'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'rank'], name='sale_related_product_rank_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.rank})"
+
+
+class ArchivedRow(models.Model):
+    """
+    A soft-deleted row moved out of its table by ``apps.sale.softdelete.archive``.
+
+    ``data`` holds the row's column values, so it can be inspected or restored by hand.
+    """
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    deleted_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'sale_archived_row'
+        indexes = [
+            models.Index(
+                fields=['model', 'object_id'], name='sale_archived_row_object_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
+
+
+class StockShard(models.Model):
+    """
+    One slice of a product's reservable stock.
+
+    Holds are taken from a random shard with a conditional UPDATE, so
+    concurrent checkouts of one product lock different rows instead of
+    queueing on one. Across a product's shards, ``available`` adds up to
+    ``stock_quantity`` minus held and not yet reconciled units; rows are
+    created and rebalanced by ``apps.sale.inventory``.
+    """
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='stock_shards', db_index=False
+    )
+    index = models.PositiveSmallIntegerField()
+    available = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'sale_stock_shard'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'index'], name='sale_stock_shard_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}/{self.index}: {self.available}"
+
+
+class StockReservation(TimeStampedModel):
+    """
+    Stock held for a checkout until it is committed, released or expires.
+
+    ``key`` is the client's idempotency key: retrying a reservation with the
+    same key returns the existing one. Committed units leave
+    ``Product.stock_quantity`` in batches, see ``apps.sale.inventory.reconcile``.
+    """
+    STATUS_HELD = 'held'
+    STATUS_COMMITTED = 'committed'
+    STATUS_RELEASED = 'released'
+    STATUS_EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (STATUS_HELD, 'Held'),
+        (STATUS_COMMITTED, 'Committed'),
+        (STATUS_RELEASED, 'Released'),
+        (STATUS_EXPIRED, 'Expired'),
+    ]
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='reservations'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stock_reservations',
+        db_index=False,
+    )
+    key = models.CharField(max_length=64)
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_HELD
+    )
+    expires_at = models.DateTimeField()
+    # Committed units already taken off Product.stock_quantity
+    reconciled = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = 'sale_stock_reservation'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'key'], name='sale_stock_reservation_key_uniq'
+            ),
+        ]
+        indexes = [
+            # Expiry sweep
+            models.Index(
+                fields=['expires_at'],
+                name='sale_stock_res_held_idx',
+                condition=Q(status='held'),
+            ),
+            # Reconciliation
+            models.Index(
+                fields=['product'],
+                name='sale_stock_res_unrec_idx',
+                condition=Q(status='committed', reconciled=False),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} ({self.status})"
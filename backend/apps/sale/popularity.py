@@ -0,0 +1,252 @@
+"""
+Buffered popularity counters for products and news.
+
+Views (and sales, once checkout records them) are added to a buffer instead
+of being written per request: a Redis hash when ``POPULARITY_REDIS_URL`` is
+set, otherwise a dict in the current process. ``flush`` drains the buffer
+into ``view_count`` and ``popularity`` with one UPDATE per batch of rows, and
+takes each batch off the buffer in the same transaction, so a flush that
+fails halfway does not count the written batches again. Celery beat flushes
+the Redis buffer. A local buffer is handed to the ``flush_popularity`` task
+by the process that filled it, at most every ``POPULARITY_FLUSH_INTERVAL``
+seconds, so requests never do the database work.
+
+Scores decay with a half-life of ``POPULARITY_HALF_LIFE_DAYS``. Instead of
+rewriting every row as time passes, each increment is scaled by
+``growth()``, which doubles every half-life, when it is stored. Rows then
+sort exactly as their decayed scores would, and ``decayed_score`` converts
+a stored score back to today's value.
+"""
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, PositiveBigIntegerField, Value, When
+from django.utils import timezone
+
+from .models import News, Product
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_TARGETS = {
+    'product': Product,
+    'news': News,
+}
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+BUFFER_KEY_PREFIX = 'popularity:'
+
+BATCH_SIZE = 500
+
+
+def growth(now=None):
+    """
+    Weight of an increment made at ``now`` relative to one made at ``EPOCH``.
+    """
+    elapsed = ((now or timezone.now()) - EPOCH).total_seconds()
+    return 2 ** (elapsed / (settings.POPULARITY_HALF_LIFE_DAYS * 24 * 60 * 60))
+
+
+def decayed_score(stored, now=None):
+    """
+    A stored ``popularity`` value as of ``now``.
+    """
+    return round(stored / growth(now), 3)
+
+
+class RedisBuffer:
+    """
+    One hash per target type, with ``{id}:{event}`` fields.
+
+    A flush renames the hash before reading it, so increments that arrive
+    meanwhile go to a fresh hash. Fields are deleted from the renamed hash
+    batch by batch as their database update goes through; whatever is left
+    after a failure is picked up again by the next flush.
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.errors = redis.RedisError
+        self.missing = redis.ResponseError
+
+    def add(self, target, object_id, event, amount):
+        self.client.hincrby(
+            f'{BUFFER_KEY_PREFIX}{target}', f'{object_id}:{event}', amount
+        )
+
+    def drain(self, target):
+        key = f'{BUFFER_KEY_PREFIX}{target}'
+        flushing = f'{key}:flushing'
+        if not self.client.exists(flushing):
+            try:
+                self.client.rename(key, flushing)
+            except self.missing:
+                # Nothing was recorded since the last flush
+                return Counter()
+        counts = Counter()
+        for field, amount in self.client.hgetall(flushing).items():
+            object_id, event = field.decode().split(':', 1)
+            counts[(int(object_id), event)] += int(amount)
+        return counts
+
+    def ack(self, target, counts):
+        # Redis drops the hash with its last field
+        self.client.hdel(
+            f'{BUFFER_KEY_PREFIX}{target}:flushing',
+            *[f'{object_id}:{event}' for object_id, event in counts],
+        )
+
+
+class LocalBuffer:
+    """
+    In-process stand-in for ``RedisBuffer`` when no Redis is configured.
+    """
+    errors = ()
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = defaultdict(Counter)
+        self.flushed_at = time.monotonic()
+
+    def add(self, target, object_id, event, amount):
+        with self.lock:
+            self.counts[target][(object_id, event)] += amount
+
+    def drain(self, target):
+        with self.lock:
+            return Counter(self.counts[target])
+
+    def ack(self, target, counts):
+        with self.lock:
+            # Subtracted rather than removed: the same keys may
+            # have been counted again meanwhile
+            self.counts[target].subtract(counts)
+            self.counts[target] = +self.counts[target]
+
+    def take(self):
+        """
+        Empty the buffer, as ``[target, id, event, amount]`` entries for ``flush``.
+        """
+        with self.lock:
+            counts, self.counts = self.counts, defaultdict(Counter)
+        return [
+            [target, object_id, event, amount]
+            for target, target_counts in counts.items()
+            for (object_id, event), amount in target_counts.items()
+        ]
+
+    def due(self):
+        return time.monotonic() - self.flushed_at >= settings.POPULARITY_FLUSH_INTERVAL
+
+
+@lru_cache(maxsize=None)
+def get_buffer():
+    if settings.POPULARITY_REDIS_URL:
+        return RedisBuffer(settings.POPULARITY_REDIS_URL)
+    return LocalBuffer()
+
+
+def record(target, object_id, event='view', amount=1):
+    """
+    Count ``amount`` ``event``s (``view`` or ``sale``) for a product or news item.
+    """
+    buffer = get_buffer()
+    try:
+        buffer.add(target, int(object_id), event, amount)
+    except buffer.errors as exc:
+        # Popularity is best effort and must never fail the request
+        logger.warning(f'Could not record {event} of {target} {object_id}: {exc}')
+        return
+    if isinstance(buffer, LocalBuffer) and buffer.due():
+        buffer.flushed_at = time.monotonic()
+        entries = buffer.take()
+        if entries:
+            from .tasks import flush_popularity
+
+            try:
+                flush_popularity.delay(entries)
+            except Exception as exc:
+                logger.warning(
+                    f'Could not hand over {len(entries)} popularity counts: {exc}'
+                )
+
+
+def flush(now=None, entries=None):
+    """
+    Write buffered counts to the database; returns the number of rows updated.
+
+    ``entries`` handed over by ``record`` are written instead of this
+    process's buffer when given.
+    """
+    if entries is not None:
+        counts = defaultdict(Counter)
+        for target, object_id, event, amount in entries:
+            counts[target][(object_id, event)] += amount
+        return sum(
+            _write(target, target_counts, now)
+            for target, target_counts in counts.items()
+        )
+
+    buffer = get_buffer()
+    return sum(
+        _write(target, buffer.drain(target), now, buffer.ack)
+        for target in POPULARITY_TARGETS
+    )
+
+
+def _write(target, counts, now=None, ack=None):
+    """
+    Add ``counts`` of one target type to its rows, calling ``ack`` with each batch
+    written.
+    """
+    model = POPULARITY_TARGETS[target]
+    factor = growth(now)
+    weights = settings.POPULARITY_WEIGHTS
+    updated = 0
+    object_ids = sorted({object_id for object_id, _ in counts})
+    for start in range(0, len(object_ids), BATCH_SIZE):
+        batch = set(object_ids[start:start + BATCH_SIZE])
+        batch_counts = Counter(
+            {key: amount for key, amount in counts.items() if key[0] in batch}
+        )
+        views = Counter()
+        scores = Counter()
+        for (object_id, event), amount in batch_counts.items():
+            if event == 'view':
+                views[object_id] += amount
+            scores[object_id] += amount * weights.get(event, 0) * factor
+
+        with transaction.atomic():
+            updated += model.objects.filter(pk__in=batch).update(
+                view_count=F('view_count')
+                + Case(
+                    *[
+                        When(pk=object_id, then=Value(views[object_id]))
+                        for object_id in sorted(batch)
+                    ],
+                    default=Value(0),
+                    output_field=PositiveBigIntegerField(),
+                ),
+                popularity=F('popularity')
+                + Case(
+                    *[
+                        When(pk=object_id, then=Value(scores[object_id]))
+                        for object_id in sorted(batch)
+                    ],
+                    default=Value(0.0),
+                    output_field=FloatField(),
+                ),
+            )
+            # Last, so a batch that cannot be taken off the buffer is
+            # rolled back and written again later
+            if ack is not None:
+                ack(target, batch_counts)
+    return updated
@@ -0,0 +1,246 @@
+"""
+Promotion pricing engine.
+
+Rules:
+
+* ``percent`` takes ``discount_value`` percent off the current price.
+* ``fixed`` takes ``discount_value`` off the current price.
+* ``bundle`` sells ``bundle_quantity`` units for ``discount_value``; the
+  effective unit price is that bundle price divided by the quantity.
+
+Stacking: promotions are applied in priority order (highest first, then
+oldest). The first promotion always applies; the ones after it apply on
+top of the discounted price only while every promotion applied so far,
+and the next one, is ``stackable``.
+
+Effective prices only change when a promotion, one of its product links or
+a product price changes, or when a promotion window opens or closes, so they
+are precomputed into ``ProductPrice`` instead of being worked out per request.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import BooleanField, F, Func, Q, Value
+from django.utils import timezone
+
+from . import push, storefront
+from .models import Product, ProductPrice, Promotion, PromotionProduct
+
+CENT = Decimal('0.01')
+
+BATCH_SIZE = 500
+
+
+def apply_rule(price, promotion):
+    """
+    Price after a single promotion rule, never below zero.
+    """
+    value = promotion.discount_value
+    if promotion.discount_type == Promotion.DISCOUNT_PERCENT:
+        price = price * (Decimal('100') - min(value, Decimal('100'))) / Decimal('100')
+    elif promotion.discount_type == Promotion.DISCOUNT_FIXED:
+        price = price - value
+    elif (
+        promotion.discount_type == Promotion.DISCOUNT_BUNDLE
+        and promotion.bundle_quantity
+    ):
+        price = min(price, value / promotion.bundle_quantity)
+    return max(price, Decimal('0')).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def stacked(promotions):
+    """
+    The promotions that apply together, in the order they are applied.
+    """
+    ordered = sorted(
+        promotions, key=lambda promotion: (-promotion.priority, promotion.id)
+    )
+    applied = ordered[:1]
+    for promotion in ordered[1:]:
+        if not (applied[-1].stackable and promotion.stackable):
+            break
+        applied.append(promotion)
+    return applied
+
+
+def effective_price(price, promotions):
+    """
+    Return ``(price, lead_promotion)`` for a base price and its active promotions.
+    """
+    applied = stacked(promotions)
+    for promotion in applied:
+        price = apply_rule(price, promotion)
+    return price, (applied[0] if applied else None)
+
+
+class WindowContains(Func):
+    """
+    ``daterange(start, end, '[]') @> on``: the expression the GiST index on promotion
+    windows covers.
+    """
+    output_field = BooleanField()
+
+    def as_sql(self, compiler, connection):
+        (start, start_params), (end, end_params), (on, on_params) = (
+            compiler.compile(expression) for expression in self.get_source_expressions()
+        )
+        return f"daterange({start}, {end}, '[]') @> {on}::date", (
+            *start_params,
+            *end_params,
+            *on_params,
+        )
+
+
+def active_links(on):
+    """
+    Live product/promotion links whose promotion window contains ``on``.
+
+    On PostgreSQL the window is matched through the GiST index on
+    ``daterange(start_date, end_date, '[]')`` (migration 0012), so the
+    lookup costs ``log n`` plus the promotions it returns. Other databases
+    have only the B-tree indexes on ``(start_date, end_date)`` and
+    ``end_date``: they scan every promotion that started by ``on`` (or, if
+    fewer, every one that has not ended) and filter the rest. Requests
+    never pay either, as they read ``ProductPrice``.
+    """
+    links = PromotionProduct.objects.filter(
+        deleted_at__isnull=True, promotion__deleted_at__isnull=True
+    )
+    if connection.vendor == 'postgresql':
+        return links.filter(
+            WindowContains(
+                F('promotion__start_date'), F('promotion__end_date'), Value(on)
+            )
+        )
+    return links.filter(promotion__start_date__lte=on, promotion__end_date__gte=on)
+
+
+def refresh(product_ids, on=None):
+    """
+    Recompute ``ProductPrice`` rows for ``product_ids`` as of ``on`` (today).
+
+    Returns the number of products that currently have a promotional price.
+    """
+    on = on or timezone.localdate()
+    product_ids = sorted(set(product_ids))
+    priced = 0
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        promotions = defaultdict(list)
+        for link in (
+            active_links(on).filter(product_id__in=batch).select_related('promotion')
+        ):
+            promotions[link.product_id].append(link.promotion)
+
+        rows = []
+        products = {}
+        for product_id, category_id, price in Product.objects.filter(
+            id__in=promotions
+        ).values_list('id', 'category_id', 'price'):
+            products[product_id] = (category_id, price)
+            price, promotion = effective_price(price, promotions[product_id])
+            rows.append(
+                ProductPrice(product_id=product_id, price=price, promotion=promotion)
+            )
+
+        current = {row.product_id: row.price for row in rows}
+        with transaction.atomic():
+            previous = dict(
+                ProductPrice.objects.filter(product_id__in=batch).values_list(
+                    'product_id', 'price'
+                )
+            )
+            ProductPrice.objects.filter(product_id__in=batch).delete()
+            ProductPrice.objects.bulk_create(rows)
+            changed = [
+                product_id
+                for product_id in batch
+                if previous.get(product_id) != current.get(product_id)
+            ]
+            if changed:
+                # effective_price is part of the product: moves the
+                # change feed and list fragments along
+                Product.all_objects.filter(pk__in=changed).update(
+                    updated_at=timezone.now()
+                )
+        # Batch-get entries carry effective_price
+        cache.delete_many([f'product_{product_id}' for product_id in batch])
+        if changed:
+            _push_prices(changed, current, products)
+            # The storefront shows promotional prices too
+            transaction.on_commit(storefront.mark_dirty)
+        priced += len(rows)
+    return priced
+
+
+def _push_prices(product_ids, promotional, products):
+    """
+    Push the new effective prices of ``product_ids`` to subscribed clients.
+
+    ``products`` maps the ids already loaded to their category and base price.
+    """
+    missing = [product_id for product_id in product_ids if product_id not in products]
+    if missing:
+        # Products that just lost their last promotion sell at their base price again
+        products = {
+            **products,
+            **{
+                product_id: (category_id, price)
+                for product_id, category_id, price in Product.objects.filter(
+                    id__in=missing
+                ).values_list('id', 'category_id', 'price')
+            },
+        }
+    updates = [
+        {'id': product_id, 'category': products[product_id][0],
+         'effective_price': promotional.get(product_id, products[product_id][1])}
+        for product_id in product_ids if product_id in products
+    ]
+    transaction.on_commit(lambda: push.publish(updates))
+
+
+def refresh_promotion(promotion_id, on=None):
+    """
+    Recompute prices for every product linked to a promotion.
+
+    Soft-deleted links count too: their products may still carry its price.
+    """
+    product_ids = PromotionProduct.all_objects.filter(
+        promotion_id=promotion_id
+    ).values_list('product_id', flat=True)
+    return refresh(list(product_ids), on)
+
+
+def refresh_boundaries(on=None, days=1):
+    """
+    Recompute prices for promotions that started or ended in the last ``days`` days.
+
+    Both conditions are equality/range scans on the promotion date indexes,
+    so the daily run touches only the products whose price actually changed.
+    """
+    on = on or timezone.localdate()
+    since = on - timedelta(days=days)
+    promotion_ids = Promotion.objects.filter(
+        Q(start_date__gt=since, start_date__lte=on)
+        | Q(end_date__gte=since, end_date__lt=on)
+    ).values('id')
+    if promotion_ids.exists():
+        # Running promotions are listed on the storefront, linked products or not
+        transaction.on_commit(storefront.mark_dirty)
+    product_ids = PromotionProduct.objects.filter(
+        promotion_id__in=promotion_ids
+    ).values_list('product_id', flat=True).distinct()
+    return refresh(list(product_ids), on)
+
+
+def rebuild(on=None):
+    """
+    Recompute every promotional price from scratch.
+    """
+    on = on or timezone.localdate()
+    product_ids = set(active_links(on).values_list('product_id', flat=True))
+    product_ids.update(ProductPrice.objects.values_list('product_id', flat=True))
+    return refresh(product_ids, on)
@@ -0,0 +1,544 @@
+"""
+Server-pushed stock and price updates.
+
+Product pages subscribe to product ids and categories over one long-lived
+connection instead of polling ``/api/products/{id}/``:
+
+- ``GET /api/push/events/?products=1,2&categories=3``: Server-Sent Events,
+  one ``product`` event per update;
+- ``/api/push/ws/?products=1,2``: a WebSocket, one JSON message per update.
+  Sending ``{"subscribe": {"products": [4]}}`` or ``{"unsubscribe": ...}``
+  changes the subscription.
+
+An update holds the product's ``id``, ``category`` and the fields that
+changed. ``publish`` sends updates once the change is committed: over Redis
+pub/sub when ``PUSH_REDIS_URL`` is set, otherwise only to this process. Each
+ASGI worker keeps one Redis subscription and one ``Hub``. The hub merges the
+updates for a product that arrive within ``PUSH_COALESCE_SECONDS`` and hands
+the result to the product's and its category's subscribers.
+
+``PushApplication`` serves the connections ahead of Django, so an idle
+subscriber holds no request, middleware or thread; it is a small object and
+a suspended coroutine.
+"""
+import asyncio
+import io
+import json
+import logging
+from collections import defaultdict
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'push:products'
+
+EVENTS_PATH = '/api/push/events/'
+WEBSOCKET_PATH = '/api/push/ws/'
+
+# Product fields whose changes are pushed
+PUSHED_FIELDS = ('stock_quantity', 'price', 'is_active')
+
+# WebSocket close codes, sent instead of an HTTP status
+CLOSE_BAD_REQUEST = 4400
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+
+
+def product_update(product, fields):
+    """
+    The update announcing new values of ``fields`` on ``product``.
+    """
+    update = {'id': product.pk, 'category': product.category_id}
+    for field in fields:
+        update[field] = getattr(product, field)
+    return update
+
+
+class RedisBroker:
+    """
+    Updates published on a Redis pub/sub channel, seen by every worker.
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self.errors = redis.RedisError
+
+    def publish(self, message):
+        self.client.publish(CHANNEL, message)
+
+    async def listen(self):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(CHANNEL)
+            async for message in pubsub.listen():
+                yield message['data']
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+class LocalBroker:
+    """
+    In-process stand-in for ``RedisBroker`` when no Redis is configured.
+
+    Updates only reach connections of the process that published them, so
+    changes made by Celery workers or other web workers are not pushed.
+    """
+    errors = ()
+
+    def __init__(self):
+        self.listeners = set()
+
+    def publish(self, message):
+        for loop, queue in list(self.listeners):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                # The loop was closed
+                self.listeners.discard((loop, queue))
+
+    async def listen(self):
+        listener = (asyncio.get_running_loop(), asyncio.Queue())
+        self.listeners.add(listener)
+        try:
+            while True:
+                yield await listener[1].get()
+        finally:
+            self.listeners.discard(listener)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    if settings.PUSH_REDIS_URL:
+        return RedisBroker(settings.PUSH_REDIS_URL)
+    return LocalBroker()
+
+
+def publish(updates):
+    """
+    Send ``updates`` to the subscribers of their products and categories.
+
+    Best effort: a failure is logged and never fails the caller.
+    """
+    if not updates:
+        return
+    broker = get_broker()
+    try:
+        broker.publish(json.dumps(updates, cls=DjangoJSONEncoder))
+    except broker.errors as exc:
+        logger.warning(f'Could not publish {len(updates)} product updates: {exc}')
+
+
+class Subscriber:
+    """
+    One connection's subscriptions and the updates waiting to be written to it.
+
+    Updates for a product not yet written are merged, so a slow client gets
+    the latest values rather than a backlog.
+    """
+    __slots__ = ('products', 'categories', 'pending', 'ready', 'heartbeat', 'closed')
+
+    def __init__(self, heartbeat=True):
+        self.products = set()
+        self.categories = set()
+        self.pending = {}
+        self.ready = asyncio.Event()
+        self.heartbeat = heartbeat
+        self.closed = False
+
+    def push(self, update):
+        current = self.pending.get(update['id'])
+        # The hub's dict is shared by every subscriber; only a merge needs a copy
+        self.pending[update['id']] = (
+            update if current is None else {**current, **update}
+        )
+        self.ready.set()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    async def updates(self):
+        """
+        Wait for updates; an empty list is a heartbeat, None a closed connection.
+        """
+        await self.ready.wait()
+        self.ready.clear()
+        if self.closed:
+            return None
+        pending, self.pending = self.pending, {}
+        return list(pending.values())
+
+
+class Hub:
+    """
+    This worker's subscribers, indexed by product and category.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.subscribers = set()
+        self.products = defaultdict(set)
+        self.categories = defaultdict(set)
+        self.pending = {}
+        self.flush_handle = None
+        self.tasks = []
+
+    def start(self):
+        if not self.tasks:
+            self.tasks = [
+                self.loop.create_task(self.listen()),
+                self.loop.create_task(self.beat()),
+            ]
+
+    def subscribe(self, subscriber, products=(), categories=()):
+        self.start()
+        self.subscribers.add(subscriber)
+        for product_id in products:
+            self.products[product_id].add(subscriber)
+            subscriber.products.add(product_id)
+        for category_id in categories:
+            self.categories[category_id].add(subscriber)
+            subscriber.categories.add(category_id)
+
+    def unsubscribe(self, subscriber, products=None, categories=None):
+        """
+        Drop some of ``subscriber``'s subscriptions, or all of them and the subscriber.
+        """
+        if products is None and categories is None:
+            self.subscribers.discard(subscriber)
+            products, categories = list(subscriber.products), list(
+                subscriber.categories
+            )
+        for index, subscribed, ids in (
+            (self.products, subscriber.products, products or ()),
+            (self.categories, subscriber.categories, categories or ()),
+        ):
+            for object_id in ids:
+                subscribed.discard(object_id)
+                subscribers = index.get(object_id)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del index[object_id]
+
+    async def listen(self):
+        delay = 1
+        while True:
+            try:
+                async for message in get_broker().listen():
+                    self.receive(message)
+                    delay = 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f'Push subscription lost, retrying in {delay}s: {exc}')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    async def beat(self):
+        # One timer for every connection rather than one each
+        while True:
+            await asyncio.sleep(settings.PUSH_HEARTBEAT_SECONDS)
+            for subscriber in self.subscribers:
+                if subscriber.heartbeat:
+                    subscriber.ready.set()
+
+    def receive(self, message):
+        try:
+            updates = json.loads(message)
+        except ValueError:
+            logger.warning('Ignoring malformed push message')
+            return
+        for update in updates:
+            current = self.pending.get(update['id'])
+            self.pending[update['id']] = (
+                update if current is None else {**current, **update}
+            )
+        if self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(
+                settings.PUSH_COALESCE_SECONDS, self.flush
+            )
+
+    def flush(self):
+        self.flush_handle = None
+        pending, self.pending = self.pending, {}
+        for product_id, update in pending.items():
+            for subscriber in self.products.get(product_id, ()):
+                subscriber.push(update)
+            for subscriber in self.categories.get(update.get('category'), ()):
+                # Already has it through the product
+                if product_id not in subscriber.products:
+                    subscriber.push(update)
+
+
+_hub = None
+
+
+def get_hub():
+    global _hub
+    if _hub is None or _hub.loop is not asyncio.get_running_loop():
+        _hub = Hub()
+    return _hub
+
+
+def parse_ids(values):
+    ids = set()
+    for value in values:
+        for part in str(value).split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if not part.isdigit():
+                raise ValueError(f'Invalid id: {part[:20]!r}')
+            ids.add(int(part))
+    return ids
+
+
+def parse_subscription(data):
+    """
+    ``(products, categories)`` id sets from a query string dict or a JSON message.
+
+    Raises ``ValueError`` on bad ids or too many of them.
+    """
+    def values(key):
+        value = data.get(key, [])
+        return value if isinstance(value, list) else [value]
+
+    products, categories = parse_ids(values('products')), parse_ids(
+        values('categories')
+    )
+    if len(products) + len(categories) > settings.PUSH_MAX_SUBSCRIPTIONS:
+        raise ValueError(
+            f'At most {settings.PUSH_MAX_SUBSCRIPTIONS} products and categories '
+            'per connection'
+        )
+    return products, categories
+
+
+def _headers(scope):
+    return {
+        name.decode('latin-1'): value.decode('latin-1')
+        for name, value in scope.get('headers', [])
+    }
+
+
+def allowed_origin(scope):
+    """
+    The browser origin of a connection if it may subscribe: same host or a CORS origin.
+
+    Returns '' for non-browser clients, which send no ``Origin``, and None when refused.
+    """
+    headers = _headers(scope)
+    origin = headers.get('origin')
+    if not origin:
+        return ''
+    if origin in settings.CORS_ALLOWED_ORIGINS or origin.split('://', 1)[
+        -1
+    ] == headers.get('host'):
+        return origin
+    return None
+
+
+async def authenticate(scope):
+    """
+    The user behind a connection's session cookie or ``Authorization`` header, or None.
+    """
+    from .async_views import aget_user
+    from .views import ProductViewSet
+
+    request = ASGIRequest({**scope, 'method': 'GET'}, io.BytesIO())
+    try:
+        return await aget_user(request, ProductViewSet)
+    finally:
+        # Django's request signals, which normally do this, do not run here
+        await sync_to_async(close_old_connections)()
+
+
+class PushApplication:
+    """
+    ASGI application serving push connections and passing everything else to
+    ``application``.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+            return await self.events(scope, receive, send)
+        if scope['type'] == 'websocket':
+            return await self.websocket(scope, receive, send)
+        return await self.application(scope, receive, send)
+
+    async def reject(self, send, status, detail, headers=()):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), *headers],
+        })
+        await send(
+            {
+                'type': 'http.response.body',
+                'body': json.dumps({'detail': detail}).encode(),
+            }
+        )
+
+    async def events(self, scope, receive, send):
+        origin = allowed_origin(scope)
+        if origin is None:
+            return await self.reject(send, 403, 'Origin not allowed.')
+        cors = [
+            (b'access-control-allow-origin', origin.encode('latin-1')),
+            (b'access-control-allow-credentials', b'true'),
+            (b'vary', b'Origin'),
+        ] if origin else []
+        try:
+            products, categories = parse_subscription(
+                parse_qs(scope['query_string'].decode('latin-1'))
+            )
+        except ValueError as exc:
+            return await self.reject(send, 400, str(exc), cors)
+        if await authenticate(scope) is None:
+            return await self.reject(
+                send, 401, 'Authentication credentials were not provided.', cors
+            )
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # Tells nginx not to buffer the stream
+                (b'x-accel-buffering', b'no'),
+                *cors,
+            ],
+        })
+        await send(
+            {
+                'type': 'http.response.body',
+                'body': b'retry: 5000\n\n',
+                'more_body': True,
+            }
+        )
+
+        hub = get_hub()
+        subscriber = Subscriber()
+        hub.subscribe(subscriber, products, categories)
+        watcher = asyncio.ensure_future(self.watch_disconnect(receive, subscriber))
+        try:
+            while True:
+                updates = await subscriber.updates()
+                if updates is None:
+                    break
+                body = (
+                    ''.join(
+                        'event: product\n'
+                        f'data: {json.dumps(update, cls=DjangoJSONEncoder)}\n\n'
+                        for update in updates
+                    )
+                    or ': ping\n\n'
+                )
+                await send(
+                    {
+                        'type': 'http.response.body',
+                        'body': body.encode(),
+                        'more_body': True,
+                    }
+                )
+        finally:
+            hub.unsubscribe(subscriber)
+            watcher.cancel()
+
+    async def watch_disconnect(self, receive, subscriber):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        subscriber.close()
+
+    async def websocket(self, scope, receive, send):
+        if (await receive())['type'] != 'websocket.connect':
+            return
+        if scope['path'] != WEBSOCKET_PATH:
+            return await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        # Browsers send cookies with cross-site WebSocket
+        # handshakes, and CORS does not apply
+        if allowed_origin(scope) is None:
+            return await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        try:
+            products, categories = parse_subscription(
+                parse_qs(scope['query_string'].decode('latin-1'))
+            )
+        except ValueError:
+            return await send({'type': 'websocket.close', 'code': CLOSE_BAD_REQUEST})
+        if await authenticate(scope) is None:
+            return await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        await send({'type': 'websocket.accept'})
+
+        hub = get_hub()
+        # The server pings WebSocket clients itself, so no heartbeat messages
+        subscriber = Subscriber(heartbeat=False)
+        hub.subscribe(subscriber, products, categories)
+        reader = asyncio.ensure_future(
+            self.read_websocket(receive, send, hub, subscriber)
+        )
+        try:
+            while True:
+                updates = await subscriber.updates()
+                if updates is None:
+                    break
+                for update in updates:
+                    await send(
+                        {
+                            'type': 'websocket.send',
+                            'text': json.dumps(update, cls=DjangoJSONEncoder),
+                        }
+                    )
+        finally:
+            hub.unsubscribe(subscriber)
+            reader.cancel()
+
+    async def read_websocket(self, receive, send, hub, subscriber):
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                subscriber.close()
+                return
+            try:
+                command = json.loads(message.get('text') or message.get('bytes') or '')
+                subscribe = command.get('subscribe', {})
+                unsubscribe = command.get('unsubscribe', {})
+                products, categories = parse_subscription(subscribe)
+                drop_products, drop_categories = parse_subscription(unsubscribe)
+                subscribed = len(subscriber.products | products) + len(
+                    subscriber.categories | categories
+                )
+                if subscribed > settings.PUSH_MAX_SUBSCRIPTIONS:
+                    raise ValueError(
+                        f'At most {settings.PUSH_MAX_SUBSCRIPTIONS} products and '
+                        'categories per connection'
+                    )
+            except (AttributeError, TypeError, ValueError) as exc:
+                await send(
+                    {
+                        'type': 'websocket.send',
+                        'text': json.dumps({'error': str(exc) or 'Invalid message'}),
+                    }
+                )
+                continue
+            hub.unsubscribe(subscriber, drop_products, drop_categories)
+            hub.subscribe(subscriber, products, categories)
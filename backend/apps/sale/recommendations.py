@@ -0,0 +1,286 @@
+"""
+Offline "customers also liked" recommendations.
+
+Products are compared through baskets: the products a user rated well, and
+the products sharing a (small) promotion. Baskets form a sparse
+basket x product matrix; the cosine similarity of its columns is computed
+with sparse matrix products, a block of products at a time. Every candidate
+pair also gets a bonus for how much category ancestry the two products share,
+and products with few co-occurrences are topped up with the most popular
+products of their own and their parent category. The top
+``RELATED_PRODUCTS_COUNT`` neighbours of each product are stored in
+``RelatedProduct`` and read back with one indexed join.
+"""
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from scipy import sparse
+
+from .models import Category, Comment, Product, PromotionProduct, RelatedProduct
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 20000
+
+WRITE_BATCH_SIZE = 5000
+
+# Weight of an unrated comment; rated ones scale from 0 (1 star) to 1 (5 stars)
+UNRATED_WEIGHT = 0.5
+
+# Keeps popularity a tie-breaker below any similarity or category signal
+POPULARITY_EPSILON = 1e-3
+
+MAX_CATEGORY_DEPTH = 32
+
+
+def _fetch(queryset, fields, dtype=np.int64):
+    """
+    Columns of ``queryset`` as NumPy arrays, without building model instances.
+    """
+    rows = list(queryset.values_list(*fields).iterator(chunk_size=20000))
+    if not rows:
+        return [np.empty(0, dtype=dtype) for _ in fields]
+    return [np.asarray(column, dtype=dtype) for column in zip(*rows)]
+
+
+def _ranks_within(groups, order_keys):
+    """
+    Sort by ``groups`` then ``order_keys`` and number the rows of each group from 0.
+    """
+    order = np.lexsort((order_keys, groups))
+    grouped = groups[order]
+    starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+    first = np.repeat(starts, np.diff(np.r_[starts, len(grouped)]))
+    return order, np.arange(len(grouped)) - first
+
+
+def category_paths(category_ids, parent_ids):
+    """
+    Root-first ancestor index paths, padded with -1, and the depth of each category.
+    """
+    index = {category_id: i for i, category_id in enumerate(category_ids.tolist())}
+    parents = [index.get(parent_id, -1) for parent_id in parent_ids.tolist()]
+    chains = []
+    for i in range(len(parents)):
+        chain = [i]
+        while parents[chain[-1]] >= 0 and len(chain) < MAX_CATEGORY_DEPTH:
+            chain.append(parents[chain[-1]])
+        chains.append(chain[::-1])
+    depth = np.array([len(chain) for chain in chains], dtype=np.int64)
+    paths = np.full((len(chains), max(depth, default=1)), -1, dtype=np.int64)
+    for i, chain in enumerate(chains):
+        paths[i, :len(chain)] = chain
+    return paths, depth
+
+
+def category_affinity(paths, depth, a, b):
+    """
+    Share of the deeper category's path that categories ``a`` and ``b`` have in common.
+    """
+    same = (paths[a] == paths[b]) & (paths[a] >= 0)
+    shared = np.cumprod(same, axis=1).sum(axis=1)
+    return shared / np.maximum(depth[a], depth[b])
+
+
+def basket_matrix(product_ids, on):
+    """
+    Column-normalized basket x product matrix from ratings and promotions.
+    """
+    max_basket = settings.RELATED_MAX_BASKET_SIZE
+
+    users, targets, ratings, comment_ids = _fetch(
+        Comment.objects.filter(target_type='product', deleted_at__isnull=True),
+        ('user_id', 'target_id', 'rating', 'id'),
+        dtype=np.float64,
+    )
+    weights = np.where(np.isnan(ratings), UNRATED_WEIGHT, (ratings - 1) / 4)
+
+    promotions, linked = _fetch(
+        PromotionProduct.objects.filter(
+            deleted_at__isnull=True,
+            promotion__deleted_at__isnull=True,
+            promotion__end_date__gte=on,
+        ),
+        ('promotion_id', 'product_id'),
+    )
+
+    _, user_rows = np.unique(users.astype(np.int64), return_inverse=True)
+    _, promotion_rows = np.unique(promotions, return_inverse=True)
+    rows = np.concatenate([user_rows, promotion_rows + (user_rows.max(initial=-1) + 1)])
+    products = np.concatenate([targets.astype(np.int64), linked])
+    values = np.concatenate([weights, np.ones(len(linked))])
+    # Newest entries first when a basket has to be truncated
+    recency = np.concatenate([-comment_ids, np.zeros(len(linked))])
+
+    columns = np.searchsorted(product_ids, products)
+    known = (columns < len(product_ids)) & (
+        product_ids[np.minimum(columns, len(product_ids) - 1)] == products
+    )
+    keep = known & (values > 0)
+    rows, columns, values, recency = (
+        rows[keep],
+        columns[keep],
+        values[keep],
+        recency[keep],
+    )
+
+    # Huge baskets add quadratically many pairs and little signal
+    order, rank = _ranks_within(rows, recency)
+    kept = order[rank < max_basket]
+    rows, columns, values = rows[kept], columns[kept], values[kept]
+    sizes = np.bincount(rows, minlength=rows.max(initial=-1) + 1)
+    values = values / np.log2(1 + sizes[rows])
+
+    matrix = sparse.csc_matrix(
+        (values, (rows, columns)), shape=(rows.max(initial=-1) + 1, len(product_ids))
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    norms[norms == 0] = 1
+    return (matrix @ sparse.diags(1 / norms)).tocsc()
+
+
+def category_top(product_categories, paths, popularity_order, count):
+    """
+    The ``count`` most popular products under each category, padded with -1.
+    """
+    levels = paths.shape[1]
+    ancestors = paths[product_categories].ravel()
+    products = np.repeat(np.arange(len(product_categories)), levels)
+    present = ancestors >= 0
+    ancestors, products = ancestors[present], products[present]
+
+    order, rank = _ranks_within(ancestors, popularity_order[products])
+    keep = order[rank < count]
+    top = np.full((len(paths), count), -1, dtype=np.int64)
+    top[ancestors[keep], rank[rank < count]] = products[keep]
+    return top
+
+
+def top_neighbours(rows, columns, scores, count):
+    """
+    Keep the best ``count`` distinct columns per row.
+    """
+    order = np.lexsort((-scores, columns, rows))
+    rows, columns, scores = rows[order], columns[order], scores[order]
+    first = np.r_[True, (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])]
+    rows, columns, scores = rows[first], columns[first], scores[first]
+
+    order, rank = _ranks_within(rows, -scores)
+    keep = order[rank < count]
+    return rows[keep], columns[keep], scores[keep], rank[rank < count]
+
+
+def _insert(rows):
+    """
+    Insert ``(product_id, related_id, score, rank)`` tuples.
+
+    Plain ``executemany`` batches: building a model instance per row would
+    cost more than the whole similarity computation.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(column) for column in ('product_id', 'related_id', 'score', 'rank')
+    )
+    sql = (
+        f'INSERT INTO {quote(RelatedProduct._meta.db_table)} ({columns}) '
+        'VALUES (%s, %s, %s, %s)'
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), WRITE_BATCH_SIZE):
+            cursor.executemany(sql, rows[start:start + WRITE_BATCH_SIZE])
+
+
+def build(on=None):
+    """
+    Recompute ``RelatedProduct`` for every active product; returns the number of rows
+    stored.
+    """
+    on = on or timezone.localdate()
+    started = time.monotonic()
+    count = settings.RELATED_PRODUCTS_COUNT
+    category_weight = settings.RELATED_CATEGORY_WEIGHT
+
+    product_ids, category_ids, popularity, comment_counts = _fetch(
+        Product.objects.filter(is_active=True, deleted_at__isnull=True).order_by('id'),
+        ('id', 'category_id', 'popularity', 'comment_count'),
+        dtype=np.float64,
+    )
+    product_ids = product_ids.astype(np.int64)
+    categories, parents = _fetch(
+        Category.objects.order_by('id'), ('id', 'parent_id'), dtype=np.float64
+    )
+    categories = categories.astype(np.int64)
+    parents = np.nan_to_num(parents, nan=-1).astype(np.int64)
+    paths, depth = category_paths(categories, parents)
+    product_categories = np.searchsorted(categories, category_ids.astype(np.int64))
+
+    # 0 for the most popular product, growing towards the least popular
+    popularity_order = np.empty(len(product_ids), dtype=np.int64)
+    popularity_order[np.lexsort((-comment_counts, -popularity))] = np.arange(
+        len(product_ids)
+    )
+    tie_breaker = POPULARITY_EPSILON * (1 - popularity_order / max(len(product_ids), 1))
+
+    top = category_top(product_categories, paths, popularity_order, count + 1)
+    leaf = paths[product_categories, depth[product_categories] - 1]
+    parent = paths[product_categories, np.maximum(depth[product_categories] - 2, 0)]
+
+    baskets = basket_matrix(product_ids, on)
+    logger.info(f'Loaded {len(product_ids)} products and {baskets.shape[0]} baskets '
+                f'in {time.monotonic() - started:.1f}s')
+
+    stored = 0
+    for start in range(0, len(product_ids), CHUNK_SIZE):
+        stop = min(start + CHUNK_SIZE, len(product_ids))
+        block = (baskets[:, start:stop].T @ baskets).tocoo()
+        rows, columns, scores = (
+            block.row.astype(np.int64),
+            block.col.astype(np.int64),
+            block.data,
+        )
+
+        # Category top-ups: the leaf's and the parent's most popular products
+        local = np.arange(stop - start)
+        fill = np.concatenate([top[leaf[start:stop]], top[parent[start:stop]]], axis=1)
+        fill_rows = np.repeat(local, fill.shape[1])
+        fill_columns = fill.ravel()
+        valid = fill_columns >= 0
+        rows = np.concatenate([rows, fill_rows[valid]])
+        columns = np.concatenate([columns, fill_columns[valid]])
+        scores = np.concatenate([scores, np.zeros(valid.sum())])
+
+        not_self = columns != rows + start
+        rows, columns, scores = rows[not_self], columns[not_self], scores[not_self]
+        scores = scores + category_weight * category_affinity(
+            paths, depth, product_categories[rows + start], product_categories[columns]
+        ) + tie_breaker[columns]
+
+        rows, columns, scores, ranks = top_neighbours(rows, columns, scores, count)
+        related = list(
+            zip(
+                product_ids[rows + start].tolist(),
+                product_ids[columns].tolist(),
+                scores.tolist(),
+                ranks.tolist(),
+            )
+        )
+        with transaction.atomic():
+            RelatedProduct.objects.filter(
+                product_id__gte=product_ids[start],
+                product_id__lte=product_ids[stop - 1],
+            ).delete()
+            _insert(related)
+        stored += len(related)
+
+    # Products that were deactivated or deleted since the last run
+    RelatedProduct.objects.exclude(
+        product__is_active=True, product__deleted_at__isnull=True
+    ).delete()
+    logger.info(
+        f'Stored {stored} related products in {time.monotonic() - started:.1f}s'
+    )
+    return stored
@@ -2,13 +2,35 @@
 Serializers for sale app.
 """
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 
+from .images import srcset
+from .popularity import decayed_score
 from .models import (
     Role, User, Category, Product, ProductImage, 
-    News, Promotion, Comment, PromotionProduct
+    News, Promotion, Comment, PromotionProduct, StockReservation
 )
 
 
+class SoftDeleteUniqueMixin:
+    """
+    Checks unique fields against ``all_objects`` rather than the live-only default
+    manager.
+
+    Soft-deleted rows keep their slugs and SKUs in the database until they are
+    archived, so reusing one must fail validation instead of the insert.
+    """
+
+    def build_standard_field(self, field_name, model_field):
+        field_class, field_kwargs = super().build_standard_field(
+            field_name, model_field
+        )
+        for validator in field_kwargs.get('validators', []):
+            if isinstance(validator, UniqueValidator):
+                validator.queryset = model_field.model.all_objects.all()
+        return field_class, field_kwargs
+
+
 class RoleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Role
@@ -26,7 +48,7 @@ class UserSerializer(serializers.ModelSerializer):
         }
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SoftDeleteUniqueMixin, serializers.ModelSerializer):
     parent_name = serializers.CharField(source='parent.name', read_only=True)
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     updated_by_username = serializers.CharField(source='updated_by.username', read_only=True)
@@ -36,43 +58,173 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class EmbeddedProductImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductImage
+        fields = ['id', 'image_url', 'srcset', 'created_at']
+
+    def get_srcset(self, obj):
+        return srcset(obj.asset, self.context.get('request'))
+
+
+class ActivePromotionSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='promotion.id')
+    title = serializers.CharField(source='promotion.title')
+    slug = serializers.CharField(source='promotion.slug')
+    start_date = serializers.DateField(source='promotion.start_date')
+    end_date = serializers.DateField(source='promotion.end_date')
+
+    class Meta:
+        model = PromotionProduct
+        fields = ['id', 'title', 'slug', 'start_date', 'end_date']
+
+
+class ProductSerializer(SoftDeleteUniqueMixin, serializers.ModelSerializer):
+    """
+    Product representation.
+
+    ``images`` and ``active_promotions`` are only rendered when listed in the
+    ``include`` context, which the viewset fills from ``?include=`` and
+    prefetches for.
+    """
     category_name = serializers.CharField(source='category.name', read_only=True)
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     updated_by_username = serializers.CharField(source='updated_by.username', read_only=True)
+    effective_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, read_only=True
+    )
+    image_srcset = serializers.SerializerMethodField()
+    popularity = serializers.SerializerMethodField()
+    images = EmbeddedProductImageSerializer(
+        source='live_images', many=True, read_only=True
+    )
+    active_promotions = ActivePromotionSerializer(
+        source='active_promotion_products', many=True, read_only=True
+    )
 
     class Meta:
         model = Product
         fields = '__all__'
+        read_only_fields = ['image_asset', 'comment_count', 'view_count']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        include = self.context.get('include', ())
+        if 'images' not in include:
+            self.fields.pop('images')
+        if 'promotions' not in include:
+            self.fields.pop('active_promotions')
+
+    def update(self, instance, validated_data):
+        # Only what the request sent: stock_quantity as read earlier may be behind
+        # sales that apps.sale.inventory reconciled into it since
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'slug', 'updated_at'])
+        return instance
+
+    def get_image_srcset(self, obj):
+        return srcset(obj.image_asset, self.context.get('request'))
+
+    def get_popularity(self, obj):
+        return decayed_score(obj.popularity)
+
+
+class ProductListSerializer(ProductSerializer):
+    """
+    Product list rows: the stored ``excerpt`` instead of ``description``.
+    """
+
+    class Meta(ProductSerializer.Meta):
+        fields = None
+        exclude = ['description']
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     updated_by_username = serializers.CharField(source='updated_by.username', read_only=True)
+    srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductImage
         fields = '__all__'
+        read_only_fields = ['asset']
 
+    def get_srcset(self, obj):
+        return srcset(obj.asset, self.context.get('request'))
 
-class NewsSerializer(serializers.ModelSerializer):
+    def update(self, instance, validated_data):
+        # A new URL means new content; the asset is re-ingested in the background
+        if validated_data.get('image_url', instance.image_url) != instance.image_url:
+            validated_data['asset'] = None
+        return super().update(instance, validated_data)
+
+
+class NewsSerializer(SoftDeleteUniqueMixin, serializers.ModelSerializer):
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     updated_by_username = serializers.CharField(source='updated_by.username', read_only=True)
+    popularity = serializers.SerializerMethodField()
     
     class Meta:
         model = News
         fields = '__all__'
+        read_only_fields = ['comment_count', 'view_count']
+
+    def get_popularity(self, obj):
+        return decayed_score(obj.popularity)
+
 
+class NewsListSerializer(NewsSerializer):
+    """
+    News list rows: the stored ``excerpt`` instead of ``content``.
+    """
 
-class PromotionSerializer(serializers.ModelSerializer):
+    class Meta(NewsSerializer.Meta):
+        fields = None
+        exclude = ['content']
+
+
+class PromotionSerializer(SoftDeleteUniqueMixin, serializers.ModelSerializer):
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     updated_by_username = serializers.CharField(source='updated_by.username', read_only=True)
-    
+
     class Meta:
         model = Promotion
         fields = '__all__'
 
+    def validate(self, attrs):
+        def current(name, default=None):
+            return attrs.get(name, getattr(self.instance, name, default))
+
+        discount_type = current('discount_type', Promotion.DISCOUNT_PERCENT)
+        if (
+            discount_type == Promotion.DISCOUNT_PERCENT
+            and current('discount_value', 0) > 100
+        ):
+            raise serializers.ValidationError(
+                {'discount_value': 'A percent discount cannot exceed 100.'}
+            )
+        if discount_type == Promotion.DISCOUNT_BUNDLE and not current(
+            'bundle_quantity'
+        ):
+            raise serializers.ValidationError(
+                {'bundle_quantity': 'Bundle promotions need a bundle quantity.'}
+            )
+        return attrs
+
+
+class PromotionListSerializer(PromotionSerializer):
+    """
+    Promotion list rows: the stored ``excerpt`` instead of ``description``.
+    """
+
+    class Meta(PromotionSerializer.Meta):
+        fields = None
+        exclude = ['description']
+
 
 class CommentSerializer(serializers.ModelSerializer):
     user_username = serializers.CharField(source='user.username', read_only=True)
@@ -89,7 +241,124 @@ class PromotionProductSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     updated_by_username = serializers.CharField(source='updated_by.username', read_only=True)
-    
+
     class Meta:
         model = PromotionProduct
-        fields = '__all__' 
\ No newline at end of file
+        fields = '__all__' 
+
+    def create(self, validated_data):
+        # A soft-deleted link still holds the (promotion, product)
+        # pair; linking again revives it
+        link = PromotionProduct.all_objects.filter(
+            promotion=validated_data['promotion'],
+            product=validated_data['product'],
+            deleted_at__isnull=False,
+        ).first()
+        if link is None:
+            return super().create(validated_data)
+        validated_data['deleted_at'] = None
+        return self.update(link, validated_data)
+
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+
+    class Meta:
+        model = StockReservation
+        fields = [
+            'id',
+            'product',
+            'product_name',
+            'quantity',
+            'key',
+            'status',
+            'expires_at',
+            'created_at',
+            'updated_at',
+        ]
+        # The key comes from the Idempotency-Key header
+        read_only_fields = ['key', 'status', 'expires_at']
+
+    def validate_product(self, product):
+        if not product.is_active:
+            raise serializers.ValidationError('This product is not for sale.')
+        return product
+
+
+class StorefrontProductSerializer(serializers.ModelSerializer):
+    effective_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, read_only=True
+    )
+    image_srcset = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = [
+            'id',
+            'name',
+            'slug',
+            'price',
+            'effective_price',
+            'image_srcset',
+            'category',
+            'comment_count',
+        ]
+
+    def get_image_srcset(self, obj):
+        return srcset(obj.image_asset, self.context.get('request'))
+
+
+class TopRatedProductSerializer(StorefrontProductSerializer):
+    average_rating = serializers.FloatField(read_only=True)
+    rating_count = serializers.IntegerField(read_only=True)
+
+    class Meta(StorefrontProductSerializer.Meta):
+        fields = StorefrontProductSerializer.Meta.fields + [
+            'average_rating',
+            'rating_count',
+        ]
+
+
+class StorefrontPromotionSerializer(serializers.ModelSerializer):
+    products = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Promotion
+        fields = [
+            'id',
+            'title',
+            'slug',
+            'start_date',
+            'end_date',
+            'discount_type',
+            'discount_value',
+            'products',
+        ]
+
+    def get_products(self, obj):
+        products = [link.product for link in obj.storefront_links]
+        return StorefrontProductSerializer(
+            products, many=True, context=self.context
+        ).data
+
+
+class StorefrontNewsSerializer(serializers.ModelSerializer):
+    summary = serializers.CharField(source='excerpt', read_only=True)
+
+    class Meta:
+        model = News
+        fields = ['id', 'title', 'slug', 'summary', 'comment_count', 'created_at']
+
+
+class MenuCategorySerializer(serializers.ModelSerializer):
+    children = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'slug', 'children']
+
+    def get_children(self, obj):
+        return [
+            {'id': child.id, 'name': child.name, 'slug': child.slug}
+            for child in obj.menu_children
+        ]
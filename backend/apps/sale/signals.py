@@ -1,10 +1,28 @@
 """
 Signals for sale app.
 """
+import logging
+
 from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.core.cache import cache
-from .models import Product, News, Promotion, Comment, Category
+from django.db import transaction
+from django.db.models import Count
+from . import fragments, hotcache, inventory, push, storefront, suggest
+from .changes import record_deletion
+from .comments import adjust_comment_count, comment_page_cache_key
+from .models import (
+    Product,
+    ProductImage,
+    News,
+    Promotion,
+    Comment,
+    Category,
+    PromotionProduct,
+)
+from .softdelete import soft_deleted
+
+logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=Product)
@@ -14,14 +32,64 @@ def product_post_save(sender, instance, created, **kwargs):
     """
     # Clear product cache when product is updated
     cache.delete(f'product_{instance.id}')
+    fragments.invalidate('product', [instance.id])
     cache.delete('products_list')
-    
+
+    # New uploads are deduplicated into content-addressed assets off the request path
+    if instance.image and not instance.image.name.startswith('images/originals/'):
+        from .tasks import process_product_image
+        transaction.on_commit(lambda: process_product_image.delay(instance.id))
+
+    # A new base price changes the promotional price too
+    if not created and instance.price != getattr(instance, '_loaded_price', None):
+        from .tasks import refresh_product_prices
+        transaction.on_commit(lambda: refresh_product_prices.delay([instance.id]))
+
+    # Autocomplete only indexes these fields
+    loaded = getattr(instance, '_loaded_values', {})
+    if created or any(
+        getattr(instance, field) != loaded.get(field)
+        for field in suggest.INDEXED_FIELDS
+    ):
+        transaction.on_commit(suggest.invalidate)
+    transaction.on_commit(storefront.mark_dirty)
+
+    # Open product pages are pushed new stock and prices instead of polling for them
+    if not created:
+        changed = [
+            field
+            for field in push.PUSHED_FIELDS
+            if getattr(instance, field) != loaded.get(field)
+        ]
+        if changed:
+            update = push.product_update(instance, changed)
+            transaction.on_commit(lambda: push.publish([update]))
+
+        # Reservable units follow a new stock count at once; a
+        # no-op for products never reserved
+        if instance.stock_quantity != loaded.get('stock_quantity'):
+            inventory.rebalance(instance.id)
+
     if created:
-        # Log new product creation
-        print(f"New product created: {instance.name} (SKU: {instance.sku})")
+        logger.info(
+            f"New product created: {instance.name} (SKU: {instance.sku})",
+            extra={'product_id': instance.id},
+        )
     else:
-        # Log product update
-        print(f"Product updated: {instance.name} (SKU: {instance.sku})")
+        logger.debug(
+            f"Product updated: {instance.name} (SKU: {instance.sku})",
+            extra={'product_id': instance.id},
+        )
+
+
+@receiver(post_save, sender=ProductImage)
+def product_image_post_save(sender, instance, created, **kwargs):
+    """
+    Handle post-save events for ProductImage model.
+    """
+    if instance.image_url and instance.asset_id is None:
+        from .tasks import ingest_product_image
+        transaction.on_commit(lambda: ingest_product_image.delay(instance.id))
 
 
 @receiver(post_save, sender=Category)
@@ -31,12 +99,18 @@ def category_post_save(sender, instance, created, **kwargs):
     """
     # Clear category cache
     cache.delete(f'category_{instance.id}')
+    fragments.invalidate('category', [instance.id])
     cache.delete('categories_list')
-    
+    transaction.on_commit(storefront.mark_dirty)
+
     if created:
-        print(f"New category created: {instance.name}")
+        logger.info(
+            f"New category created: {instance.name}", extra={'category_id': instance.id}
+        )
     else:
-        print(f"Category updated: {instance.name}")
+        logger.debug(
+            f"Category updated: {instance.name}", extra={'category_id': instance.id}
+        )
 
 
 @receiver(post_save, sender=News)
@@ -46,12 +120,19 @@ def news_post_save(sender, instance, created, **kwargs):
     """
     # Clear news cache
     cache.delete(f'news_{instance.id}')
+    fragments.invalidate('news', [instance.id])
     cache.delete('news_list')
-    
+    transaction.on_commit(storefront.mark_dirty)
+
     if created:
-        print(f"New news article published: {instance.title}")
+        logger.info(
+            f"New news article published: {instance.title}",
+            extra={'news_id': instance.id},
+        )
     else:
-        print(f"News article updated: {instance.title}")
+        logger.debug(
+            f"News article updated: {instance.title}", extra={'news_id': instance.id}
+        )
 
 
 @receiver(post_save, sender=Promotion)
@@ -61,12 +142,33 @@ def promotion_post_save(sender, instance, created, **kwargs):
     """
     # Clear promotion cache
     cache.delete(f'promotion_{instance.id}')
+    fragments.invalidate('promotion', [instance.id])
     cache.delete('promotions_list')
-    
+    transaction.on_commit(storefront.mark_dirty)
+
     if created:
-        print(f"New promotion created: {instance.title}")
+        logger.info(
+            f"New promotion created: {instance.title}",
+            extra={'promotion_id': instance.id},
+        )
     else:
-        print(f"Promotion updated: {instance.title}")
+        logger.debug(
+            f"Promotion updated: {instance.title}", extra={'promotion_id': instance.id}
+        )
+
+        # Dates, rules or deletion may have changed; new promotions have no products yet
+        from .tasks import refresh_promotion_prices
+        transaction.on_commit(lambda: refresh_promotion_prices.delay(instance.id))
+
+
+@receiver(post_save, sender=PromotionProduct)
+def promotion_product_post_save(sender, instance, created, **kwargs):
+    """
+    Handle post-save events for PromotionProduct model.
+    """
+    transaction.on_commit(storefront.mark_dirty)
+    from .tasks import refresh_product_prices
+    transaction.on_commit(lambda: refresh_product_prices.delay([instance.product_id]))
 
 
 @receiver(post_save, sender=Comment)
@@ -74,15 +176,45 @@ def comment_post_save(sender, instance, created, **kwargs):
     """
     Handle post-save events for Comment model.
     """
+    live = instance.deleted_at is None
     if created:
-        # Log new comment
-        print(f"New comment by {instance.user.username} on {instance.target_type} #{instance.target_id}")
-        
-        # Clear related cache
-        cache.delete(f'{instance.target_type}_{instance.target_id}_comments')
+        # By user id: the username would cost a query on every comment
+        logger.debug(
+            f"New comment by user #{instance.user_id} "
+            f"on {instance.target_type} #{instance.target_id}",
+            extra={'comment_id': instance.id},
+        )
+
+        # Clear related cache; the first page is recomputed once, not by every reader
+        hotcache.expire(
+            [comment_page_cache_key(instance.target_type, instance.target_id)]
+        )
         cache.delete(f'{instance.target_type}_{instance.target_id}_rating')
+        adjust_comment_count(instance.target_type, instance.target_id, int(live))
     else:
-        print(f"Comment updated by {instance.user.username}")
+        logger.debug(
+            f"Comment updated by user #{instance.user_id}",
+            extra={'comment_id': instance.id},
+        )
+
+        # Edits, soft deletes and moves all change what the target's first page shows
+        hotcache.expire(
+            [comment_page_cache_key(instance.target_type, instance.target_id)]
+        )
+        cache.delete(f'{instance.target_type}_{instance.target_id}_rating')
+        old_type, old_id, was_live = getattr(
+            instance, '_loaded_target', (instance.target_type, instance.target_id, live)
+        )
+        if (old_type, old_id) != (instance.target_type, instance.target_id):
+            hotcache.expire([comment_page_cache_key(old_type, old_id)])
+            cache.delete(f'{old_type}_{old_id}_rating')
+            adjust_comment_count(old_type, old_id, -int(was_live))
+            adjust_comment_count(instance.target_type, instance.target_id, int(live))
+        else:
+            adjust_comment_count(
+                instance.target_type, instance.target_id, int(live) - int(was_live)
+            )
+    instance._loaded_target = (instance.target_type, instance.target_id, live)
 
 
 @receiver(post_delete, sender=Product)
@@ -92,8 +224,16 @@ def product_post_delete(sender, instance, **kwargs):
     """
     # Clear product cache
     cache.delete(f'product_{instance.id}')
+    fragments.invalidate('product', [instance.id])
     cache.delete('products_list')
-    print(f"Product deleted: {instance.name} (SKU: {instance.sku})")
+    cache.delete(f'product_{instance.id}_comments')
+    transaction.on_commit(suggest.invalidate)
+    record_deletion(instance)
+    transaction.on_commit(storefront.mark_dirty)
+    logger.info(
+        f"Product deleted: {instance.name} (SKU: {instance.sku})",
+        extra={'product_id': instance.id},
+    )
 
 
 @receiver(post_delete, sender=Category)
@@ -103,8 +243,13 @@ def category_post_delete(sender, instance, **kwargs):
     """
     # Clear category cache
     cache.delete(f'category_{instance.id}')
+    fragments.invalidate('category', [instance.id])
     cache.delete('categories_list')
-    print(f"Category deleted: {instance.name}")
+    record_deletion(instance)
+    transaction.on_commit(storefront.mark_dirty)
+    logger.info(
+        f"Category deleted: {instance.name}", extra={'category_id': instance.id}
+    )
 
 
 @receiver(post_delete, sender=News)
@@ -114,8 +259,14 @@ def news_post_delete(sender, instance, **kwargs):
     """
     # Clear news cache
     cache.delete(f'news_{instance.id}')
+    fragments.invalidate('news', [instance.id])
     cache.delete('news_list')
-    print(f"News article deleted: {instance.title}")
+    cache.delete(f'news_{instance.id}_comments')
+    record_deletion(instance)
+    transaction.on_commit(storefront.mark_dirty)
+    logger.info(
+        f"News article deleted: {instance.title}", extra={'news_id': instance.id}
+    )
 
 
 @receiver(post_delete, sender=Promotion)
@@ -125,8 +276,23 @@ def promotion_post_delete(sender, instance, **kwargs):
     """
     # Clear promotion cache
     cache.delete(f'promotion_{instance.id}')
+    fragments.invalidate('promotion', [instance.id])
     cache.delete('promotions_list')
-    print(f"Promotion deleted: {instance.title}")
+    record_deletion(instance)
+    transaction.on_commit(storefront.mark_dirty)
+    logger.info(
+        f"Promotion deleted: {instance.title}", extra={'promotion_id': instance.id}
+    )
+
+
+@receiver(post_delete, sender=PromotionProduct)
+def promotion_product_post_delete(sender, instance, **kwargs):
+    """
+    Handle post-delete events for PromotionProduct model.
+    """
+    transaction.on_commit(storefront.mark_dirty)
+    from .tasks import refresh_product_prices
+    transaction.on_commit(lambda: refresh_product_prices.delay([instance.product_id]))
 
 
 @receiver(post_delete, sender=Comment)
@@ -135,6 +301,62 @@ def comment_post_delete(sender, instance, **kwargs):
     Handle post-delete events for Comment model.
     """
     # Clear related cache
-    cache.delete(f'{instance.target_type}_{instance.target_id}_comments')
+    hotcache.expire([comment_page_cache_key(instance.target_type, instance.target_id)])
     cache.delete(f'{instance.target_type}_{instance.target_id}_rating')
-    print(f"Comment deleted by {instance.user.username}") 
\ No newline at end of file
+    _, _, was_live = getattr(
+        instance, '_loaded_target', (None, None, instance.deleted_at is None)
+    )
+    adjust_comment_count(instance.target_type, instance.target_id, -int(was_live))
+    logger.info(
+        f"Comment deleted by user #{instance.user_id}",
+        extra={'comment_id': instance.id},
+    )
+
+
+@receiver(soft_deleted)
+def rows_soft_deleted(sender, pks, cascaded=True, **kwargs):
+    """
+    Handle rows soft-deleted in bulk, which skip the save signals.
+    """
+    model_name = sender._meta.model_name
+    cache.delete_many([f'{model_name}_{pk}' for pk in pks])
+    fragments.invalidate(model_name, pks)
+    if sender in (Product, News):
+        cache.delete_many([f'{model_name}_{pk}_comments' for pk in pks])
+    if sender is Product:
+        transaction.on_commit(suggest.invalidate)
+    transaction.on_commit(storefront.mark_dirty)
+    if cascaded:
+        # Their parent is gone too, so its counters and prices no longer matter
+        return
+
+    # What the save signals would have done for rows
+    # deleted directly, e.g. from the admin
+    if sender is Comment:
+        targets = Comment.all_objects.filter(pk__in=pks).order_by().values(
+            'target_type', 'target_id'
+        ).annotate(total=Count('id'))
+        for target in targets:
+            hotcache.expire(
+                [comment_page_cache_key(target['target_type'], target['target_id'])]
+            )
+            cache.delete(f"{target['target_type']}_{target['target_id']}_rating")
+            adjust_comment_count(
+                target['target_type'], target['target_id'], -target['total']
+            )
+    elif sender is PromotionProduct:
+        from .tasks import refresh_product_prices
+        product_ids = list(
+            PromotionProduct.all_objects.filter(pk__in=pks).values_list(
+                'product_id', flat=True
+            )
+        )
+        transaction.on_commit(lambda: refresh_product_prices.delay(product_ids))
+    elif sender is Promotion:
+        from .tasks import refresh_promotion_prices
+        for pk in pks:
+            transaction.on_commit(lambda pk=pk: refresh_promotion_prices.delay(pk))
+    logger.info(
+        f"{len(pks)} {sender._meta.verbose_name_plural} soft-deleted",
+        extra={'model': model_name},
+    )
@@ -0,0 +1,234 @@
+"""
+Soft deletes and archival of deleted rows.
+
+``soft_delete`` stamps ``deleted_at`` on an object and, in the same
+transaction, on every row that ``on_delete=CASCADE`` would have taken with
+it (plus the comments on products and news). The default managers hide those
+rows at once, and ``updated_at`` moves with them so the change feeds report
+them as deleted.
+
+``archive`` later copies rows deleted more than ``SOFT_DELETE_RETENTION_DAYS``
+ago into ``ArchivedRow`` and removes them from their tables, one short
+transaction per ``SOFT_DELETE_ARCHIVE_BATCH_SIZE`` rows, so hot tables and
+their indexes stay sized to live data.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Exists, OuterRef
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .comments import COMMENT_TARGETS
+from .models import (
+    ArchivedRow,
+    Category,
+    Comment,
+    News,
+    Product,
+    ProductImage,
+    Promotion,
+    PromotionProduct,
+)
+
+# Sent with ``pks`` when rows of ``sender`` were soft-deleted in bulk, which fires no
+# save signals. ``cascaded`` is true for rows that only went with a deleted parent.
+soft_deleted = Signal()
+
+# Children before their parents, so a batch rarely waits on
+# a row archived later in the run
+ARCHIVE_ORDER = (
+    Comment,
+    PromotionProduct,
+    ProductImage,
+    Product,
+    News,
+    Promotion,
+    Category,
+)
+
+SOFT_DELETE_MODELS = frozenset(ARCHIVE_ORDER)
+
+UPDATE_BATCH_SIZE = 1000
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _reverse_relations(model):
+    """
+    Foreign keys pointing at ``model``, including ones without a reverse accessor.
+    """
+    return [
+        field
+        for field in model._meta.get_fields(include_hidden=True)
+        if field.auto_created
+        and not field.concrete
+        and (field.one_to_many or field.one_to_one)
+    ]
+
+
+def _mark(model, pks, when, cascaded=True):
+    for batch in _chunks(pks, UPDATE_BATCH_SIZE):
+        model.objects.filter(pk__in=batch).update(deleted_at=when, updated_at=when)
+    soft_deleted.send(sender=model, pks=pks, cascaded=cascaded)
+
+
+def _cascade(model, pks, when):
+    """
+    Soft-delete the live rows that depend on ``pks`` of ``model``, deepest first.
+    """
+    dependants = [
+        (relation.related_model, relation.field.name)
+        for relation in _reverse_relations(model)
+        if relation.related_model in SOFT_DELETE_MODELS
+        and relation.on_delete is models.CASCADE
+    ]
+    target_type = next(
+        (name for name, target in COMMENT_TARGETS.items() if target is model), None
+    )
+
+    for child, field_name in dependants:
+        child_pks = []
+        for batch in _chunks(pks, UPDATE_BATCH_SIZE):
+            child_pks += child.objects.filter(
+                **{f'{field_name}__in': batch}
+            ).values_list('pk', flat=True)
+        if child_pks:
+            _cascade(child, child_pks, when)
+            _mark(child, child_pks, when)
+
+    if target_type is not None:
+        comment_pks = []
+        for batch in _chunks(pks, UPDATE_BATCH_SIZE):
+            comment_pks += Comment.objects.filter(
+                target_type=target_type, target_id__in=batch
+            ).values_list('pk', flat=True)
+        if comment_pks:
+            _mark(Comment, comment_pks, when)
+
+
+def soft_delete(instance, when=None):
+    """
+    Mark ``instance`` and everything that depends on it as deleted.
+    """
+    when = when or timezone.now()
+    with transaction.atomic():
+        _cascade(type(instance), [instance.pk], when)
+        instance.deleted_at = when
+        # Saved last so its signals see the dependants already gone
+        instance.save(update_fields=['deleted_at', 'updated_at'])
+
+
+def soft_delete_many(queryset, when=None):
+    """
+    Mark the live rows of ``queryset`` and everything that depends on them as deleted.
+
+    One UPDATE per batch instead of a save per row, so no save signals fire;
+    ``soft_deleted`` is sent for the rows instead. Returns how many rows of
+    ``queryset`` were deleted.
+    """
+    model = queryset.model
+    when = when or timezone.now()
+    with transaction.atomic():
+        pks = list(
+            queryset.filter(deleted_at__isnull=True).values_list('pk', flat=True)
+        )
+        if pks:
+            _cascade(model, pks, when)
+            _mark(model, pks, when, cascaded=False)
+    return len(pks)
+
+
+def _archive_batch(model, cutoff, batch_size):
+    """
+    Archive and remove up to ``batch_size`` rows of ``model``; returns how many.
+    """
+    candidates = model.all_objects.filter(deleted_at__lt=cutoff)
+    blockers = [
+        relation
+        for relation in _reverse_relations(model)
+        if relation.related_model in SOFT_DELETE_MODELS
+    ]
+    for relation in blockers:
+        # Still referenced, e.g. a category whose child
+        # category has not been archived yet
+        candidates = candidates.exclude(
+            Exists(
+                relation.related_model._base_manager.filter(
+                    **{relation.field.name: OuterRef('pk')}
+                )
+            )
+        )
+
+    with transaction.atomic():
+        # Locked and re-checked, so a row restored meanwhile is left alone
+        rows = list(
+            candidates.select_for_update().order_by('deleted_at').values()[:batch_size]
+        )
+        if not rows:
+            return 0
+        pks = [row['id'] for row in rows]
+        label = model._meta.label_lower
+        ArchivedRow.objects.bulk_create(
+            [
+                ArchivedRow(
+                    model=label,
+                    object_id=row['id'],
+                    data=row,
+                    deleted_at=row['deleted_at'],
+                )
+                for row in rows
+            ]
+        )
+
+        # Derived rows (effective prices, recommendations)
+        # go with the row or let go of it
+        for relation in _reverse_relations(model):
+            if relation.related_model in SOFT_DELETE_MODELS:
+                continue
+            dependants = relation.related_model._base_manager.filter(
+                **{f'{relation.field.name}__in': pks}
+            )
+            if relation.on_delete is models.SET_NULL:
+                dependants.update(**{relation.field.name: None})
+            else:
+                dependants.delete()
+
+        # Plain DELETE: the rows are archived, and delete()
+        # would collect and signal per row
+        quote = connection.ops.quote_name
+        placeholders = ', '.join(['%s'] * len(pks))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(model._meta.db_table)} WHERE '
+                f'{quote(model._meta.pk.column)} IN ({placeholders})',
+                pks,
+            )
+    return len(pks)
+
+
+def archive(now=None):
+    """
+    Move rows deleted more than ``SOFT_DELETE_RETENTION_DAYS`` ago to the archive.
+
+    Returns the number of rows archived per model label.
+    """
+    cutoff = (now or timezone.now()) - timedelta(
+        days=settings.SOFT_DELETE_RETENTION_DAYS
+    )
+    archived = {}
+    for model in ARCHIVE_ORDER:
+        total = 0
+        while True:
+            count = _archive_batch(
+                model, cutoff, settings.SOFT_DELETE_ARCHIVE_BATCH_SIZE
+            )
+            if not count:
+                break
+            total += count
+        archived[model._meta.label_lower] = total
+    return archived
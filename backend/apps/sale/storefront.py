@@ -0,0 +1,192 @@
+"""
+Pre-rendered storefront (home page) document.
+
+The document bundles the latest news, running promotions with some of their
+products, featured and top-rated products and the category menu. It is
+rendered to JSON once and kept in the cache with its ETag, so serving it is a
+single cache read. Saves and deletes of the models it shows, and price refreshes, only
+mark
+it dirty; the ``refresh_storefront`` beat task re-renders it within
+``STOREFRONT_REFRESH_INTERVAL`` seconds, off the request path. A document
+rendered on an earlier day counts as dirty too.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Prefetch
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from . import hotcache
+from .models import Category, Comment, News, Product, Promotion, PromotionProduct
+from .serializers import (
+    MenuCategorySerializer, StorefrontNewsSerializer, StorefrontProductSerializer,
+    StorefrontPromotionSerializer, TopRatedProductSerializer
+)
+
+DOCUMENT_CACHE_KEY = 'storefront_document'
+DIRTY_CACHE_KEY = 'storefront_dirty'
+TOP_RATED_CACHE_KEY = 'storefront_top_rated'
+
+
+def _live_products():
+    return Product.objects.filter(
+        is_active=True, deleted_at__isnull=True
+    ).select_related('image_asset', 'effective').defer('description', 'excerpt')
+
+
+def _top_rated_ranking():
+    return list(
+        Comment.objects.filter(
+            target_type='product', deleted_at__isnull=True, rating__isnull=False
+        )
+        .values('target_id')
+        .annotate(average_rating=Avg('rating'), rating_count=Count('id'))
+        .filter(rating_count__gte=settings.STOREFRONT_MIN_RATINGS)
+        .order_by('-average_rating', '-rating_count', 'target_id')
+        .values_list('target_id', 'average_rating', 'rating_count')[
+            : settings.STOREFRONT_TOP_RATED_COUNT * 2
+        ]
+    )
+
+
+def top_rated_products():
+    """
+    Best average ratings among products with at least ``STOREFRONT_MIN_RATINGS``
+    ratings.
+
+    This is the one aggregate over all comments, so it is cached for
+    ``STOREFRONT_TOP_RATED_TIMEOUT`` instead of being redone on every rebuild.
+    """
+    ranking = hotcache.get_or_compute(
+        TOP_RATED_CACHE_KEY, _top_rated_ranking, settings.STOREFRONT_TOP_RATED_TIMEOUT
+    )
+
+    products = _live_products().in_bulk([product_id for product_id, _, _ in ranking])
+    rated = []
+    for product_id, average_rating, rating_count in ranking:
+        product = products.get(product_id)
+        if product is not None:
+            product.average_rating = round(average_rating, 2)
+            product.rating_count = rating_count
+            rated.append(product)
+    return rated[:settings.STOREFRONT_TOP_RATED_COUNT]
+
+
+def build_document(today=None):
+    """
+    The storefront data as plain Python structures.
+    """
+    today = today or timezone.localdate()
+    context = {'request': None}
+
+    news = News.objects.filter(
+        deleted_at__isnull=True
+    ).defer('content').order_by('-created_at')[:settings.STOREFRONT_NEWS_COUNT]
+
+    links = (
+        PromotionProduct.objects.filter(
+            deleted_at__isnull=True,
+            product__is_active=True,
+            product__deleted_at__isnull=True,
+        )
+        .select_related('product__image_asset', 'product__effective')
+        .defer('product__description', 'product__excerpt')
+        .order_by('-product__popularity', 'id')
+    )
+    promotions = (
+        Promotion.objects.filter(
+            deleted_at__isnull=True, start_date__lte=today, end_date__gte=today
+        )
+        .defer('description', 'excerpt')
+        .order_by('-priority', 'end_date', 'id')
+        .prefetch_related(
+            Prefetch(
+                'promotion_products',
+                queryset=links[: settings.STOREFRONT_PROMOTION_PRODUCT_COUNT],
+                to_attr='storefront_links',
+            )
+        )[: settings.STOREFRONT_PROMOTION_COUNT]
+    )
+
+    featured = _live_products().order_by('-popularity', 'id')[
+        : settings.STOREFRONT_FEATURED_COUNT
+    ]
+
+    menu = (
+        Category.objects.filter(parent__isnull=True, deleted_at__isnull=True)
+        .order_by('name')
+        .prefetch_related(
+            Prefetch(
+                'children',
+                queryset=Category.objects.filter(deleted_at__isnull=True).order_by(
+                    'name'
+                ),
+                to_attr='menu_children',
+            )
+        )
+    )
+
+    return {
+        'generated_at': timezone.now(),
+        'news': StorefrontNewsSerializer(news, many=True, context=context).data,
+        'promotions': StorefrontPromotionSerializer(
+            promotions, many=True, context=context
+        ).data,
+        'featured_products': StorefrontProductSerializer(
+            featured, many=True, context=context
+        ).data,
+        'top_rated_products': TopRatedProductSerializer(
+            top_rated_products(), many=True, context=context
+        ).data,
+        'categories': MenuCategorySerializer(menu, many=True, context=context).data,
+    }
+
+
+def render():
+    """
+    Rebuild, render and cache the document; returns ``{'body', 'etag'}``.
+    """
+    # Cleared first so changes made while rendering trigger another rebuild
+    cache.delete(DIRTY_CACHE_KEY)
+    today = timezone.localdate()
+    body = JSONRenderer().render(build_document(today))
+    document = {
+        'body': body,
+        'etag': f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        'date': today,
+    }
+    cache.set(DOCUMENT_CACHE_KEY, document, None)
+    return document
+
+
+def get_document():
+    """
+    The cached document, rendered on the spot only if the cache lost it.
+    """
+    document = cache.get(DOCUMENT_CACHE_KEY)
+    if document is None:
+        document = render()
+    return document
+
+
+def mark_dirty():
+    cache.set(DIRTY_CACHE_KEY, True, None)
+
+
+def refresh():
+    """
+    Re-render the document if something it shows changed; returns whether it did.
+    """
+    document = cache.get(DOCUMENT_CACHE_KEY)
+    # Promotion windows open and close at midnight without any
+    # save to mark the document dirty
+    if (
+        cache.get(DIRTY_CACHE_KEY)
+        or document is None
+        or document.get('date') != timezone.localdate()
+    ):
+        render()
+        return True
+    return False
@@ -0,0 +1,259 @@
+"""
+In-memory prefix index for product autocomplete.
+
+Each worker keeps a sorted list of lowercase keys (the product name, every
+word-start suffix of the name, the SKU and the slug) so a prefix lookup is
+two binary searches. The best products for every prefix shared by more than
+``SCAN_LIMIT`` keys (and every prefix of up to ``PRECOMPUTED_PREFIX_LENGTH``
+characters) are worked out when the index is built, so no request ranks more
+than ``SCAN_LIMIT`` keys.
+
+Product saves and deletes bump a version in the shared cache; workers check
+it at most every ``PRODUCT_SUGGEST_CHECK_INTERVAL`` seconds and rebuild in
+the background while they keep answering from the previous index.
+"""
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_KEY = 'product_suggest_version'
+
+PRECOMPUTED_PREFIX_LENGTH = 3
+
+# Longer prefixes are precomputed too while more keys than this share them
+SCAN_LIMIT = 1000
+
+# Product fields whose changes make the index stale
+INDEXED_FIELDS = ('name', 'sku', 'slug', 'is_active', 'deleted_at')
+
+KIND_NAME = 0
+KIND_SKU = 1
+KIND_SLUG = 2
+KINDS = ('name', 'sku', 'slug')
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def _name_keys(name):
+    words = name.split(' ')
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+class SuggestIndex:
+    """
+    Sorted prefix keys over the most popular active products.
+    """
+
+    def __init__(self, rows, max_results):
+        self.max_results = max_results
+        self.ids = array('q')
+        self.names = []
+        self.skus = []
+        self.slugs = []
+
+        entries = []
+        for position, (product_id, name, sku, slug) in enumerate(rows):
+            self.ids.append(product_id)
+            self.names.append(name)
+            self.skus.append(sku)
+            self.slugs.append(slug)
+            name_key = normalize(name)
+            for key in _name_keys(name_key):
+                entries.append((key, KIND_NAME, position))
+            entries.append((sku.lower(), KIND_SKU, position))
+            slug_key = slug.lower()
+            if slug_key.replace('-', ' ') != name_key:
+                entries.append((slug_key, KIND_SLUG, position))
+        entries.sort()
+
+        self.keys = [key for key, _, _ in entries]
+        self.kinds = array('b', [kind for _, kind, _ in entries])
+        self.owners = array('l', [position for _, _, position in entries])
+        # Rows arrive most popular first, so position order is popularity order;
+        # name matches rank ahead of SKU/slug matches of the same product
+        self.ranks = array(
+            'q', [position * len(KINDS) + kind for _, kind, position in entries]
+        )
+
+        self.top = {}
+        self._precompute('', 0, len(self.keys))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _precompute(self, prefix, low, high):
+        """
+        Store the best entries of every prefix whose key range is too long to scan per
+        request.
+        """
+        if prefix:
+            self.top[prefix] = self._best(range(low, high), self.max_results)
+        length = len(prefix) + 1
+        position = low
+        while position < high:
+            child = self.keys[position][:length]
+            end = bisect_left(self.keys, child + '\uffff', position, high)
+            if len(child) == length and (
+                length <= PRECOMPUTED_PREFIX_LENGTH or end - position > SCAN_LIMIT
+            ):
+                self._precompute(child, position, end)
+            position = end
+
+    def _best(self, entries, limit):
+        """
+        Best ``limit`` entries, one per product.
+        """
+        rank = self.ranks.__getitem__
+        if len(entries) > limit * 4:
+            candidates = heapq.nsmallest(limit * 4, entries, key=rank)
+        else:
+            candidates = sorted(entries, key=rank)
+        best = self._distinct(candidates, limit)
+        if len(best) < limit and len(candidates) < len(entries):
+            best = self._distinct(sorted(entries, key=rank), limit)
+        return best
+
+    def _distinct(self, entries, limit):
+        seen = set()
+        best = []
+        for entry in entries:
+            position = self.owners[entry]
+            if position not in seen:
+                seen.add(position)
+                best.append(entry)
+                if len(best) == limit:
+                    break
+        return best
+
+    def search(self, query, limit):
+        """
+        Up to ``limit`` suggestions for a query prefix.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        limit = min(limit, self.max_results)
+        if prefix in self.top:
+            entries = self.top[prefix][:limit]
+        else:
+            # Not precomputed, so at most SCAN_LIMIT keys share this prefix
+            low = bisect_left(self.keys, prefix)
+            high = bisect_left(self.keys, prefix + '\uffff', low)
+            entries = self._best(range(low, high), limit)
+
+        return [
+            {
+                'id': self.ids[self.owners[entry]],
+                'name': self.names[self.owners[entry]],
+                'sku': self.skus[self.owners[entry]],
+                'slug': self.slugs[self.owners[entry]],
+                'match': KINDS[self.kinds[entry]],
+            }
+            for entry in entries
+        ]
+
+
+def build():
+    """
+    Build an index over the ``PRODUCT_SUGGEST_INDEX_SIZE`` most popular active products.
+    """
+    rows = Product.objects.filter(
+        is_active=True, deleted_at__isnull=True
+    ).order_by('-popularity', '-comment_count', 'id').values_list(
+        'id', 'name', 'sku', 'slug'
+    )[:settings.PRODUCT_SUGGEST_INDEX_SIZE]
+    return SuggestIndex(
+        rows.iterator(chunk_size=5000), settings.PRODUCT_SUGGEST_MAX_RESULTS
+    )
+
+
+class _State:
+    index = None
+    version = None
+    checked_at = 0.0
+    rebuilding = False
+
+
+_state = _State()
+_lock = threading.Lock()
+
+
+def _current_version():
+    return cache.get(VERSION_CACHE_KEY, 0)
+
+
+def _rebuild(version):
+    try:
+        started = time.monotonic()
+        index = build()
+        _state.index, _state.version = index, version
+        logger.info(
+            f'Built product suggest index: {len(index)} products '
+            f'in {time.monotonic() - started:.2f}s'
+        )
+    except Exception as exc:
+        logger.error(f'Product suggest index rebuild failed: {exc}')
+    finally:
+        _state.rebuilding = False
+
+
+def _rebuild_in_background(version):
+    try:
+        _rebuild(version)
+    finally:
+        connection.close()
+
+
+def warm_up():
+    """
+    Build this worker's index now, e.g. at boot before taking traffic.
+    """
+    with _lock:
+        _state.checked_at = time.monotonic()
+        _rebuild(_current_version())
+    return _state.index
+
+
+def get_index():
+    """
+    This worker's index, refreshed in the background when products changed.
+    """
+    if _state.index is None:
+        with _lock:
+            if _state.index is None:
+                _state.checked_at = time.monotonic()
+                _rebuild(_current_version())
+        return _state.index
+
+    now = time.monotonic()
+    if now - _state.checked_at >= settings.PRODUCT_SUGGEST_CHECK_INTERVAL:
+        _state.checked_at = now
+        version = _current_version()
+        if version != _state.version and not _state.rebuilding:
+            with _lock:
+                if not _state.rebuilding:
+                    _state.rebuilding = True
+                    threading.Thread(
+                        target=_rebuild_in_background, args=(version,), daemon=True
+                    ).start()
+    return _state.index
+
+
+def invalidate():
+    """
+    Mark every worker's index as stale.
+    """
+    cache.set(VERSION_CACHE_KEY, time.time(), None)
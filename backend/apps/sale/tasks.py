@@ -1,19 +1,41 @@
 """
 Celery tasks for sale app.
+
+Queues are assigned by ``CELERY_TASK_ROUTES``. Tasks whose return value
+nobody reads set ``ignore_result``. Idempotent tasks set ``acks_late``, so the
+job of a crashed worker is delivered again; mail tasks do not, because a
+second delivery would send the mail twice.
 """
 import logging
 from celery import shared_task
 from django.core.mail import send_mail
+from django.core.files.storage import default_storage
 from django.conf import settings
-from .models import Product
+
+from myproject.db_router import use_replicas
+from . import (
+    changes,
+    facets,
+    hotcache,
+    images,
+    inventory,
+    popularity,
+    pricing,
+    softdelete,
+    storefront,
+)
+from .models import Product, ProductImage, ImageAsset
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task
+@shared_task(ignore_result=True, soft_time_limit=120, time_limit=180)
+@use_replicas()
 def check_low_stock_products():
     """
     Check for products with low stock and send notification.
+
+    Read-only, so its queries are served from a replica when one is healthy.
     """
     try:
         low_stock_threshold = 10
@@ -56,7 +78,7 @@ def check_low_stock_products():
         return False
 
 
-@shared_task
+@shared_task(ignore_result=True, rate_limit='60/m', soft_time_limit=30, time_limit=60)
 def send_new_product_notification(product_id):
     """
     Send notification when a new product is added.
@@ -104,7 +126,7 @@ def send_new_product_notification(product_id):
         return False
 
 
-@shared_task
+@shared_task(ignore_result=True, rate_limit='60/m', soft_time_limit=30, time_limit=60)
 def send_product_update_notification(product_id):
     """
     Send notification when a product is updated.
@@ -149,4 +171,295 @@ def send_product_update_notification(product_id):
         return False
     except Exception as e:
         logger.error(f"Failed to send product update notification: {e}")
-        return False 
\ No newline at end of file
+        return False
+
+
+@shared_task(ignore_result=True, acks_late=True, soft_time_limit=60, time_limit=90)
+def process_product_image(product_id):
+    """
+    Deduplicate a product's uploaded image into a content-addressed asset.
+    """
+    try:
+        product = Product.objects.get(id=product_id)
+        if not product.image:
+            return False
+
+        uploaded = product.image.name
+        data = images.read_source(uploaded, settings.IMAGE_MAX_BYTES)
+        asset = images.ingest(data, uploaded)
+
+        # update() so the product's post_save handlers do not fire again
+        Product.objects.filter(id=product_id).update(
+            image=asset.original.name, image_asset=asset
+        )
+        if uploaded != asset.original.name:
+            default_storage.delete(uploaded)
+
+        logger.info(f"Product #{product_id} image stored as asset {asset.sha256}")
+        return True
+
+    except Product.DoesNotExist:
+        logger.error(f"Product #{product_id} not found")
+        return False
+    except Exception as e:
+        logger.error(f"Failed to process image for product #{product_id}: {e}")
+        return False
+
+
+@shared_task(ignore_result=True, acks_late=True, soft_time_limit=60, time_limit=90)
+def ingest_product_image(product_image_id):
+    """
+    Fetch a product image by its URL and link it to a deduplicated asset.
+    """
+    try:
+        product_image = ProductImage.objects.get(id=product_image_id)
+        data = images.read_source(product_image.image_url, settings.IMAGE_MAX_BYTES)
+        asset = images.ingest(data, product_image.image_url)
+        ProductImage.objects.filter(id=product_image_id).update(asset=asset)
+
+        logger.info(f"Product image #{product_image_id} linked to asset {asset.sha256}")
+        return True
+
+    except ProductImage.DoesNotExist:
+        logger.error(f"Product image #{product_image_id} not found")
+        return False
+    except Exception as e:
+        logger.error(f"Failed to ingest product image #{product_image_id}: {e}")
+        return False
+
+
+@shared_task(ignore_result=True, acks_late=True, soft_time_limit=30, time_limit=60)
+def generate_image_variant(digest, width, fmt):
+    """
+    Render one resized/re-encoded variant of an image asset.
+    """
+    try:
+        asset = ImageAsset.objects.get(sha256=digest)
+        images.render_variant(asset, width, fmt)
+
+        logger.info(f"Generated {width}w {fmt} variant of asset {digest}")
+        return True
+
+    except ImageAsset.DoesNotExist:
+        logger.error(f"Image asset {digest} not found")
+        return False
+    except Exception as e:
+        logger.error(
+            f"Failed to generate {width}w {fmt} variant of asset {digest}: {e}"
+        )
+        return False
+
+
+@shared_task(ignore_result=True, acks_late=True, soft_time_limit=60, time_limit=90)
+def refresh_product_prices(product_ids):
+    """
+    Recompute effective prices for the given products.
+    """
+    try:
+        priced = pricing.refresh(product_ids)
+        logger.info(
+            f"Refreshed effective prices for {len(product_ids)} products "
+            f"({priced} on promotion)"
+        )
+        return True
+
+    except Exception as e:
+        logger.error(
+            f"Failed to refresh effective prices for products {product_ids}: {e}"
+        )
+        return False
+
+
+@shared_task(ignore_result=True, acks_late=True, soft_time_limit=600, time_limit=660)
+def refresh_promotion_prices(promotion_id):
+    """
+    Recompute effective prices for every product linked to a promotion.
+    """
+    try:
+        priced = pricing.refresh_promotion(promotion_id)
+        logger.info(
+            f"Refreshed effective prices for promotion #{promotion_id} "
+            f"({priced} on promotion)"
+        )
+        return True
+
+    except Exception as e:
+        logger.error(
+            f"Failed to refresh effective prices for promotion #{promotion_id}: {e}"
+        )
+        return False
+
+
+@shared_task(acks_late=True, soft_time_limit=1800, time_limit=1860)
+def refresh_price_boundaries(days=1):
+    """
+    Recompute effective prices for promotions that started or ended since the last run.
+
+    Scheduled by Celery beat just after midnight.
+    """
+    try:
+        priced = pricing.refresh_boundaries(days=days)
+        logger.info(
+            "Refreshed effective prices at promotion boundaries "
+            f"({priced} on promotion)"
+        )
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to refresh effective prices at promotion boundaries: {e}")
+        return False
+
+
+@shared_task(ignore_result=True, acks_late=True, soft_time_limit=50, time_limit=60)
+def refresh_product_facets():
+    """
+    Rebuild the cached per-category facet summary.
+
+    Reads the primary: a lagging replica would cache counts from before the
+    changes that made this refresh due.
+    """
+    try:
+        rows = facets.build_summary()
+        logger.info(f"Refreshed product facet summary ({len(rows)} groups)")
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to refresh product facet summary: {e}")
+        return False
+
+
+@shared_task(ignore_result=True, acks_late=True, soft_time_limit=30, time_limit=60)
+def warm_cache(keys):
+    """
+    Recompute hot cache keys right after they were invalidated, before readers miss
+    them.
+
+    Reads the primary: a lagging replica would cache the data the write replaced.
+    """
+    try:
+        refreshed = hotcache.warm(keys)
+        logger.debug(f"Warmed {refreshed} of {len(keys)} cache keys")
+        return refreshed
+
+    except Exception as e:
+        logger.error(f"Failed to warm cache keys {keys}: {e}")
+        return 0
+
+
+@shared_task(ignore_result=True, acks_late=True, soft_time_limit=25, time_limit=30)
+def flush_popularity(entries=None):
+    """
+    Write buffered view/sale counts to product and news popularity scores.
+
+    ``entries`` are the counts a web process without Redis handed over
+    from its in-memory buffer.
+    """
+    try:
+        updated = popularity.flush(entries=entries)
+        logger.info(f"Flushed popularity counters for {updated} rows")
+        return updated
+
+    except Exception as e:
+        logger.error(f"Failed to flush popularity counters: {e}")
+        return 0
+
+
+@shared_task(acks_late=True, soft_time_limit=3600, time_limit=3660)
+def build_related_products():
+    """
+    Recompute "customers also liked" neighbours for every active product.
+    """
+    # numpy and scipy are only needed here; web processes
+    # import this module for .delay()
+    from . import recommendations
+
+    try:
+        stored = recommendations.build()
+        logger.info(f"Built {stored} related product rows")
+        return stored
+
+    except Exception as e:
+        logger.error(f"Failed to build related products: {e}")
+        return 0
+
+
+@shared_task(acks_late=True, soft_time_limit=600, time_limit=660)
+def purge_tombstones():
+    """
+    Delete change-feed tombstones past their retention period.
+    """
+    try:
+        deleted = changes.purge_tombstones()
+        logger.info(f"Purged {deleted} change feed tombstones")
+        return deleted
+
+    except Exception as e:
+        logger.error(f"Failed to purge change feed tombstones: {e}")
+        return 0
+
+
+@shared_task(acks_late=True, soft_time_limit=1800, time_limit=1860)
+def archive_deleted_rows():
+    """
+    Move soft-deleted rows past their retention period into the archive table.
+    """
+    try:
+        archived = softdelete.archive()
+        logger.info(f"Archived soft-deleted rows: {archived}")
+        return archived
+
+    except Exception as e:
+        logger.error(f"Failed to archive soft-deleted rows: {e}")
+        return {}
+
+
+@shared_task(ignore_result=True, acks_late=True, soft_time_limit=30, time_limit=60)
+def refresh_storefront():
+    """
+    Re-render the storefront document if the catalog changed since the last render.
+
+    Reads the primary: the dirty flag is cleared before rendering, so a
+    change a lagging replica had not applied yet would stay missing from
+    the cached document until the next unrelated write.
+    """
+    try:
+        refreshed = storefront.refresh()
+        if refreshed:
+            logger.info("Refreshed storefront document")
+        return refreshed
+
+    except Exception as e:
+        logger.error(f"Failed to refresh storefront document: {e}")
+        return False
+
+
+@shared_task(ignore_result=True, acks_late=True, soft_time_limit=30, time_limit=60)
+def expire_stock_holds():
+    """
+    Expire checkout holds past their TTL and give their units back.
+    """
+    try:
+        expired = inventory.expire_holds()
+        if expired:
+            logger.info(f"Expired {expired} stock holds")
+        return expired
+
+    except Exception as e:
+        logger.error(f"Failed to expire stock holds: {e}")
+        return 0
+
+
+@shared_task(ignore_result=True, acks_late=True, soft_time_limit=30, time_limit=60)
+def reconcile_stock():
+    """
+    Take committed reservations off product stock counts.
+    """
+    try:
+        updated = inventory.reconcile()
+        if updated:
+            logger.info(f"Reconciled stock of {updated} products")
+        return updated
+
+    except Exception as e:
+        logger.error(f"Failed to reconcile stock: {e}")
+        return 0
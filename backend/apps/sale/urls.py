@@ -1,10 +1,12 @@
 """
 URL configuration for sale app.
 """
-from django.urls import include, path
+from django.conf import settings
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
 from . import views
+from .async_views import async_urlpatterns
 
 app_name = 'sale'
 
@@ -18,8 +20,22 @@ router.register(r'news', views.NewsViewSet)
 router.register(r'promotions', views.PromotionViewSet)
 router.register(r'comments', views.CommentViewSet)
 router.register(r'promotion-products', views.PromotionProductViewSet)
+router.register(r'reservations', views.StockReservationViewSet, basename='reservation')
 
 urlpatterns = [
     path('health/', views.health_check, name='health_check'),
+    path('storefront/', views.storefront_page, name='storefront'),
+    re_path(
+        r'^images/(?P<digest>[0-9a-f]{64})/(?P<width>\d+)\.(?P<fmt>avif|webp|jpeg)$',
+        views.image_variant,
+        name='image_variant',
+    ),
+]
+
+# Async list/retrieve in front of the router when served over ASGI
+if settings.ASYNC_SERVING:
+    urlpatterns += async_urlpatterns(router)
+
+urlpatterns += [
     path('', include(router.urls)),
-] 
\ No newline at end of file
+]
@@ -1,16 +1,77 @@
 """
 Views for sale app.
 """
-from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view, permission_classes
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import F, Prefetch, Value
+from django.db.models.functions import Least
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    HttpResponseRedirect,
+)
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import mixins, viewsets, status
+from rest_framework.decorators import (
+    action,
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
+from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from .models import Category, Product, Role, User, ProductImage, News, Promotion, Comment, PromotionProduct
+from . import (
+    changes,
+    comments,
+    facets,
+    fragments,
+    hotcache,
+    images,
+    inventory,
+    popularity,
+    softdelete,
+    storefront,
+    suggest,
+)
+from .comments import CommentCursorPagination, comment_page_cache_key
+from .models import (
+    Category,
+    Product,
+    Role,
+    User,
+    ProductImage,
+    News,
+    Promotion,
+    Comment,
+    PromotionProduct,
+    ImageAsset,
+    ImageVariant,
+    StockReservation,
+)
+from .tasks import generate_image_variant
 from .serializers import (
-    CategorySerializer, ProductSerializer, RoleSerializer, UserSerializer,
-    ProductImageSerializer, NewsSerializer, PromotionSerializer, CommentSerializer,
-    PromotionProductSerializer
+    CategorySerializer,
+    ProductSerializer,
+    RoleSerializer,
+    UserSerializer,
+    ProductImageSerializer,
+    NewsSerializer,
+    PromotionSerializer,
+    CommentSerializer,
+    PromotionProductSerializer,
+    ProductListSerializer,
+    NewsListSerializer,
+    PromotionListSerializer,
+    StockReservationSerializer,
 )
 
 
@@ -29,7 +90,404 @@ def health_check(request):
     )
 
 
-class RoleViewSet(viewsets.ModelViewSet):
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def image_variant(request, digest, width, fmt):
+    """
+    Redirect to a resized image variant, generating it in the background on first use.
+
+    Until the variant exists the original is served with a short cache
+    lifetime, so the request never waits for image processing.
+    """
+    width = int(width)
+    if width not in images.variant_widths() or fmt not in images.variant_formats():
+        raise Http404
+
+    key = images.variant_cache_key(digest, width, fmt)
+    url = cache.get(key)
+    if url is None:
+        # Stored at the source's width when that is narrower (images.render_variant)
+        name = (
+            ImageVariant.objects.filter(
+                asset__sha256=digest,
+                width=Least(Value(width), F('asset__width')),
+                format=fmt,
+            )
+            .values_list('file', flat=True)
+            .first()
+        )
+        if name:
+            url = default_storage.url(name)
+            cache.set(key, url, images.VARIANT_CACHE_TIMEOUT)
+
+    if url is not None:
+        response = HttpResponseRedirect(url)
+        patch_cache_control(response, public=True, max_age=images.VARIANT_CACHE_TIMEOUT)
+        return response
+
+    original = (
+        ImageAsset.objects.filter(sha256=digest)
+        .values_list('original', flat=True)
+        .first()
+    )
+    if original is None:
+        raise Http404
+    if cache.add(f'{key}_pending', True, 300):
+        generate_image_variant.delay(digest, width, fmt)
+    response = HttpResponseRedirect(default_storage.url(original))
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
+@require_GET
+def storefront_page(request):
+    """
+    Pre-rendered storefront document for the home page.
+
+    A plain Django view: the body is already rendered JSON in the cache, so
+    DRF's content negotiation, authentication and rendering would be the
+    bulk of the work.
+    """
+    document = storefront.get_document()
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if document['etag'] in etags or '*' in etags:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(document['body'], content_type='application/json')
+    response['ETag'] = document['etag']
+    patch_cache_control(response, public=True, max_age=settings.STOREFRONT_MAX_AGE)
+    return response
+
+
+class PopularOrderingFilter(OrderingFilter):
+    """
+    ``OrderingFilter`` that also accepts ``ordering=popular``, most popular first.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if params:
+            fields = [
+                '-popularity' if field.strip() == 'popular' else field.strip()
+                for field in params.split(',')
+            ]
+            ordering = self.remove_invalid_fields(queryset, fields, view, request)
+            if ordering:
+                return ordering
+        return self.get_default_ordering(view)
+
+
+class PopularityMixin:
+    """
+    Counts detail views towards ``popularity_target`` scores and adds
+    ``ordering=popular``.
+    """
+    popularity_target = None
+    filter_backends = [DjangoFilterBackend, SearchFilter, PopularOrderingFilter]
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        popularity.record(self.popularity_target, response.data['id'])
+        return response
+
+
+class ListRepresentationMixin:
+    """
+    Serves ``list_serializer_class`` for ``list_actions``, with ``list_deferred_fields``
+    deferred.
+
+    List rows show the stored ``excerpt``, so the long text columns are not
+    even read from the database; detail views keep the full representation.
+    """
+    list_serializer_class = None
+    list_deferred_fields = ()
+    list_actions = ('list', 'batch_get')
+
+    def get_serializer_class(self):
+        if self.action in self.list_actions:
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.list_actions:
+            queryset = queryset.defer(*self.list_deferred_fields)
+        return queryset
+
+
+class BatchGetMixin:
+    """
+    Many objects in one call: ``?ids=1,2,3`` on the list route, or
+    ``POST {prefix}/batch-get/`` with ``{"ids": [...]}``.
+
+    ``by`` picks the lookup field from ``batch_lookup_fields``. Results come
+    back in request order, and keys that matched nothing are listed in
+    ``missing``. Objects are read with a single ``IN`` query. With a
+    ``batch_cache_prefix``, per-object entries are also served from and stored
+    in the cache under ``{prefix}_{pk}``, the keys the save signals clear.
+    Entries hold the host they were rendered for, since representations carry
+    absolute URLs (image srcsets); one cached for another host is a miss.
+    """
+    batch_lookup_fields = ('id',)
+    batch_cache_prefix = None
+    # Served by the sync view only; see async_views.AsyncReadView
+    sync_only_params = ('ids',)
+
+    def list(self, request, *args, **kwargs):
+        if 'ids' in request.query_params:
+            return self.batch_response(
+                request.query_params['ids'].split(','),
+                request.query_params.get('by', 'id'),
+            )
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'], url_path='batch-get')
+    def batch_get(self, request):
+        """
+        Objects for a list of ids (or other ``batch_lookup_fields``), in request order.
+        """
+        keys = request.data.get('ids')
+        if not isinstance(keys, list):
+            return Response(
+                {'error': 'ids must be a list'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return self.batch_response(keys, request.data.get('by', 'id'))
+
+    def batch_cacheable(self):
+        return self.batch_cache_prefix is not None
+
+    def batch_response(self, keys, by):
+        if by not in self.batch_lookup_fields:
+            return Response(
+                {'error': f"by must be one of: {', '.join(self.batch_lookup_fields)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        keys = list(dict.fromkeys(str(key).strip() for key in keys if str(key).strip()))
+        if len(keys) > settings.BATCH_GET_MAX_KEYS:
+            return Response(
+                {'error': f'At most {settings.BATCH_GET_MAX_KEYS} ids per request'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if by == 'id':
+            keys = [int(key) if key.isdigit() else key for key in keys]
+
+        found = {}
+        cacheable = self.batch_cacheable()
+        wanted = [key for key in keys if by != 'id' or isinstance(key, int)]
+        host = self.request.build_absolute_uri('/')
+        if cacheable and by == 'id' and wanted:
+            cached = cache.get_many(
+                [f'{self.batch_cache_prefix}_{key}' for key in wanted]
+            )
+            for key in wanted:
+                entry = cached.get(f'{self.batch_cache_prefix}_{key}')
+                if entry is not None and entry[0] == host:
+                    found[key] = entry[1]
+            wanted = [key for key in wanted if key not in found]
+
+        if wanted:
+            objs = list(self.get_queryset().filter(**{f'{by}__in': wanted}))
+            rows = self.get_serializer(objs, many=True).data
+            for obj, data in zip(objs, rows):
+                found[getattr(obj, by)] = data
+            if cacheable:
+                cache.set_many(
+                    {
+                        f'{self.batch_cache_prefix}_{obj.pk}': (host, data)
+                        for obj, data in zip(objs, rows)
+                    },
+                    settings.BATCH_GET_CACHE_TIMEOUT,
+                )
+
+        return Response({
+            'results': [found[key] for key in keys if key in found],
+            'missing': [key for key in keys if key not in found],
+        })
+
+
+class FragmentListMixin:
+    """
+    Builds ``list`` pages from per-row fragments cached by ``fragments``.
+
+    The page query reads only ids and ``fragment_version_fields``; rows
+    whose fragment is missing or stale are fetched and serialized with one
+    more query. Fragments share the ``batch_cache_prefix`` and are only used
+    when ``batch_cacheable()`` (the plain representation) and the response
+    is rendered as JSON.
+    """
+    fragment_version_fields = ()
+
+    def fragment_cacheable(self):
+        return bool(self.fragment_version_fields) and self.batch_cacheable()
+
+    def fragment_version(self, request, row):
+        # Absolute URLs (image srcsets) depend on the host the page was requested on
+        return (request.build_absolute_uri('/'), *row)
+
+    def list(self, request, *args, **kwargs):
+        if (
+            not self.fragment_cacheable()
+            or self.paginator is None
+            or type(getattr(request, 'accepted_renderer', None)) is not JSONRenderer
+        ):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = self.paginate_queryset(
+            fragments.VersionRows(queryset, self.fragment_version_fields)
+        )
+        versions = {row[0]: self.fragment_version(request, row[1:]) for row in rows}
+        found = fragments.get_many(self.batch_cache_prefix, versions)
+
+        missing = [pk for pk in versions if pk not in found]
+        if missing:
+            objs = list(self.get_queryset().filter(pk__in=missing))
+            rendered = dict(
+                zip(
+                    (obj.pk for obj in objs),
+                    fragments.render(self.get_serializer(objs, many=True).data),
+                )
+            )
+            fragments.set_many(self.batch_cache_prefix, versions, rendered)
+            found.update(rendered)
+
+        data = self.get_paginated_response([]).data
+        del data['results']
+        # Rows deleted since the page was read are left out, as a fresh query would
+        return fragments.FragmentResponse(
+            data, [found[pk] for pk in versions if pk in found]
+        )
+
+
+class ChangeFeedMixin:
+    """
+    Adds ``{prefix}/changes/?since=<cursor>`` for incremental sync.
+    """
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Rows changed since a cursor: upserts, deleted ids and the cursor to resume from.
+        """
+        try:
+            limit = min(
+                int(request.query_params.get('limit', settings.CHANGE_FEED_PAGE_SIZE)),
+                settings.CHANGE_FEED_MAX_PAGE_SIZE,
+            )
+        except ValueError:
+            return Response(
+                {'error': 'limit must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            upserts, deleted, cursor, has_more = changes.change_page(
+                self.get_queryset(),
+                request.query_params.get('since', ''),
+                max(limit, 1),
+            )
+        except changes.ExpiredCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_410_GONE)
+        except changes.InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'results': self.get_serializer(upserts, many=True).data,
+            'deleted': deleted,
+            'next': cursor,
+            'has_more': has_more,
+        })
+
+
+class SoftDeleteMixin:
+    """
+    ``DELETE`` soft-deletes (with dependants); deleted rows are hidden from every
+    action but ``include_deleted_actions``.
+
+    The viewset's ``queryset`` reads ``all_objects`` so that the change feed
+    can still report rows as deleted.
+    """
+    include_deleted_actions = ('changes',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in self.include_deleted_actions:
+            queryset = queryset.filter(deleted_at__isnull=True)
+        return queryset
+
+    def perform_destroy(self, instance):
+        softdelete.soft_delete(instance)
+
+
+class CommentFeedMixin:
+    """
+    Adds ``{prefix}/{id}/comments/`` to a viewset of commentable objects.
+    """
+    comment_target_type = None
+
+    @action(detail=True, methods=['get', 'post'])
+    def comments(self, request, pk=None):
+        """List this object's comments (newest first) or add one."""
+        try:
+            target_id = int(pk)
+        except ValueError:
+            raise Http404
+
+        if request.method == 'POST':
+            self.get_object()
+            data = request.data.copy()
+            data['target_type'] = self.comment_target_type
+            data['target_id'] = target_id
+            serializer = CommentSerializer(
+                data=data, context=self.get_serializer_context()
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        paginator = CommentCursorPagination()
+        if not request.query_params.get(paginator.cursor_query_param):
+            def first_page():
+                # Only a miss checks that the target exists; nothing
+                # is cached for one that does not
+                self.get_object()
+                return comments.first_page(self.comment_target_type, target_id)
+
+            data = hotcache.get_or_compute(
+                comment_page_cache_key(self.comment_target_type, target_id),
+                first_page,
+                comments.FIRST_PAGE_CACHE_TIMEOUT,
+                warm=(
+                    'apps.sale.comments.first_page',
+                    (self.comment_target_type, target_id),
+                ),
+            )
+            # Cached with the link relative to the feed, as warm-ups have no request
+            return Response(
+                {
+                    **data,
+                    'next': (
+                        request.build_absolute_uri(data['next'])
+                        if data['next']
+                        else None
+                    ),
+                }
+            )
+
+        self.get_object()
+        page = paginator.paginate_queryset(
+            comments.feed_queryset(self.comment_target_type, target_id),
+            request,
+            view=self,
+        )
+        serializer = CommentSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+
+class RoleViewSet(BatchGetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Role model.
     """
@@ -40,7 +498,7 @@ class RoleViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'created_at']
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(BatchGetMixin, viewsets.ModelViewSet):
     """
     ViewSet for User model.
     """
@@ -50,57 +508,207 @@ class UserViewSet(viewsets.ModelViewSet):
     filterset_fields = ['role', 'is_active', 'is_staff']
     search_fields = ['username', 'email', 'first_name', 'last_name']
     ordering_fields = ['username', 'created_at']
+    batch_lookup_fields = ('id', 'username')
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(
+    BatchGetMixin,
+    FragmentListMixin,
+    SoftDeleteMixin,
+    ChangeFeedMixin,
+    viewsets.ModelViewSet,
+):
     """
     ViewSet for Category model.
     """
-    queryset = Category.objects.all().select_related('parent', 'created_by')
+    queryset = Category.all_objects.select_related('parent', 'created_by')
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
     filterset_fields = ['parent', 'created_by']
     search_fields = ['name', 'slug']
     ordering_fields = ['name', 'created_at']
+    batch_lookup_fields = ('id', 'slug')
+    batch_cache_prefix = 'category'
+    fragment_version_fields = ('updated_at', 'parent__updated_at')
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(
+    BatchGetMixin,
+    FragmentListMixin,
+    SoftDeleteMixin,
+    ListRepresentationMixin,
+    PopularityMixin,
+    ChangeFeedMixin,
+    CommentFeedMixin,
+    viewsets.ModelViewSet,
+):
     """
     ViewSet for Product model.
     """
-    queryset = Product.objects.all().select_related('category', 'created_by')
+    queryset = Product.all_objects.select_related(
+        'category', 'created_by', 'image_asset', 'effective'
+    )
     serializer_class = ProductSerializer
+    list_serializer_class = ProductListSerializer
+    list_deferred_fields = ('description',)
+    list_actions = ('list', 'related', 'batch_get')
     permission_classes = [IsAuthenticated]
-    filterset_fields = ['category', 'is_active', 'price', 'created_by']
+    filterset_fields = {
+        'category': ['exact'],
+        'is_active': ['exact'],
+        'price': ['exact', 'gte', 'lte'],
+        'stock_quantity': ['gte', 'lte'],
+        'created_at': ['gte', 'lte'],
+        'created_by': ['exact'],
+    }
     search_fields = ['name', 'description', 'sku', 'slug']
-    ordering_fields = ['name', 'price', 'created_at']
+    ordering_fields = ['name', 'price', 'created_at', 'popularity']
+    comment_target_type = 'product'
+    popularity_target = 'product'
+    includes = ('images', 'promotions')
+    batch_lookup_fields = ('id', 'sku', 'slug')
+    batch_cache_prefix = 'product'
+    # Counters, images and promotional prices are written without touching updated_at
+    fragment_version_fields = (
+        'updated_at',
+        'comment_count',
+        'view_count',
+        'popularity',
+        'image_asset_id',
+        'effective__price',
+        'category__updated_at',
+    )
+    # Served by the sync view only; see async_views.AsyncReadView
+    sync_only_params = ('facets', 'ids')
+
+    def list(self, request, *args, **kwargs):
+        """
+        List products, with facet counts for the filtered set when ``?facets=true``.
+        """
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') in facets.TRUE_VALUES:
+            response.data['facets'] = facets.facets(
+                self.filter_queryset(self.get_queryset()), request.query_params
+            )
+        return response
+
+    def get_includes(self):
+        """Related data requested with ``?include=images,promotions`` on reads."""
+        if self.action not in ('list', 'retrieve'):
+            return ()
+        requested = self.request.query_params.get('include', '').split(',')
+        return tuple(name for name in self.includes if name in requested)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        includes = self.get_includes()
+        # One extra query per included relation, however many products are on the page
+        if 'images' in includes:
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'images',
+                    queryset=ProductImage.objects.filter(
+                        deleted_at__isnull=True
+                    ).select_related('asset'),
+                    to_attr='live_images',
+                )
+            )
+        if 'promotions' in includes:
+            today = timezone.localdate()
+            queryset = queryset.prefetch_related(Prefetch(
+                'promotion_products',
+                queryset=PromotionProduct.objects.filter(
+                    deleted_at__isnull=True,
+                    promotion__deleted_at__isnull=True,
+                    promotion__start_date__lte=today,
+                    promotion__end_date__gte=today,
+                ).select_related('promotion'),
+                to_attr='active_promotion_products',
+            ))
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['include'] = self.get_includes()
+        return context
+
+    def batch_cacheable(self):
+        # Cached entries hold the plain representation only
+        return super().batch_cacheable() and not self.get_includes()
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """Autocomplete product names, SKUs and slugs by prefix, most popular first."""
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            return Response(
+                {'error': 'limit must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        index = suggest.get_index()
+        query = request.query_params.get('q', '')
+        results = index.search(query, max(limit, 1)) if index is not None else []
+        response = Response({'query': query, 'results': results})
+        patch_cache_control(response, private=True, max_age=60)
+        return response
+
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """
+        Products customers also liked, precomputed by ``tasks.build_related_products``.
+        """
+        try:
+            product_id = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+
+        related = list(self.get_queryset().filter(
+            related_to__product_id=product_id, is_active=True, deleted_at__isnull=True
+        ).order_by('related_to__rank'))
+        if not related:
+            # Only a missing product is a 404; a new one simply has no strip yet
+            self.get_object()
+        return Response(self.get_serializer(related, many=True).data)
 
     @action(detail=True, methods=['post'])
     def update_stock(self, request, pk=None):
         """Update product stock quantity."""
         product = self.get_object()
         quantity = request.data.get('quantity', 0)
-        
+
         if quantity < 0:
             return Response(
                 {'error': 'Quantity cannot be negative'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        product.stock_quantity = quantity
-        product.save()
-        
+
+        inventory.set_stock(product, quantity)
+
         return Response(
             {'message': f'Stock updated to {quantity}'},
             status=status.HTTP_200_OK
         )
 
+    @action(detail=True)
+    def availability(self, request, pk=None):
+        """
+        Stock left to reserve: stock_quantity minus live holds and unreconciled sales.
+        """
+        product = self.get_object()
+        return Response({
+            'id': product.pk,
+            'stock_quantity': product.stock_quantity,
+            'available': inventory.availability([product.pk]).get(product.pk, 0),
+        })
 
-class ProductImageViewSet(viewsets.ModelViewSet):
+
+class ProductImageViewSet(BatchGetMixin, SoftDeleteMixin, viewsets.ModelViewSet):
     """
     ViewSet for ProductImage model.
     """
-    queryset = ProductImage.objects.all().select_related('product', 'created_by')
+    queryset = ProductImage.all_objects.select_related('product', 'created_by', 'asset')
     serializer_class = ProductImageSerializer
     permission_classes = [IsAuthenticated]
     filterset_fields = ['product', 'created_by']
@@ -108,49 +716,153 @@ class ProductImageViewSet(viewsets.ModelViewSet):
     ordering_fields = ['created_at']
 
 
-class NewsViewSet(viewsets.ModelViewSet):
+class NewsViewSet(
+    BatchGetMixin,
+    FragmentListMixin,
+    SoftDeleteMixin,
+    ListRepresentationMixin,
+    PopularityMixin,
+    ChangeFeedMixin,
+    CommentFeedMixin,
+    viewsets.ModelViewSet,
+):
     """
     ViewSet for News model.
     """
-    queryset = News.objects.all().select_related('created_by')
+    queryset = News.all_objects.select_related('created_by')
     serializer_class = NewsSerializer
+    list_serializer_class = NewsListSerializer
+    list_deferred_fields = ('content',)
     permission_classes = [IsAuthenticated]
     filterset_fields = ['created_by']
     search_fields = ['title', 'content', 'slug']
-    ordering_fields = ['title', 'created_at']
+    ordering_fields = ['title', 'created_at', 'popularity']
+    comment_target_type = 'news'
+    popularity_target = 'news'
+    batch_lookup_fields = ('id', 'slug')
+    batch_cache_prefix = 'news'
+    fragment_version_fields = (
+        'updated_at',
+        'comment_count',
+        'view_count',
+        'popularity',
+    )
 
 
-class PromotionViewSet(viewsets.ModelViewSet):
+class PromotionViewSet(
+    BatchGetMixin,
+    FragmentListMixin,
+    SoftDeleteMixin,
+    ListRepresentationMixin,
+    ChangeFeedMixin,
+    viewsets.ModelViewSet,
+):
     """
     ViewSet for Promotion model.
     """
-    queryset = Promotion.objects.all().select_related('created_by')
+    queryset = Promotion.all_objects.select_related('created_by')
     serializer_class = PromotionSerializer
+    list_serializer_class = PromotionListSerializer
+    list_deferred_fields = ('description',)
     permission_classes = [IsAuthenticated]
-    filterset_fields = ['start_date', 'end_date', 'created_by']
+    filterset_fields = ['start_date', 'end_date', 'discount_type', 'created_by']
     search_fields = ['title', 'description', 'slug']
     ordering_fields = ['title', 'start_date', 'created_at']
+    batch_lookup_fields = ('id', 'slug')
+    batch_cache_prefix = 'promotion'
+    fragment_version_fields = ('updated_at',)
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(BatchGetMixin, SoftDeleteMixin, viewsets.ModelViewSet):
     """
     ViewSet for Comment model.
     """
-    queryset = Comment.objects.all().select_related('user', 'created_by')
+    queryset = Comment.all_objects.select_related('user', 'created_by')
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
-    filterset_fields = ['target_type', 'rating', 'user', 'created_by']
+    filterset_fields = ['target_type', 'target_id', 'rating', 'user', 'created_by']
     search_fields = ['user__username', 'comment']
     ordering_fields = ['created_at', 'rating']
 
 
-class PromotionProductViewSet(viewsets.ModelViewSet):
+class PromotionProductViewSet(BatchGetMixin, SoftDeleteMixin, viewsets.ModelViewSet):
     """
     ViewSet for PromotionProduct model.
     """
-    queryset = PromotionProduct.objects.all().select_related('promotion', 'product', 'created_by')
+    queryset = PromotionProduct.all_objects.select_related(
+        'promotion', 'product', 'created_by'
+    )
     serializer_class = PromotionProductSerializer
     permission_classes = [IsAuthenticated]
     filterset_fields = ['promotion', 'product', 'created_by']
     search_fields = ['promotion__title', 'product__name']
-    ordering_fields = ['created_at'] 
\ No newline at end of file
+    ordering_fields = ['created_at'] 
+
+
+class StockReservationViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.ListModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    Checkout stock holds of the current user; see ``apps.sale.inventory``.
+
+    ``POST`` needs an ``Idempotency-Key`` header: repeating a request with
+    the same key returns the reservation the first one made.
+    """
+    serializer_class = StockReservationSerializer
+    permission_classes = [IsAuthenticated]
+    filterset_fields = ['product', 'status']
+    ordering_fields = ['created_at', 'expires_at']
+
+    def get_queryset(self):
+        return (
+            StockReservation.objects.filter(user=self.request.user)
+            .select_related('product')
+            .order_by('-id')
+        )
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key', '')
+        if not key or len(key) > StockReservation._meta.get_field('key').max_length:
+            return Response(
+                {
+                    'error': (
+                        'An Idempotency-Key header of up to 64 characters is required'
+                    )
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            reservation, created = inventory.reserve(
+                request.user,
+                serializer.validated_data['product'].pk,
+                serializer.validated_data['quantity'],
+                key,
+            )
+        except inventory.InventoryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response(
+            self.get_serializer(reservation).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    @action(detail=True, methods=['post'])
+    def commit(self, request, pk=None):
+        """Turn the hold into a sale once payment went through."""
+        return self._transition(inventory.commit)
+
+    @action(detail=True, methods=['post'])
+    def release(self, request, pk=None):
+        """Give the held stock back, e.g. when payment failed."""
+        return self._transition(inventory.release)
+
+    def _transition(self, change):
+        try:
+            reservation = change(self.get_object())
+        except inventory.ReservationConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(reservation).data)
@@ -0,0 +1,5 @@
+"""
+Performance benchmark suite for the sale API and Celery tasks.
+
+Run with ``python -m benchmarks --help`` from the backend directory.
+"""
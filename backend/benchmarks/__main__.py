@@ -0,0 +1,172 @@
+"""
+Command line entry point for the benchmark suite.
+
+    python -m benchmarks --size 1000
+    DATABASE_URL=postgres://... python -m benchmarks --size 1000
+    python -m benchmarks --update-baseline
+
+Query counts are the gate: any increase over the baseline fails the run.
+p50 latencies are compared too but only reported, because wall-clock times
+recorded on another machine are noise. To gate on latency, record a
+baseline on this machine first and compare against it in the same session:
+
+    git stash && python -m benchmarks --output before.json && git stash pop
+    python -m benchmarks --baseline before.json --fail-on-latency
+"""
+import argparse
+import os
+import shutil
+import sys
+from pathlib import Path
+
+BASELINE_DIR = Path(__file__).resolve().parent / 'baselines'
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        '--size', type=int, default=1000, help='number of products to seed'
+    )
+    parser.add_argument(
+        '--seed', type=int, default=42, help='random seed for the dataset'
+    )
+    parser.add_argument(
+        '--iterations', type=int, default=30, help='timed runs per scenario'
+    )
+    parser.add_argument(
+        '--warmup', type=int, default=3, help='untimed runs per scenario'
+    )
+    parser.add_argument(
+        '--only',
+        action='append',
+        default=[],
+        help='only run scenarios containing this substring (repeatable)',
+    )
+    parser.add_argument('--output', default='benchmark-results.json',
+                        help='where to write machine-readable results')
+    parser.add_argument(
+        '--baseline',
+        default=None,
+        help='baseline file (default: benchmarks/baselines/<vendor>.json)',
+    )
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative p50 slowdown before reporting it')
+    parser.add_argument(
+        '--fail-on-latency',
+        action='store_true',
+        help='fail on p50 slowdowns too (only against a baseline from this machine)',
+    )
+    parser.add_argument(
+        '--update-baseline',
+        action='store_true',
+        help='overwrite the baseline with this run instead of comparing',
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings.bench')
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    from apps.sale.models import User
+
+    from . import dataset, runner, scenarios
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        print(f'Seeding {args.size} products on {connection.vendor}...')
+        data = dataset.seed(size=args.size, seed=args.seed)
+
+        client = Client()
+        client.force_login(User.objects.get(id=data['users'][0]))
+
+        selected = [
+            (name, lambda n, call=call: call(client, n))
+            for name, call in scenarios.api_scenarios(data)
+        ] + scenarios.task_scenarios(data)
+        if args.only:
+            selected = [
+                (name, call)
+                for name, call in selected
+                if any(s in name for s in args.only)
+            ]
+
+        results = {}
+        print(
+            f"{'scenario':<42} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'queries':>8}"
+        )
+        for name, call in selected:
+            result = runner.measure(name, call, args.iterations, args.warmup)
+            results[name] = result
+            print(f"{name:<42} {result['throughput']:>9} {result['p50_ms']:>9} "
+                  f"{result['p99_ms']:>9} {result['queries']:>8}")
+
+        meta = runner.metadata(args.size, args.seed)
+        vendor = connection.vendor
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        teardown_test_environment()
+
+    runner.write_results(args.output, meta, results)
+    print(f'Results written to {args.output}')
+
+    baseline_path = (
+        Path(args.baseline) if args.baseline else BASELINE_DIR / f'{vendor}.json'
+    )
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        runner.write_results(baseline_path, meta, results)
+        print(f'Baseline updated: {baseline_path}')
+        return 0
+
+    if not baseline_path.exists():
+        print(
+            f'No baseline at {baseline_path}; run with --update-baseline to record one.'
+        )
+        return 0
+
+    baseline = runner.load_results(baseline_path)
+    if baseline['meta']['size'] != args.size:
+        print(
+            f"Baseline {baseline_path} was recorded with "
+            f"--size {baseline['meta']['size']}, not {args.size}; refusing to compare."
+        )
+        return 2
+
+    regressions = runner.compare(baseline, {'results': results})
+    slower = runner.slowdowns(baseline, {'results': results}, tolerance=args.tolerance)
+    if slower:
+        advisory = '' if args.fail_on_latency else ' (advisory, see --fail-on-latency)'
+        print(f'\n{len(slower)} p50 slowdown(s) against {baseline_path}{advisory}:')
+        for line in slower:
+            print(f"  {'REGRESSION' if args.fail_on_latency else 'SLOWER'} {line}")
+    if regressions:
+        print(
+            f'\n{len(regressions)} query count regression(s) against {baseline_path}:'
+        )
+        for line in regressions:
+            print(f'  REGRESSION {line}')
+    if regressions or (slower and args.fail_on_latency):
+        return 1
+
+    print(f'No regressions against {baseline_path}.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""
+Deterministic dataset seeding for benchmarks.
+"""
+import io
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image
+
+from apps.sale import excerpts, pricing
+from apps.sale.comments import recount_comment_counts
+from apps.sale.models import (
+    Role, User, Category, Product, ProductImage,
+    News, Promotion, Comment, PromotionProduct, StockReservation
+)
+
+BATCH_SIZE = 1000
+
+WORDS = [
+    'alpha', 'bravo', 'cotton', 'denim', 'eco', 'fresh', 'granite', 'harbor',
+    'indigo', 'jade', 'kinetic', 'lunar', 'maple', 'nordic', 'onyx', 'pixel',
+    'quartz', 'river', 'solar', 'timber', 'urban', 'velvet', 'willow', 'zen',
+]
+
+LOW_STOCK_RATIO = 0.05
+
+# Source file the product image create scenario points at
+IMAGE_SOURCE = 'products/bench/source.jpg'
+
+
+def _words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def _image_source():
+    """
+    Store a small JPEG at ``IMAGE_SOURCE`` for uploads to be ingested from.
+    """
+    if not default_storage.exists(IMAGE_SOURCE):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), (200, 120, 40)).save(buffer, format='JPEG')
+        default_storage.save(IMAGE_SOURCE, ContentFile(buffer.getvalue()))
+    return IMAGE_SOURCE
+
+
+def _ids(model):
+    return list(model.objects.order_by('id').values_list('id', flat=True))
+
+
+def seed(size=1000, seed=42):
+    """
+    Seed a dataset scaled to ``size`` products and return the created ids.
+
+    Every other table is sized relative to the product count so that
+    query plans stay comparable between small and large runs.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    today = now.date()
+
+    role = Role.objects.create(name='bench')
+    password = make_password('bench')
+    User.objects.bulk_create(
+        [
+            User(
+                username=f'bench_user_{i}',
+                email=f'bench_user_{i}@example.com',
+                password=password,
+                role=role,
+                is_staff=(i == 0),
+            )
+            for i in range(max(10, size // 100))
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    user_ids = _ids(User)
+
+    root_count = 5
+    Category.objects.bulk_create(
+        [
+            Category(
+                name=f'Root {_words(rng, 1)} {i}',
+                slug=f'bench-root-{i}',
+                created_by_id=user_ids[0],
+            )
+            for i in range(root_count)
+        ]
+    )
+    root_ids = _ids(Category)
+    Category.objects.bulk_create(
+        [
+            Category(
+                name=f'{_words(rng, 2).title()} {i}',
+                slug=f'bench-category-{i}',
+                parent_id=rng.choice(root_ids),
+                created_by_id=rng.choice(user_ids),
+            )
+            for i in range(max(5, size // 50))
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    category_ids = _ids(Category)
+
+    Product.objects.bulk_create(
+        [
+            Product(
+                name=f'{_words(rng, 3).title()} {i}',
+                slug=f'bench-product-{i}',
+                description=_words(rng, 40),
+                price=Decimal(rng.randint(100, 100000)) / 100,
+                category_id=rng.choice(category_ids),
+                created_by_id=rng.choice(user_ids),
+                stock_quantity=(
+                    rng.randint(0, 10)
+                    if rng.random() < LOW_STOCK_RATIO
+                    else rng.randint(11, 500)
+                ),
+                sku=f'BENCH-{i:08d}',
+                is_active=rng.random() > 0.1,
+            )
+            for i in range(size)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    product_ids = _ids(Product)
+
+    ProductImage.objects.bulk_create(
+        [
+            ProductImage(
+                product_id=product_id,
+                image_url=f'products/bench/{product_id}.jpg',
+                created_by_id=rng.choice(user_ids),
+            )
+            for product_id in product_ids[::2]
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    News.objects.bulk_create(
+        [
+            News(
+                title=f'{_words(rng, 4).title()} {i}',
+                slug=f'bench-news-{i}',
+                content=_words(rng, 300),
+                created_by_id=rng.choice(user_ids),
+            )
+            for i in range(max(10, size // 10))
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    news_ids = _ids(News)
+
+    promotions = []
+    for i in range(max(5, size // 100)):
+        start = today + timedelta(days=rng.randint(-30, 10))
+        promotions.append(
+            Promotion(
+                title=f'{_words(rng, 2).title()} Sale {i}',
+                slug=f'bench-promotion-{i}',
+                description=_words(rng, 60),
+                start_date=start,
+                end_date=start + timedelta(days=rng.randint(1, 45)),
+                discount_type=Promotion.DISCOUNT_PERCENT,
+                discount_value=(10, 20, 30, 50)[i % 4],
+                stackable=i % 3 == 0,
+                created_by_id=rng.choice(user_ids),
+            )
+        )
+    Promotion.objects.bulk_create(promotions, batch_size=BATCH_SIZE)
+    promotion_ids = _ids(Promotion)
+
+    links = []
+    for promotion_id in promotion_ids:
+        for product_id in rng.sample(product_ids, min(20, len(product_ids))):
+            links.append(
+                PromotionProduct(
+                    promotion_id=promotion_id,
+                    product_id=product_id,
+                    created_by_id=rng.choice(user_ids),
+                )
+            )
+    PromotionProduct.objects.bulk_create(links, batch_size=BATCH_SIZE)
+    pricing.rebuild(today)
+
+    # A promotion without links, so create scenarios can add unique pairs
+    empty_promotion = Promotion.objects.create(
+        title='Bench Empty Promotion',
+        slug='bench-empty-promotion',
+        start_date=today,
+        end_date=today + timedelta(days=7),
+        created_by_id=user_ids[0],
+    )
+
+    comments = []
+    for _ in range(size * 2):
+        if rng.random() < 0.8:
+            target_type, target_id = 'product', rng.choice(product_ids)
+        else:
+            target_type, target_id = 'news', rng.choice(news_ids)
+        user_id = rng.choice(user_ids)
+        comments.append(
+            Comment(
+                user_id=user_id,
+                target_type=target_type,
+                target_id=target_id,
+                rating=rng.randint(1, 5),
+                comment=_words(rng, 20),
+                created_by_id=user_id,
+            )
+        )
+    Comment.objects.bulk_create(comments, batch_size=BATCH_SIZE)
+    recount_comment_counts('product')
+    recount_comment_counts('news')
+    for model in (Product, News, Promotion):
+        excerpts.backfill(model)
+
+    # Stock holds of the logged-in benchmark user, on products with room for more
+    stocked_ids = list(
+        Product.objects.filter(is_active=True, stock_quantity__gt=100)
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+    StockReservation.objects.bulk_create(
+        [
+            StockReservation(
+                user_id=user_ids[0],
+                product_id=product_id,
+                key=f'bench-seed-{i}',
+                quantity=1,
+                expires_at=timezone.now() + timedelta(days=1),
+            )
+            for i, product_id in enumerate(stocked_ids[:max(5, size // 20)])
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    return {
+        'role': role.id,
+        'users': user_ids,
+        'categories': category_ids,
+        'products': product_ids,
+        'product_images': _ids(ProductImage),
+        'image_source': _image_source(),
+        'news': news_ids,
+        'promotions': promotion_ids,
+        'empty_promotion': empty_promotion.id,
+        'comments': _ids(Comment),
+        'promotion_products': _ids(PromotionProduct),
+        'stocked_products': stocked_ids,
+        'reservations': _ids(StockReservation),
+    }
@@ -0,0 +1,187 @@
+"""
+Load test for the push channel in ``apps.sale.push``.
+
+Opens ``--subscribers`` Server-Sent Events connections against the ASGI
+application, each subscribed to a few products and one category, and
+reports:
+
+- the Python memory each idle connection holds;
+- how long one category-wide update takes to reach every connection;
+- how many events a burst of stock changes to one product turns into,
+  once coalesced.
+
+Connections are driven in-process through the ASGI interface, with the
+in-memory broker, so neither a server nor Redis is needed. Memory held by
+the server's sockets and buffers is not included.
+
+    python -m benchmarks.push
+    python -m benchmarks.push --subscribers 20000
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+USERNAME = 'push-benchmark'
+PASSWORD = 'push-benchmark'
+
+
+class Connection:
+    """
+    The client end of one SSE connection: counts the events written to it.
+    """
+
+    def __init__(self, on_event):
+        # A bare future rather than a queue, so the client side
+        # adds little to the memory measured
+        self.closed = asyncio.get_running_loop().create_future()
+        self.on_event = on_event
+        self.events = 0
+
+    async def receive(self):
+        return await self.closed
+
+    def close(self):
+        self.closed.set_result({'type': 'http.disconnect'})
+
+    async def send(self, message):
+        body = message.get('body', b'')
+        if body.startswith(b'event: '):
+            count = body.count(b'event: ')
+            self.events += count
+            self.on_event(count)
+
+
+def _scope(products, category):
+    credentials = base64.b64encode(f'{USERNAME}:{PASSWORD}'.encode())
+    query = f"products={','.join(map(str, products))}&categories={category}"
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': '/api/push/events/',
+        'root_path': '',
+        'scheme': 'http',
+        'query_string': query.encode(),
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 0),
+        'headers': [
+            (b'host', b'testserver'),
+            (b'authorization', b'Basic ' + credentials),
+        ],
+    }
+
+
+async def run(application, subscribers, burst):
+    from apps.sale import push
+    from django.conf import settings
+
+    delivered = 0
+    target = 0
+    reached = asyncio.Event()
+
+    def on_event(count):
+        nonlocal delivered
+        delivered += count
+        if delivered >= target:
+            reached.set()
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    connections, tasks = [], []
+    for n in range(subscribers):
+        connection = Connection(on_event)
+        connections.append(connection)
+        # Product pages: the product itself plus a few related ones, all in category 1
+        products = [n % 1000 + 1, (n * 7) % 1000 + 1, (n * 13) % 1000 + 1]
+        tasks.append(
+            asyncio.ensure_future(
+                application(_scope(products, 1), connection.receive, connection.send)
+            )
+        )
+        if n % 500 == 0:
+            await asyncio.sleep(0)
+    while len(push.get_hub().subscribers) < subscribers:
+        await asyncio.sleep(0.01)
+    connect_s = time.perf_counter() - started
+    held = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    # One update every connection hears about through its category
+    target = delivered + subscribers
+    started = time.perf_counter()
+    push.publish([{'id': 1000000, 'category': 1, 'price': '9.99'}])
+    await asyncio.wait_for(reached.wait(), 60)
+    fanout_ms = (
+        time.perf_counter() - started
+    ) * 1000 - settings.PUSH_COALESCE_SECONDS * 1000
+
+    # A burst of stock changes to one product inside the coalescing window
+    before = sum(connection.events for connection in connections)
+    for quantity in range(burst):
+        push.publish([{'id': 1, 'category': 1, 'stock_quantity': burst - quantity}])
+    await asyncio.sleep(settings.PUSH_COALESCE_SECONDS * 2)
+    burst_events = sum(connection.events for connection in connections) - before
+
+    for connection in connections:
+        connection.close()
+    await asyncio.gather(*tasks)
+    return {
+        'subscribers': subscribers,
+        'connect_s': round(connect_s, 2),
+        'bytes_per_subscriber': held // subscribers,
+        'fanout_ms': round(fanout_ms, 1),
+        'burst_updates': burst,
+        'burst_events_per_subscriber': round(burst_events / subscribers, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.push',
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        '--subscribers', type=int, default=10000, help='idle connections to open'
+    )
+    parser.add_argument(
+        '--burst',
+        type=int,
+        default=50,
+        help='stock changes to one product in one window',
+    )
+    parser.add_argument(
+        '--output', default=None, help='append a JSON line to this file'
+    )
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings.bench')
+    from myproject.asgi import application
+    from django.conf import settings
+
+    if settings.PUSH_REDIS_URL:
+        parser.error('run with the bench settings: the benchmark publishes in-process')
+    from apps.sale.models import Role, User
+
+    user, _ = User.objects.get_or_create(
+        username=USERNAME, defaults={'role': Role.objects.first()}
+    )
+    user.set_password(PASSWORD)
+    user.save()
+
+    result = asyncio.run(run(application, args.subscribers, args.burst))
+    for key, value in result.items():
+        print(f'{key:<28} {value}')
+    if args.output:
+        with open(args.output, 'a') as fh:
+            fh.write(json.dumps(result, sort_keys=True) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Load test for the Celery queue topology in ``CELERY_TASK_ROUTES``.
+
+Queues a burst of slow mail jobs (an SMTP server answering in
+``--smtp-delay`` seconds), image downloads (a remote host answering in
+``--image-delay`` seconds) and a few batch jobs. It then submits
+latency-sensitive tasks at a steady rate and times how long each one waits
+for a worker. The run is done twice with the same five worker slots:
+
+- ``shared``: every task on one queue, as before the routing table;
+- ``routed``: the settings' routes, with the per-queue workers of
+  ``docker-compose.prod.yml``.
+
+Each stand-in task is routed by the settings' entry for the real task it
+plays. Everything runs in-process on kombu's in-memory broker,
+so no Redis is needed:
+
+    python -m benchmarks.queues
+    python -m benchmarks.queues --notifications 400 --smtp-delay 1
+    python -m benchmarks.queues --notifications 0 --images 100 --image-delay 2
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import ExitStack
+
+from .runner import percentile
+
+NOTIFICATION_TASK = 'benchmarks.queues.notify'
+IMAGE_TASK = 'benchmarks.queues.ingest'
+BULK_TASK = 'benchmarks.queues.rebuild'
+INTERACTIVE_TASK = 'benchmarks.queues.refresh'
+
+# Stand-in -> the real task whose route it takes
+PLAYS = {
+    NOTIFICATION_TASK: 'apps.sale.tasks.send_product_update_notification',
+    IMAGE_TASK: 'apps.sale.tasks.ingest_product_image',
+    BULK_TASK: 'apps.sale.tasks.build_related_products',
+    INTERACTIVE_TASK: 'apps.sale.tasks.refresh_product_prices',
+}
+
+# queue -> (concurrency, prefetch multiplier), as in docker-compose.prod.yml
+ROUTED_WORKERS = {
+    'interactive': (2, 4),
+    'notifications': (1, 1),
+    'images': (1, 1),
+    'bulk': (1, 1),
+}
+# One worker with as many slots, and Celery's default prefetch
+SHARED_WORKERS = {
+    'interactive': (sum(concurrency for concurrency, _ in ROUTED_WORKERS.values()), 4)
+}
+
+
+def _app(routes, prefetch):
+    from celery import Celery
+    from django.conf import settings
+
+    # No Django fixup: it would run the system checks in every worker
+    app = Celery('queue-benchmark', broker='memory://', fixups=[], set_as_current=False)
+    app.conf.update(
+        broker_connection_retry_on_startup=True,
+        task_default_queue=settings.CELERY_TASK_DEFAULT_QUEUE,
+        task_routes=routes,
+        task_ignore_result=True,
+        worker_prefetch_multiplier=prefetch,
+        # The in-memory transport polls; the default second
+        # would swamp the waits measured
+        broker_transport_options={'polling_interval': 0.002},
+    )
+    return app
+
+
+def _purge(app, queues):
+    with app.connection_for_write() as connection:
+        for queue in queues:
+            connection.default_channel.queue_purge(queue)
+
+
+def run(
+    mode,
+    notifications,
+    images,
+    bulk,
+    interactive,
+    rate,
+    smtp_delay,
+    image_delay,
+    bulk_duration,
+):
+    """
+    One load run; returns the wait times of the latency-sensitive tasks.
+    """
+    from celery.contrib.testing.worker import start_worker
+    from django.conf import settings
+
+    workers = ROUTED_WORKERS if mode == 'routed' else SHARED_WORKERS
+    routes = {}
+    if mode == 'routed':
+        routes = {
+            name: settings.CELERY_TASK_ROUTES[real]
+            for name, real in PLAYS.items()
+            if real in settings.CELERY_TASK_ROUTES
+        }
+    waits = []
+    done = threading.Event()
+    lock = threading.Lock()
+
+    # Prefetch is a worker setting, so each queue's worker gets an app of its own
+    apps = {queue: _app(routes, prefetch) for queue, (_, prefetch) in workers.items()}
+    for app in apps.values():
+        @app.task(name=NOTIFICATION_TASK, shared=False)
+        def notify():
+            time.sleep(smtp_delay)
+
+        @app.task(name=IMAGE_TASK, shared=False)
+        def ingest():
+            time.sleep(image_delay)
+
+        @app.task(name=BULK_TASK, shared=False)
+        def rebuild():
+            time.sleep(bulk_duration)
+
+        @app.task(name=INTERACTIVE_TASK, shared=False)
+        def refresh(submitted):
+            with lock:
+                waits.append((time.time() - submitted) * 1000)
+                if len(waits) == interactive:
+                    done.set()
+
+    producer = next(iter(apps.values()))
+    with ExitStack() as stack:
+        for queue, (concurrency, _) in workers.items():
+            stack.enter_context(start_worker(
+                apps[queue], pool='threads', concurrency=concurrency, queues=[queue],
+                perform_ping_check=False, loglevel='ERROR',
+                shutdown_timeout=smtp_delay + image_delay + bulk_duration + 5,
+            ))
+        for _ in range(bulk):
+            producer.send_task(BULK_TASK)
+        for _ in range(notifications):
+            producer.send_task(NOTIFICATION_TASK)
+        for _ in range(images):
+            producer.send_task(IMAGE_TASK)
+        started = time.monotonic()
+        for n in range(interactive):
+            # Paced from the start time, so slow sends do not drift the schedule
+            time.sleep(max(0, started + n / rate - time.monotonic()))
+            producer.send_task(INTERACTIVE_TASK, args=[time.time()])
+        finished = done.wait(
+            timeout=notifications * smtp_delay
+            + images * image_delay
+            + bulk * bulk_duration
+            + 30
+        )
+        # The backlog left over would otherwise be consumed by the next run
+        _purge(producer, ROUTED_WORKERS)
+
+    return {
+        'mode': mode,
+        'workers': {queue: concurrency for queue, (concurrency, _) in workers.items()},
+        'interactive': interactive,
+        'completed': len(waits),
+        'finished': finished,
+        'p50_ms': round(percentile(waits, 50), 3) if waits else None,
+        'p99_ms': round(percentile(waits, 99), 3) if waits else None,
+        'max_ms': round(max(waits), 3) if waits else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.queues',
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        '--notifications', type=int, default=200, help='slow mail jobs queued up front'
+    )
+    parser.add_argument(
+        '--images', type=int, default=50, help='slow image downloads queued up front'
+    )
+    parser.add_argument(
+        '--bulk', type=int, default=2, help='batch jobs queued up front'
+    )
+    parser.add_argument(
+        '--interactive', type=int, default=200, help='latency-sensitive tasks to time'
+    )
+    parser.add_argument(
+        '--rate', type=float, default=50, help='latency-sensitive tasks per second'
+    )
+    parser.add_argument(
+        '--smtp-delay', type=float, default=0.5, help='seconds per mail job'
+    )
+    parser.add_argument(
+        '--image-delay', type=float, default=1, help='seconds per image download'
+    )
+    parser.add_argument(
+        '--bulk-duration', type=float, default=5, help='seconds per batch job'
+    )
+    parser.add_argument('--mode', choices=['shared', 'routed'], action='append',
+                        help='topology to run (repeatable; default both)')
+    parser.add_argument('--output', default=None, help='append JSON lines to this file')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings.bench')
+    import django
+    django.setup()
+
+    print(
+        f"{'mode':<8} {'workers':<52} {'done':>9} "
+        f"{'p50 ms':>10} {'p99 ms':>10} {'max ms':>10}"
+    )
+    for mode in args.mode or ['shared', 'routed']:
+        result = run(
+            mode,
+            args.notifications,
+            args.images,
+            args.bulk,
+            args.interactive,
+            args.rate,
+            args.smtp_delay,
+            args.image_delay,
+            args.bulk_duration,
+        )
+        workers = ', '.join(
+            f'{queue}={count}' for queue, count in result['workers'].items()
+        )
+        print(
+            f"{mode:<8} {workers:<52} "
+            f"{result['completed']:>4}/{result['interactive']:<4} "
+            f"{result['p50_ms']!s:>10} {result['p99_ms']!s:>10} "
+            f"{result['max_ms']!s:>10}"
+        )
+        if args.output:
+            with open(args.output, 'a') as fh:
+                fh.write(json.dumps(result, sort_keys=True) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
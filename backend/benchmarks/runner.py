@@ -0,0 +1,135 @@
+"""
+Timing, query counting and baseline comparison for benchmarks.
+"""
+import json
+import platform
+import time
+
+import django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class BenchmarkError(Exception):
+    """Raised when a scenario fails instead of producing a measurement."""
+
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of ``samples``.
+    """
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def measure(name, call, iterations, warmup, start=0):
+    """
+    Run ``call(n)`` ``warmup + iterations`` times and summarise the timed runs.
+
+    ``call`` must return a truthy value or an HTTP response with a non-error
+    status, otherwise the scenario is reported as broken.
+    """
+    n = start
+    for _ in range(warmup):
+        _check(name, call(n))
+        n += 1
+
+    timings = []
+    queries = []
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as ctx:
+            began = time.perf_counter()
+            result = call(n)
+            elapsed = time.perf_counter() - began
+        _check(name, result)
+        timings.append(elapsed * 1000)
+        queries.append(len(ctx.captured_queries))
+        n += 1
+
+    total = sum(timings) / 1000
+    return {
+        'iterations': iterations,
+        'throughput': round(iterations / total, 2) if total else None,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': max(queries),
+    }
+
+
+def _check(name, result):
+    status_code = getattr(result, 'status_code', None)
+    if status_code is not None:
+        if status_code >= 400:
+            raise BenchmarkError(
+                f'{name} returned HTTP {status_code}: {result.content[:500]!r}'
+            )
+    elif not result:
+        raise BenchmarkError(f'{name} reported failure')
+
+
+def metadata(size, seed):
+    """
+    Describe the environment a result set was produced in.
+    """
+    return {
+        'vendor': connection.vendor,
+        'size': size,
+        'seed': seed,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'machine': platform.machine(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def write_results(path, meta, results):
+    with open(path, 'w') as fh:
+        json.dump({'meta': meta, 'results': results}, fh, indent=2, sort_keys=True)
+        fh.write('\n')
+
+
+def load_results(path):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def compare(baseline, current):
+    """
+    Compare ``current`` results against ``baseline`` and list query count regressions.
+
+    Query counts are deterministic for a given dataset, so any increase is a
+    regression wherever the baseline was recorded.
+    """
+    regressions = []
+    for name, base in sorted(baseline['results'].items()):
+        result = current['results'].get(name)
+        if result is not None and result['queries'] > base['queries']:
+            regressions.append(
+                f"{name}: queries {base['queries']} -> {result['queries']}"
+            )
+    return regressions
+
+
+def slowdowns(baseline, current, tolerance=0.25, floor_ms=0.5):
+    """
+    List scenarios whose p50 exceeds the baseline by more than ``tolerance`` (and at
+    least ``floor_ms``).
+
+    Wall-clock times only compare between runs on the same machine under
+    the same load, so these are advisory unless the baseline was recorded
+    that way.
+    """
+    slower = []
+    for name, base in sorted(baseline['results'].items()):
+        result = current['results'].get(name)
+        if result is None:
+            continue
+        limit = max(base['p50_ms'] * (1 + tolerance), base['p50_ms'] + floor_ms)
+        if result['p50_ms'] > limit:
+            slower.append(
+                f"{name}: p50 {base['p50_ms']}ms -> {result['p50_ms']}ms "
+                f"(limit {limit:.3f}ms)"
+            )
+    return slower
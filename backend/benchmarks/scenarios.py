@@ -0,0 +1,228 @@
+"""
+Benchmark scenarios for the sale API endpoints and Celery tasks.
+"""
+from datetime import date, timedelta
+
+from apps.sale import tasks
+from apps.sale.urls import router
+
+# Per-endpoint inputs keyed by router prefix. ``ids`` names the dataset key
+# used for retrieve, ``filter`` builds query params from the dataset,
+# ``create`` builds a POST payload for the n-th create call, the optional
+# ``headers`` its request headers, and the optional ``variants`` maps extra
+# scenario names to query params for the list URL (fixed, or built from the
+# dataset by a callable), or to a ``(path, params)`` pair for a route below
+# it.
+ENDPOINTS = {
+    'roles': {
+        'ids': 'role',
+        'search': 'bench',
+        'filter': None,
+        'create': lambda data, n: {'name': f'bench-role-{n}'},
+    },
+    'users': {
+        'ids': 'users',
+        'search': 'bench_user_1',
+        'filter': lambda data: {'role': data['role'], 'is_active': 'true'},
+        'create': lambda data, n: {
+            'username': f'bench_new_user_{n}',
+            'password': 'bench-password',
+            'role': data['role'],
+        },
+    },
+    'categories': {
+        'ids': 'categories',
+        'search': 'root',
+        'filter': lambda data: {'parent': data['categories'][0]},
+        'create': lambda data, n: {
+            'name': f'Bench New Category {n}',
+            'slug': f'bench-new-category-{n}',
+            'created_by': data['users'][0],
+        },
+    },
+    'products': {
+        'ids': 'products',
+        'search': 'solar',
+        'filter': lambda data: {
+            'category': data['categories'][-1],
+            'is_active': 'true',
+        },
+        'create': lambda data, n: {
+            'name': f'Bench New Product {n}',
+            'slug': f'bench-new-product-{n}',
+            'price': '19.99',
+            'category': data['categories'][-1],
+            'created_by': data['users'][0],
+            'stock_quantity': 50,
+            'sku': f'BENCH-NEW-{n:08d}',
+        },
+        'variants': {
+            'include': {'include': 'images,promotions'},
+            'suggest': ('suggest/', {'q': 'sol'}),
+            'batch': lambda data: {
+                'ids': ','.join(str(pk) for pk in data['products'][:200])
+            },
+        },
+    },
+    'product-images': {
+        'ids': 'product_images',
+        'search': 'solar',
+        'filter': lambda data: {'product': data['products'][0]},
+        'create': lambda data, n: {
+            'product': data['products'][n % len(data['products'])],
+            'image_url': data['image_source'],
+            'created_by': data['users'][0],
+        },
+    },
+    'news': {
+        'ids': 'news',
+        'search': 'harbor',
+        'filter': lambda data: {'created_by': data['users'][0]},
+        'create': lambda data, n: {
+            'title': f'Bench New Article {n}',
+            'slug': f'bench-new-article-{n}',
+            'content': 'bench ' * 200,
+            'created_by': data['users'][0],
+        },
+    },
+    'promotions': {
+        'ids': 'promotions',
+        'search': 'sale',
+        'filter': lambda data: {
+            'end_date': (date.today() + timedelta(days=7)).isoformat()
+        },
+        'create': lambda data, n: {
+            'title': f'Bench New Promotion {n}',
+            'slug': f'bench-new-promotion-{n}',
+            'start_date': date.today().isoformat(),
+            'end_date': (date.today() + timedelta(days=14)).isoformat(),
+            'created_by': data['users'][0],
+        },
+    },
+    'comments': {
+        'ids': 'comments',
+        'search': 'bench_user_1',
+        'filter': lambda data: {'target_type': 'product', 'rating': 5},
+        'create': lambda data, n: {
+            'user': data['users'][0],
+            'target_type': 'product',
+            'target_id': data['products'][n % len(data['products'])],
+            'rating': 4,
+            'comment': 'Bench comment',
+            'created_by': data['users'][0],
+        },
+    },
+    'promotion-products': {
+        'ids': 'promotion_products',
+        'search': 'sale',
+        'filter': lambda data: {'promotion': data['promotions'][0]},
+        'create': lambda data, n: {
+            'promotion': data['empty_promotion'],
+            'product': data['products'][n],
+            'created_by': data['users'][0],
+        },
+    },
+    'reservations': {
+        'ids': 'reservations',
+        'search': 'bench',
+        'filter': lambda data: {'status': 'held'},
+        'create': lambda data, n: {
+            'product': data['stocked_products'][n % len(data['stocked_products'])],
+            'quantity': 1,
+        },
+        # Every create is a new hold, not a replay of an earlier one
+        'headers': lambda data, n: {'Idempotency-Key': f'bench-create-{n}'},
+    },
+}
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def api_scenarios(data):
+    """
+    Build list/retrieve/search/filter/create scenarios for every router endpoint.
+
+    Each scenario is ``(name, callable(client, n) -> response)``.
+    """
+    scenarios = []
+    for prefix, viewset, basename in router.registry:
+        spec = ENDPOINTS.get(prefix)
+        if spec is None:
+            raise KeyError(f"No benchmark inputs defined for endpoint '/api/{prefix}/'")
+
+        base = f'/api/{prefix}/'
+        ids = _as_list(data[spec['ids']])
+
+        scenarios.append(
+            (f'{prefix}.list', lambda client, n, base=base: client.get(base))
+        )
+        scenarios.append(
+            (
+                f'{prefix}.retrieve',
+                lambda client, n, base=base, ids=ids: client.get(
+                    f'{base}{ids[n % len(ids)]}/'
+                ),
+            )
+        )
+        scenarios.append(
+            (
+                f'{prefix}.search',
+                lambda client, n, base=base, term=spec['search']: client.get(
+                    base, {'search': term}
+                ),
+            )
+        )
+        if spec['filter'] is not None:
+            params = spec['filter'](data)
+            scenarios.append((
+                f'{prefix}.filter',
+                lambda client, n, base=base, params=params: client.get(base, params),
+            ))
+        for label, params in spec.get('variants', {}).items():
+            path, params = params if isinstance(params, tuple) else ('', params)
+            if callable(params):
+                params = params(data)
+            scenarios.append(
+                (
+                    f'{prefix}.{label}',
+                    lambda client, n, url=f'{base}{path}', params=params: client.get(
+                        url, params
+                    ),
+                )
+            )
+        scenarios.append(
+            (
+                f'{prefix}.create',
+                lambda client, n, base=base, build=spec['create'], headers=spec.get(
+                    'headers'
+                ): client.post(
+                    base,
+                    build(data, n),
+                    content_type='application/json',
+                    headers=headers(data, n) if headers else None,
+                ),
+            )
+        )
+    return scenarios
+
+
+def task_scenarios(data):
+    """
+    Build scenarios that run Celery tasks in-process.
+    """
+    products = data['products']
+    return [
+        ('tasks.check_low_stock_products', lambda n: tasks.check_low_stock_products()),
+        (
+            'tasks.send_new_product_notification',
+            lambda n: tasks.send_new_product_notification(products[n % len(products)]),
+        ),
+        (
+            'tasks.send_product_update_notification',
+            lambda n: tasks.send_product_update_notification(
+                products[n % len(products)]
+            ),
+        ),
+    ]
@@ -0,0 +1,144 @@
+"""
+HTTP load generator for comparing WSGI and ASGI deployments.
+
+Runs against an already started server, so both serving modes are measured
+through the same network path:
+
+    python -m benchmarks.serving --url http://127.0.0.1:8001 \\
+        --user bench --password bench
+"""
+import argparse
+import base64
+import http.client
+import json
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from .runner import percentile
+
+DEFAULT_PATHS = [
+    '/api/products/',
+    '/api/products/?page=2',
+    '/api/categories/',
+    '/api/news/',
+    '/api/comments/?target_type=product',
+]
+
+
+def _worker(base, headers, paths, deadline, count, latencies, errors, lock):
+    parts = urlsplit(base)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    local_latencies = []
+    local_errors = 0
+    n = 0
+    while time.monotonic() < deadline and (count is None or n < count):
+        path = paths[n % len(paths)]
+        began = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                local_errors += 1
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(
+                parts.hostname, parts.port or 80, timeout=30
+            )
+        local_latencies.append((time.perf_counter() - began) * 1000)
+        n += 1
+    conn.close()
+    with lock:
+        latencies.extend(local_latencies)
+        errors.append(local_errors)
+
+
+def run(
+    url, user, password, concurrency, duration, requests_per_client=None, paths=None
+):
+    """
+    Hammer ``url`` with ``concurrency`` keep-alive clients for ``duration`` seconds.
+    """
+    token = base64.b64encode(f'{user}:{password}'.encode()).decode()
+    headers = {'Authorization': f'Basic {token}', 'Accept': 'application/json'}
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    started = time.monotonic()
+    deadline = started + duration
+    threads = [
+        threading.Thread(
+            target=_worker,
+            args=(url, headers, paths or DEFAULT_PATHS, deadline, requests_per_client,
+                  latencies, errors, lock),
+        )
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'throughput': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50), 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 3) if latencies else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.serving',
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        '--url', required=True, help='server base URL, e.g. http://127.0.0.1:8000'
+    )
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--concurrency', type=int, action='append',
+                        help='concurrent clients (repeatable; default 1, 16, 64)')
+    parser.add_argument(
+        '--duration', type=float, default=10, help='seconds per concurrency level'
+    )
+    parser.add_argument('--path', action='append', help='request path (repeatable)')
+    parser.add_argument('--label', default=None, help='name recorded with the results')
+    parser.add_argument('--output', default=None, help='append JSON lines to this file')
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'label':<10} {'clients':>8} {'requests':>9} {'errors':>7} "
+        f"{'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}"
+    )
+    for concurrency in args.concurrency or [1, 16, 64]:
+        result = run(
+            args.url,
+            args.user,
+            args.password,
+            concurrency,
+            args.duration,
+            paths=args.path,
+        )
+        result['label'] = args.label or args.url
+        print(
+            f"{result['label']:<10} {concurrency:>8} {result['requests']:>9} "
+            f"{result['errors']:>7} {result['throughput']:>9} "
+            f"{result['p50_ms']:>9} {result['p99_ms']:>9}"
+        )
+        if args.output:
+            with open(args.output, 'a') as fh:
+                fh.write(json.dumps(result, sort_keys=True) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Cache stampede test for ``apps.sale.hotcache``.
+
+``--readers`` threads read one key right after it is invalidated, as happens
+to a hot product's comment page when a comment is posted during a sale.
+Each run is repeated with a plain ``cache.delete`` plus ``get_or_set`` and
+with ``hotcache.expire`` plus ``get_or_compute``. The script reports how many
+times the value was computed and how long readers waited.
+
+The computation is simulated with a sleep of ``--compute-ms``, so only the
+caching protocol is measured and no dataset is needed.
+
+    python -m benchmarks.stampede
+    python -m benchmarks.stampede --readers 200 --compute-ms 100
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+KEY = 'benchmark_stampede'
+
+
+def run(readers, compute_ms, protected):
+    from django.core.cache import cache
+    from apps.sale import hotcache
+
+    computed = 0
+    lock = threading.Lock()
+
+    def compute():
+        nonlocal computed
+        with lock:
+            computed += 1
+        time.sleep(compute_ms / 1000)
+        return 'value'
+
+    def read():
+        if protected:
+            return hotcache.get_or_compute(KEY, compute, 60)
+        return cache.get_or_set(KEY, compute, 60)
+
+    read()
+    computed = 0
+    if protected:
+        hotcache.expire([KEY])
+    else:
+        cache.delete(KEY)
+
+    waits = []
+    start = threading.Barrier(readers)
+
+    def reader():
+        start.wait()
+        started = time.perf_counter()
+        read()
+        waits.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cache.delete(KEY)
+    waits.sort()
+    return {
+        'computations': computed,
+        'p50_wait_ms': round(waits[len(waits) // 2], 1),
+        'max_wait_ms': round(waits[-1], 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.stampede',
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        '--readers',
+        type=int,
+        default=100,
+        help='concurrent readers after the invalidation',
+    )
+    parser.add_argument(
+        '--compute-ms', type=float, default=50, help='time one computation takes'
+    )
+    parser.add_argument(
+        '--output', default=None, help='append a JSON line to this file'
+    )
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings.bench')
+    import django
+    django.setup()
+
+    result = {'readers': args.readers, 'compute_ms': args.compute_ms}
+    for name, protected in (('plain', False), ('hotcache', True)):
+        for key, value in run(args.readers, args.compute_ms, protected).items():
+            result[f'{name}_{key}'] = value
+    for key, value in result.items():
+        print(f'{key:<28} {value}')
+    if args.output:
+        with open(args.output, 'a') as fh:
+            fh.write(json.dumps(result, sort_keys=True) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,27 @@
+"""
+Gunicorn settings, read from the working directory when gunicorn starts.
+
+Flags on the command line (e.g. ``--workers`` in docker-compose) override
+these.
+"""
+import os
+
+# Import and warm up the application once in the master (myproject/boot.py); workers
+# are forked from it and start ready. Code changes then need a restart, not a HUP.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+
+def post_fork(server, worker):
+    # Sync workers serve requests on this thread: open the persistent connection now
+    if not server.cfg.preload_app or server.cfg.worker_class_str != 'sync':
+        return
+    from django.conf import settings
+    from django.db import connection
+
+    if settings.BOOT_WARMUP and connection.settings_dict['CONN_MAX_AGE']:
+        try:
+            connection.ensure_connection()
+        except Exception as e:
+            server.log.warning(
+                f'Worker {worker.pid} could not connect to the database: {e}'
+            )
@@ -1 +1,4 @@
-# Django project package 
\ No newline at end of file
+# Django project package 
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
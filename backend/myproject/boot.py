@@ -0,0 +1,182 @@
+"""
+Boot profiles for the process roles of a deployment.
+
+Web servers, Celery workers and Celery beat run the same settings, but each
+needs only part of ``INSTALLED_APPS``: web processes never run the Celery
+admin apps or the ``django_extensions`` commands, and workers serve neither
+the admin nor the API filters. ``PROCESS_ROLE`` (``web``, ``worker`` or
+``beat``) selects the trimmed set. The entry points set it themselves:
+``wsgi.py``/``asgi.py`` to ``web`` and ``myproject.celery`` from the
+``celery`` command line. It stays empty for ``manage.py``, so management
+commands such as ``migrate`` always see every app.
+
+``warm_up`` then does, once in the master process, the work a worker would
+otherwise do on its first request or task: loading translations, model
+metadata, the URL resolver with the routers behind it, DRF settings and
+serializer fields, and the hot cache entries. With ``preload_app`` (see
+``gunicorn.conf.py``) and Celery's prefork pool, every worker starts from
+that state.
+
+This module is imported by the settings, so it must not import models at
+module level.
+"""
+import logging
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+WORKER_EXCLUDED_APPS = (
+    'django.contrib.admin',
+    'django.contrib.messages',
+    'corsheaders',
+    'django_filters',
+    'django_extensions',
+)
+
+# Apps each role runs without; an empty role keeps them all
+EXCLUDED_APPS = {
+    'web': (
+        'django_extensions',
+        'celery',
+        'django_celery_beat',
+        'django_celery_results',
+    ),
+    'worker': WORKER_EXCLUDED_APPS + ('django_celery_beat',),
+    'beat': WORKER_EXCLUDED_APPS
+    + ('django.contrib.staticfiles', 'django_celery_results'),
+}
+
+ROLES = tuple(EXCLUDED_APPS)
+
+
+def role_apps(installed_apps, role):
+    """
+    ``installed_apps`` without the apps ``role`` does not use.
+    """
+    if not role:
+        return list(installed_apps)
+    if role not in EXCLUDED_APPS:
+        raise ImproperlyConfigured(
+            f'PROCESS_ROLE must be one of {", ".join(ROLES)}, not {role!r}'
+        )
+    return [app for app in installed_apps if app not in EXCLUDED_APPS[role]]
+
+
+def celery_role(argv):
+    """
+    The role of a ``celery`` command line, e.g. ``celery -A myproject worker``; empty
+    for anything else.
+    """
+    for arg in argv[1:]:
+        if arg in ('worker', 'beat'):
+            return arg
+    return ''
+
+
+def _load_translations():
+    from django.conf import settings
+    from django.utils import translation
+
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.deactivate()
+
+
+def _load_models():
+    from django.apps import apps
+
+    # Builds the relation tree and field caches of every model
+    for model in apps.get_models():
+        model._meta.get_fields()
+
+
+def _load_urls():
+    from django.urls import get_resolver
+
+    # Imports every view and builds the router patterns and reverse lookups
+    resolver = get_resolver()
+    resolver.reverse_dict
+    for prefix, sub_resolver in resolver.namespace_dict.values():
+        sub_resolver.reverse_dict
+
+
+def _load_api():
+    from rest_framework.settings import api_settings
+
+    from apps.sale.urls import router
+
+    # DRF imports the renderer, parser, pagination, ... classes on first access
+    for name in api_settings.defaults:
+        getattr(api_settings, name)
+
+    for prefix, viewset_class, basename in router.registry:
+        for name in ('serializer_class', 'list_serializer_class'):
+            serializer_class = getattr(viewset_class, name, None)
+            if serializer_class is not None:
+                serializer_class().fields
+
+
+def _load_tasks():
+    from myproject.celery import app
+
+    app.loader.import_default_modules()
+
+
+def _fill_caches():
+    from django.conf import settings
+
+    from apps.sale import facets, storefront
+    from apps.sale.models import Product
+
+    storefront.get_document()
+    facets.facets(Product.objects.all(), {})
+    if settings.PRODUCT_SUGGEST_WARMUP:
+        from apps.sale import suggest
+
+        suggest.warm_up()
+
+
+STEPS = {
+    'web': (_load_translations, _load_models, _load_urls, _load_api, _fill_caches),
+    'worker': (_load_translations, _load_models, _load_tasks, _load_urls),
+    'beat': (_load_tasks,),
+}
+
+# What ``import_report`` measures: the imports of a role, without database access
+IMPORT_STEPS = {
+    'web': (_load_urls, _load_api),
+    'worker': (_load_tasks, _load_urls),
+    'beat': (_load_tasks,),
+}
+
+
+def import_role(role):
+    """
+    Import what a ``role`` process imports while booting.
+    """
+    for step in IMPORT_STEPS[role]:
+        step()
+
+
+def warm_up(role):
+    """
+    Run the boot steps of ``role`` now, e.g. in the master process before it forks
+    workers.
+
+    A failing step is logged and skipped: the worker still starts and does
+    that work on first use instead.
+    """
+    from django.db import connections
+
+    started = time.monotonic()
+    for step in STEPS[role]:
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f'Boot warm-up step {step.__name__} failed: {e}')
+    # Forked workers must not share the master's database connections
+    connections.close_all()
+    logger.info(
+        f'Boot warm-up for {role} took {(time.monotonic() - started) * 1000:.0f}ms'
+    )
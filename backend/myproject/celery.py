@@ -1,13 +1,23 @@
 """
 Celery configuration for myproject.
 """
+import logging
 import os
+import sys
 
 from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_init
+
+from myproject import boot
+from myproject.log import bind_task_id, unbind_task_id
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings.dev')
 
+# `celery worker` and `celery beat` run a trimmed app set (see myproject/boot.py)
+if boot.celery_role(sys.argv):
+    os.environ.setdefault('PROCESS_ROLE', boot.celery_role(sys.argv))
+
 app = Celery('myproject')
 
 # Using a string here means the worker doesn't have to serialize
@@ -17,7 +27,22 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+# Log records written while a task runs carry its id
+task_prerun.connect(bind_task_id, weak=False)
+task_postrun.connect(unbind_task_id, weak=False)
+
+logger = logging.getLogger(__name__)
+
+
+@worker_init.connect
+def warm_up_worker(**kwargs):
+    # Runs in the main process, before the prefork pool starts its children
+    from django.conf import settings
+
+    if settings.BOOT_WARMUP:
+        boot.warm_up('worker')
+
 
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
-    print(f'Request: {self.request!r}') 
\ No newline at end of file
+    logger.info(f'Request: {self.request!r}') 
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""
+Read-replica database routing.
+
+Reads go to a healthy replica only when the current unit of work has opted
+in: safe-method HTTP requests (via ``ReplicaRoutingMiddleware``) and code
+wrapped in ``use_replicas()``, such as read-only Celery tasks. Everything
+else, including any read issued by a client shortly after it wrote, goes to
+the primary so callers always see their own writes.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+_replicas_allowed = ContextVar('replicas_allowed', default=False)
+
+_health = {}
+_health_lock = threading.Lock()
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+@contextmanager
+def use_replicas(allowed=True):
+    """
+    Allow (or forbid) reads from replicas for the enclosed block.
+    """
+    token = _replicas_allowed.set(allowed)
+    try:
+        yield
+    finally:
+        _replicas_allowed.reset(token)
+
+
+def replica_lag(alias):
+    """
+    Return the replication lag of ``alias`` in seconds.
+    """
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRES_LAG_SQL)
+            return float(cursor.fetchone()[0])
+        cursor.execute('SELECT 1')
+        return 0.0
+
+
+def is_healthy(alias):
+    """
+    Whether ``alias`` is reachable and within the allowed lag.
+
+    Results are cached per process for ``REPLICA_HEALTH_CHECK_INTERVAL``
+    seconds so the check costs at most one query per interval.
+    """
+    now = time.monotonic()
+    interval = getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 5)
+    cached = _health.get(alias)
+    if cached and now - cached[1] < interval:
+        return cached[0]
+
+    with _health_lock:
+        cached = _health.get(alias)
+        if cached and now - cached[1] < interval:
+            return cached[0]
+        try:
+            lag = replica_lag(alias)
+            healthy = lag <= getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 10)
+            if not healthy:
+                logger.warning(
+                    f"Replica '{alias}' is lagging by {lag:.1f}s; reading from primary"
+                )
+        except Exception as e:
+            logger.warning(f"Replica '{alias}' is unavailable: {e}")
+            connections[alias].close()
+            healthy = False
+        _health[alias] = (healthy, now)
+        return healthy
+
+
+class ReplicaRouter:
+    """
+    Send opted-in reads to a healthy replica and everything else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _replicas_allowed.get():
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if is_healthy(alias)]
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route safe-method requests to replicas unless the client wrote recently.
+
+    Unsafe requests are served entirely from the primary and set a short-lived
+    cookie that keeps the client's following reads on the primary, so it
+    never sees a replica that has not caught up with its own write yet.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with use_replicas(self.replicas_allowed(request)):
+            response = self.get_response(request)
+        return self.pin_after_write(request, response)
+
+    async def __acall__(self, request):
+        with use_replicas(self.replicas_allowed(request)):
+            response = await self.get_response(request)
+        return self.pin_after_write(request, response)
+
+    def replicas_allowed(self, request):
+        return (
+            request.method in SAFE_METHODS
+            and bool(settings.DATABASE_REPLICAS)
+            and settings.REPLICA_PIN_COOKIE not in request.COOKIES
+        )
+
+    def pin_after_write(self, request, response):
+        if request.method not in SAFE_METHODS and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,299 @@
+"""
+Non-blocking, structured logging.
+
+Request threads only put records on a bounded in-memory queue
+(``NonBlockingQueueHandler``). A background listener thread formats them and
+writes them to the real handlers (files, console), so a slow disk or a full
+stdout pipe never holds up a request. When the queue is full, records are
+dropped (or the oldest one is) according to the configured policy, and the
+drop count is logged once the queue has room again.
+
+``RequestIdMiddleware`` and the Celery task signals put a request or task id
+in a context variable. ``ContextFilter`` stamps the id on every record, and
+``JsonFormatter`` writes records as one JSON object per line.
+``RateLimitFilter`` caps how many debug records each logger may emit per
+second.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+request_id_var = ContextVar('request_id', default=None)
+task_id_var = ContextVar('task_id', default=None)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+OVERFLOW_POLICIES = ('drop', 'drop_oldest', 'block')
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {
+    'message', 'asctime', 'request_id', 'task_id', 'suppressed',
+}
+
+
+class RequestIdMiddleware:
+    """
+    Tag each request with an id: the client's ``X-Request-ID`` or a new one.
+
+    The id is available to every log record of the request and is echoed in
+    the response header, so client reports can be matched to server logs.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = request_id_var.set(self.request_id(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id_var.reset(token)
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        token = request_id_var.set(self.request_id(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_id_var.reset(token)
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+    def request_id(self, request):
+        supplied = request.headers.get(REQUEST_ID_HEADER, '')
+        # Bounded and printable, since it is copied into every log line
+        if supplied and len(supplied) <= 64 and supplied.isprintable():
+            request.request_id = supplied
+        else:
+            request.request_id = uuid.uuid4().hex
+        return request.request_id
+
+
+def bind_task_id(task_id=None, **kwargs):
+    """
+    ``task_prerun`` receiver: tag the task's log records with its id.
+    """
+    task_id_var.set(task_id)
+
+
+def unbind_task_id(**kwargs):
+    """
+    ``task_postrun`` receiver.
+    """
+    task_id_var.set(None)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copy the current request and task ids onto the record.
+
+    Attached to the queue handler, so it runs in the thread that logged; the
+    listener thread has no context of its own.
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.task_id = task_id_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most ``rate`` records per second per logger through, with bursts up to
+    ``burst``.
+
+    Only records at or below ``level`` (DEBUG by default) are limited. The
+    next record let through carries the number suppressed in ``suppressed``.
+    """
+
+    def __init__(self, rate=20, burst=None, level=logging.DEBUG):
+        super().__init__()
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, suppressed = self._buckets.get(
+                record.name, (self.burst, now, 0)
+            )
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[record.name] = (tokens, now, suppressed + 1)
+                return False
+            self._buckets[record.name] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record, including request/task ids and ``extra`` fields.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+        }
+        for key in ('request_id', 'task_id', 'suppressed'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+    def formatTime(self, record, datefmt=None):
+        return (
+            time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))
+            + f'.{int(record.msecs):03d}Z'
+        )
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full of records; wait for room
+        # rather than lose the stop signal
+        self.queue.put(self._sentinel, timeout=5)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to a listener thread that writes them to ``handlers``.
+
+    Configure it with ``'()'`` rather than ``'class'``, which Python 3.12+
+    ``dictConfig`` handles specially for queue handlers. ``handlers`` names
+    handlers of the same ``LOGGING`` config; ``dictConfig`` builds handlers in
+    name order, so theirs must sort first. The listener starts on first use,
+    once per process, so it also runs in forked gunicorn and Celery workers.
+    ``overflow`` decides what happens when ``maxsize`` records are waiting:
+    ``drop`` the new record, ``drop_oldest`` to make room, or ``block`` the
+    caller until there is room.
+    """
+
+    def __init__(self, handlers, maxsize=10000, overflow='drop'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of: {', '.join(OVERFLOW_POLICIES)}")
+        super().__init__(queue.Queue(maxsize))
+        # Held here: the logging module only keeps weak references to named handlers
+        self.handlers = []
+        for name in handlers:
+            handler = logging._handlers.get(name)
+            if handler is None:
+                raise ValueError(
+                    f'Unknown handler {name!r}; it must be configured before this one'
+                )
+            self.handlers.append(handler)
+        self.overflow = overflow
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A listener inherited through fork has no thread behind it
+            self.queue = queue.Queue(self.queue.maxsize)
+            self._listener = _Listener(
+                self.queue, *self.handlers, respect_handler_level=True
+            )
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+
+    def stop(self):
+        listener, self._listener = self._listener, None
+        if listener is not None and self._pid == os.getpid():
+            listener.stop()
+
+    def prepare(self, record):
+        # Only what cannot wait: arguments may change after the call returns.
+        # Formatting is left to the listener, and the record is not copied, which
+        # would cost as much as a write.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            if self.dropped:
+                self._report_dropped()
+            self.enqueue(self.prepare(record))
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def enqueue(self, record):
+        if self.overflow == 'block':
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow != 'drop_oldest':
+                raise
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.dropped += 1
+            self.queue.put_nowait(record)
+
+    def _report_dropped(self):
+        dropped, self.dropped = self.dropped, 0
+        record = logging.LogRecord(
+            __name__,
+            logging.WARNING,
+            __file__,
+            0,
+            f'Log queue overflowed; dropped {dropped} records',
+            None,
+            None,
+        )
+        record.dropped = dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += dropped
@@ -5,6 +5,9 @@ import os
 from pathlib import Path
 
 import environ
+from celery.schedules import crontab
+
+from myproject import boot
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -43,9 +46,19 @@ LOCAL_APPS = [
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
+# Process role (web, worker or beat), set by the entry points; each role runs a trimmed
+# app set, see myproject/boot.py. Empty for manage.py, which always gets every app.
+PROCESS_ROLE = env('PROCESS_ROLE', default='')
+INSTALLED_APPS = boot.role_apps(INSTALLED_APPS, PROCESS_ROLE)
+# Warm up models, URLs, serializers and hot caches in the master
+# process before forking workers
+BOOT_WARMUP = env.bool('BOOT_WARMUP', default=False)
+
 MIDDLEWARE = [
+    'myproject.log.RequestIdMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'myproject.db_router.ReplicaRoutingMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,12 +88,46 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'myproject.wsgi.application'
+ASGI_APPLICATION = 'myproject.asgi.application'
+
+# Serve JSON list/retrieve through async views (ASGI deployments only)
+ASYNC_SERVING = env.bool('ASYNC_SERVING', default=False)
+
+# WhiteNoise is sync-only and would push every ASGI request through a thread;
+# nginx serves /static/ in front of the ASGI workers instead.
+if ASYNC_SERVING:
+    MIDDLEWARE = [
+        middleware for middleware in MIDDLEWARE if 'whitenoise' not in middleware
+    ]
 
 # Database
 DATABASES = {
     'default': env.db('DATABASE_URL', default='sqlite:///db.sqlite3')
 }
 
+# Read replicas, e.g.
+# DATABASE_REPLICA_URLS=postgres://...@replica1/db,postgres://...@replica2/db
+# For local testing two SQLite files work: sqlite:////tmp/replica.sqlite3
+DATABASE_REPLICAS = []
+for index, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[]), start=1):
+    DATABASES[f'replica_{index}'] = env.db_url_config(url)
+    DATABASES[f'replica_{index}']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['myproject.db_router.ReplicaRouter']
+
+# Replicas lagging more than this fall back to the primary
+REPLICA_MAX_LAG_SECONDS = env.int('REPLICA_MAX_LAG_SECONDS', default=10)
+REPLICA_HEALTH_CHECK_INTERVAL = env.int('REPLICA_HEALTH_CHECK_INTERVAL', default=5)
+# Keep a client on the primary for this long after it writes. A replica still
+# counted as healthy may lag up to REPLICA_MAX_LAG_SECONDS plus one health check
+# interval, so the pin lasts at least that.
+REPLICA_PIN_SECONDS = max(
+    env.int('REPLICA_PIN_SECONDS', default=0),
+    REPLICA_MAX_LAG_SECONDS + REPLICA_HEALTH_CHECK_INTERVAL,
+)
+REPLICA_PIN_COOKIE = 'db_primary_pin'
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -114,6 +161,101 @@ STATICFILES_DIRS = [
 MEDIA_URL = env('MEDIA_URL', default='/media/')
 MEDIA_ROOT = BASE_DIR / env('MEDIA_ROOT', default='media')
 
+# Product listing facets
+PRODUCT_PRICE_BUCKETS = [10, 25, 50, 100, 250, 500]
+PRODUCT_FACET_SUMMARY_TIMEOUT = 60 * 5
+PRODUCT_FACET_CACHE_TIMEOUT = 60
+
+# Product autocomplete, served from an in-memory index in each worker
+PRODUCT_SUGGEST_INDEX_SIZE = env.int('PRODUCT_SUGGEST_INDEX_SIZE', default=200000)
+PRODUCT_SUGGEST_MAX_RESULTS = 20
+PRODUCT_SUGGEST_CHECK_INTERVAL = 5
+PRODUCT_SUGGEST_WARMUP = env.bool('PRODUCT_SUGGEST_WARMUP', default=False)
+
+# Popularity counters, buffered in Redis and flushed to the database by Celery beat
+POPULARITY_REDIS_URL = env('POPULARITY_REDIS_URL', default=env('REDIS_URL', default=''))
+POPULARITY_FLUSH_INTERVAL = 30
+POPULARITY_HALF_LIFE_DAYS = 7
+POPULARITY_WEIGHTS = {'view': 1, 'sale': 20}
+
+# Stock and price updates pushed to product pages (/api/push/, ASGI only). Without
+# Redis, updates only reach connections of the process that made the change.
+PUSH_REDIS_URL = env('PUSH_REDIS_URL', default=env('REDIS_URL', default=''))
+# Updates to a product within this window go out as one
+PUSH_COALESCE_SECONDS = 0.5
+# Keeps idle Server-Sent Events streams open through proxies
+PUSH_HEARTBEAT_SECONDS = 25
+PUSH_MAX_SUBSCRIPTIONS = 200
+
+# Related products, rebuilt nightly by Celery beat
+RELATED_PRODUCTS_COUNT = 10
+RELATED_MAX_BASKET_SIZE = 200
+RELATED_CATEGORY_WEIGHT = 0.1
+
+# Change feeds (/api/<collection>/changes/)
+CHANGE_FEED_PAGE_SIZE = 500
+CHANGE_FEED_MAX_PAGE_SIZE = 1000
+CHANGE_FEED_SETTLE_SECONDS = 2
+CHANGE_FEED_TOMBSTONE_DAYS = 30
+
+# Soft deletes, archived to sale_archived_row nightly once past retention.
+# Keep retention >= the tombstone period: change feeds report the rows until then.
+SOFT_DELETE_RETENTION_DAYS = CHANGE_FEED_TOMBSTONE_DAYS
+SOFT_DELETE_ARCHIVE_BATCH_SIZE = 500
+
+# Admin changelists count exactly up to this many rows; past it,
+# unfiltered lists use the planner's row estimate and filtered lists stop
+# counting (and paginating) at the limit
+ADMIN_EXACT_COUNT_LIMIT = env.int('ADMIN_EXACT_COUNT_LIMIT', default=10000)
+
+# Hot cache keys (comment first pages, facets, top-rated ranking): once a
+# key is due, one process recomputes it while the others serve the old value
+# for up to HOT_CACHE_STALE_SECONDS
+HOT_CACHE_STALE_SECONDS = env.int('HOT_CACHE_STALE_SECONDS', default=300)
+# Longest a recomputation may hold a key's lock before another process tries
+HOT_CACHE_LOCK_SECONDS = env.int('HOT_CACHE_LOCK_SECONDS', default=10)
+# Keys read at least this often per minute are recomputed by
+# Celery right after invalidation
+HOT_CACHE_WARM_READS = env.int('HOT_CACHE_WARM_READS', default=30)
+
+# Checkout stock reservations (apps/sale/inventory.py). Holds expire after
+# INVENTORY_HOLD_SECONDS; each product's reservable units are split over
+# INVENTORY_SHARDS rows so hot products don't serialize on one row lock.
+INVENTORY_HOLD_SECONDS = env.int('INVENTORY_HOLD_SECONDS', default=600)
+INVENTORY_SHARDS = env.int('INVENTORY_SHARDS', default=8)
+INVENTORY_SWEEP_INTERVAL = 15
+INVENTORY_RECONCILE_INTERVAL = 30
+
+# Batch multi-get (?ids= / batch-get/)
+BATCH_GET_MAX_KEYS = 500
+BATCH_GET_CACHE_TIMEOUT = 60
+
+# Per-row fragments list pages are assembled from; versioned, so this only
+# bounds how long unversioned details (usernames, decayed popularity) can lag
+# and how long idle rows stay cached
+FRAGMENT_CACHE_TIMEOUT = env.int('FRAGMENT_CACHE_TIMEOUT', default=300)
+
+# Storefront home-page document (/api/storefront/)
+STOREFRONT_NEWS_COUNT = 5
+STOREFRONT_PROMOTION_COUNT = 5
+STOREFRONT_PROMOTION_PRODUCT_COUNT = 8
+STOREFRONT_FEATURED_COUNT = 12
+STOREFRONT_TOP_RATED_COUNT = 12
+STOREFRONT_MIN_RATINGS = 5
+STOREFRONT_TOP_RATED_TIMEOUT = 600
+STOREFRONT_REFRESH_INTERVAL = 10
+STOREFRONT_MAX_AGE = 30
+
+# Image variants, generated lazily by Celery on first request
+IMAGE_VARIANT_WIDTHS = [160, 320, 640, 1024, 1600]
+IMAGE_VARIANT_FORMATS = ['avif', 'webp', 'jpeg']
+IMAGE_VARIANT_QUALITY = env.int('IMAGE_VARIANT_QUALITY', default=80)
+IMAGE_MAX_BYTES = 20 * 1024 * 1024
+IMAGE_FETCH_TIMEOUT = 10
+# Hosts image_url may be fetched from, as in ALLOWED_HOSTS
+# ('.example.com' matches subdomains)
+IMAGE_FETCH_HOSTS = env.list('IMAGE_FETCH_HOSTS', default=[])
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -150,6 +292,91 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Four queues, each with its own worker (see docker-compose.prod.yml), so a
+# slow SMTP server, a slow image host or a nightly rebuild cannot hold the
+# slots that price and storefront updates need. Unrouted tasks are
+# latency-sensitive by default.
+CELERY_TASK_DEFAULT_QUEUE = 'interactive'
+CELERY_TASK_ROUTES = {
+    # Outbound mail, at most once
+    'apps.sale.tasks.send_new_product_notification': {'queue': 'notifications'},
+    'apps.sale.tasks.send_product_update_notification': {'queue': 'notifications'},
+    'apps.sale.tasks.check_low_stock_products': {'queue': 'notifications'},
+    # Image downloads and decoding, up to a minute each
+    'apps.sale.tasks.ingest_product_image': {'queue': 'images'},
+    'apps.sale.tasks.process_product_image': {'queue': 'images'},
+    # Batch jobs that may run for minutes
+    'apps.sale.tasks.refresh_promotion_prices': {'queue': 'bulk'},
+    'apps.sale.tasks.refresh_price_boundaries': {'queue': 'bulk'},
+    'apps.sale.tasks.build_related_products': {'queue': 'bulk'},
+    'apps.sale.tasks.purge_tombstones': {'queue': 'bulk'},
+    'apps.sale.tasks.archive_deleted_rows': {'queue': 'bulk'},
+}
+# Long tasks must not queue up prefetched behind each other;
+# the interactive worker raises it
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Only batch jobs keep results (their counts), and only for a day
+CELERY_RESULT_EXPIRES = 60 * 60 * 24
+
+CELERY_BEAT_SCHEDULE = {
+    # Promotions open and close at date boundaries
+    'refresh-price-boundaries': {
+        'task': 'apps.sale.tasks.refresh_price_boundaries',
+        'schedule': crontab(minute=1, hour=0),
+    },
+    # Buffered view/sale counters
+    'flush-popularity': {
+        'task': 'apps.sale.tasks.flush_popularity',
+        'schedule': float(POPULARITY_FLUSH_INTERVAL),
+        # A backed-up worker skips stale runs instead of replaying them all
+        'options': {'expires': float(POPULARITY_FLUSH_INTERVAL)},
+    },
+    # Full recommendation rebuild, outside peak traffic
+    'build-related-products': {
+        'task': 'apps.sale.tasks.build_related_products',
+        'schedule': crontab(minute=0, hour=3),
+    },
+    # Hard-delete markers older than a client may go without syncing
+    'purge-tombstones': {
+        'task': 'apps.sale.tasks.purge_tombstones',
+        'schedule': crontab(minute=30, hour=3),
+    },
+    # Soft-deleted rows past their retention move to the archive table
+    'archive-deleted-rows': {
+        'task': 'apps.sale.tasks.archive_deleted_rows',
+        'schedule': crontab(minute=0, hour=4),
+    },
+    # Keeps the per-category facet summary warm for storefront listings
+    'refresh-product-facets': {
+        'task': 'apps.sale.tasks.refresh_product_facets',
+        'schedule': 60.0,
+        'options': {'expires': 60.0},
+    },
+    # Re-renders the storefront document after catalog changes
+    'refresh-storefront': {
+        'task': 'apps.sale.tasks.refresh_storefront',
+        'schedule': float(STOREFRONT_REFRESH_INTERVAL),
+        'options': {'expires': float(STOREFRONT_REFRESH_INTERVAL)},
+    },
+    # Lapsed checkout holds give their stock back
+    'expire-stock-holds': {
+        'task': 'apps.sale.tasks.expire_stock_holds',
+        'schedule': float(INVENTORY_SWEEP_INTERVAL),
+        'options': {'expires': float(INVENTORY_SWEEP_INTERVAL)},
+    },
+    # Committed reservations leave Product.stock_quantity in batches
+    'reconcile-stock': {
+        'task': 'apps.sale.tasks.reconcile_stock',
+        'schedule': float(INVENTORY_RECONCILE_INTERVAL),
+        'options': {'expires': float(INVENTORY_RECONCILE_INTERVAL)},
+    },
+    # Daily restock reminder
+    'check-low-stock-products': {
+        'task': 'apps.sale.tasks.check_low_stock_products',
+        'schedule': crontab(minute=0, hour=7),
+    },
+}
+
 # Email configuration
 EMAIL_BACKEND = env('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
 EMAIL_HOST = env('EMAIL_HOST', default='')
@@ -157,6 +384,8 @@ EMAIL_PORT = env.int('EMAIL_PORT', default=587)
 EMAIL_USE_TLS = env.bool('EMAIL_USE_TLS', default=True)
 EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
+# Seconds before a stalled SMTP server fails the send instead of holding a worker
+EMAIL_TIMEOUT = env.int('EMAIL_TIMEOUT', default=10)
 
 # Security settings
 SECURE_BROWSER_XSS_FILTER = True
@@ -168,4 +397,4 @@ CSRF_TRUSTED_ORIGINS = env.list('CSRF_TRUSTED_ORIGINS', default=[])
 INTERNAL_IPS = [
     '127.0.0.1',
     'localhost',
-] 
\ No newline at end of file
+] 
@@ -8,6 +8,9 @@ DEBUG = env.bool('DEBUG', default=False)
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=[])
 
+# Warm up each process before it forks its workers (see myproject/boot.py)
+BOOT_WARMUP = env.bool('BOOT_WARMUP', default=True)
+
 # Security settings for production
 SECURE_SSL_REDIRECT = env.bool('SECURE_SSL_REDIRECT', default=True)
 SECURE_HSTS_SECONDS = env.int('SECURE_HSTS_SECONDS', default=31536000)
@@ -16,9 +19,17 @@ SECURE_HSTS_PRELOAD = env.bool('SECURE_HSTS_PRELOAD', default=True)
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 # Database
-DATABASES = {
-    'default': env.db('DATABASE_URL')
-}
+DATABASES['default'] = env.db('DATABASE_URL')
+
+# Reuse connections across requests and ping them before reuse. Under ASGI,
+# set CONN_MAX_AGE=0 and point DATABASE_URL at PgBouncer (transaction pooling
+# with server_check_query and server_lifetime) - see docker-compose.asgi.yml.
+for alias in DATABASES:
+    DATABASES[alias]['CONN_MAX_AGE'] = env.int('CONN_MAX_AGE', default=60)
+    DATABASES[alias]['CONN_HEALTH_CHECKS'] = True
+    DATABASES[alias]['DISABLE_SERVER_SIDE_CURSORS'] = env.bool(
+        'DATABASE_DISABLE_SERVER_SIDE_CURSORS', default=False
+    )
 
 # Static files (CSS, JavaScript, Images)
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
@@ -32,46 +43,67 @@ EMAIL_HOST_USER = env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = env('EMAIL_HOST_USER')
 
-# Logging
+# Logging: request threads only enqueue records; a listener thread writes them
+# as JSON lines (myproject/log.py). When the queue is full, LOG_QUEUE_OVERFLOW
+# decides: drop the new record, drop_oldest, or block the caller.
+LOG_LEVEL = env('LOG_LEVEL', default='INFO')
+LOG_QUEUE_SIZE = env.int('LOG_QUEUE_SIZE', default=10000)
+LOG_QUEUE_OVERFLOW = env('LOG_QUEUE_OVERFLOW', default='drop')
+# Debug records per second per logger when LOG_LEVEL=DEBUG
+LOG_DEBUG_RATE = env.int('LOG_DEBUG_RATE', default=20)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
-            'style': '{',
+    'filters': {
+        'context': {
+            '()': 'myproject.log.ContextFilter',
         },
-        'simple': {
-            'format': '{levelname} {message}',
-            'style': '{',
+        'debug_rate': {
+            '()': 'myproject.log.RateLimitFilter',
+            'rate': LOG_DEBUG_RATE,
+        },
+    },
+    'formatters': {
+        'json': {
+            '()': 'myproject.log.JsonFormatter',
         },
     },
     'handlers': {
+        # Written to by the listener thread only
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
         'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'logging.handlers.WatchedFileHandler',
             'filename': BASE_DIR / 'logs' / 'django.log',
-            'formatter': 'verbose',
+            'formatter': 'json',
         },
-        'console': {
-            'level': 'INFO',
-            'class': 'logging.StreamHandler',
-            'formatter': 'simple',
+        # Named to sort after the handlers it writes to
+        'queue': {
+            '()': 'myproject.log.NonBlockingQueueHandler',
+            'handlers': ['console', 'file'],
+            'maxsize': LOG_QUEUE_SIZE,
+            'overflow': LOG_QUEUE_OVERFLOW,
+            'filters': ['context', 'debug_rate'],
         },
     },
     'root': {
-        'handlers': ['console', 'file'],
-        'level': 'INFO',
+        'handlers': ['queue'],
+        'level': LOG_LEVEL,
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': False,
         },
     },
 }
+# Celery workers log through the same pipeline instead of their own handlers
+CELERY_WORKER_HIJACK_ROOT_LOGGER = False
 
 # Remove debug toolbar in production
 MIDDLEWARE = [middleware for middleware in MIDDLEWARE if 'debug_toolbar' not in middleware]
-INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'debug_toolbar'] 
\ No newline at end of file
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'debug_toolbar'] 
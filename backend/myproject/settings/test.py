@@ -0,0 +1,49 @@
+"""
+Test settings for Django project.
+"""
+import os
+
+# Tests need no secrets; a real key from the environment still wins
+os.environ.setdefault('SECRET_KEY', 'test-only-secret-key')
+
+from .base import *
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['testserver', 'localhost', '127.0.0.1']
+
+# Database
+# SQLite by default. The test database is a file rather than in memory, so tests
+# that run checkouts on several threads see each other's writes.
+DATABASES['default'] = env.db(
+    'DATABASE_URL', default=f"sqlite:///{BASE_DIR / 'test.sqlite3'}"
+)
+DATABASES['default']['TEST'] = {'NAME': str(BASE_DIR / 'test_db.sqlite3')}
+
+# Keep the cache in-process so tests run without Redis
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Buffer popularity counters in-process
+POPULARITY_REDIS_URL = ''
+
+# Push product updates to this process's connections only
+PUSH_REDIS_URL = ''
+
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+# Run tasks in-process and capture mail instead of sending it
+CELERY_TASK_ALWAYS_EAGER = True
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE if 'debug_toolbar' not in middleware
+]
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'debug_toolbar']
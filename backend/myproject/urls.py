@@ -1,16 +1,20 @@
 """
 URL configuration for myproject project.
 """
+from django.apps import apps
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('apps.sale.urls')),
 ]
 
+# Left out of Celery processes (see myproject/boot.py), which only reverse API URLs
+if apps.is_installed('django.contrib.admin'):
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
+
 # Serve static and media files in development
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -5,6 +5,20 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from myproject import boot
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings.prod')
+os.environ.setdefault('PROCESS_ROLE', 'web')
+
+application = get_wsgi_application()
+
+# Do the first request's work now; with preload_app this
+# runs once in the gunicorn master
+from django.conf import settings  # noqa: E402
+
+if settings.BOOT_WARMUP:
+    boot.warm_up('web')
+elif settings.PRODUCT_SUGGEST_WARMUP:
+    from apps.sale import suggest  # noqa: E402
 
-application = get_wsgi_application() 
\ No newline at end of file
+    suggest.warm_up()
@@ -0,0 +1,49 @@
+#!/bin/bash
+
+# Compare the WSGI (gunicorn sync workers) and ASGI (uvicorn workers with
+# async read views) deployments on the same seeded database.
+#
+# Usage: ./scripts/compare_serving.sh [products] [workers]
+# Set DATABASE_URL to benchmark a local PostgreSQL instead of SQLite.
+set -e
+
+PRODUCTS=${1:-20000}
+WORKERS=${2:-4}
+DURATION=${DURATION:-10}
+RESULTS=${RESULTS:-serving-results.jsonl}
+
+export DJANGO_SETTINGS_MODULE=myproject.settings.bench
+export DATABASE_URL=${DATABASE_URL:-sqlite:///$(pwd)/bench.sqlite3}
+
+echo "🗄️ Preparing database ($DATABASE_URL)..."
+python manage.py migrate --noinput -v 0
+python manage.py seed_catalog --products "$PRODUCTS" --prefix serving 2>/dev/null || echo "   catalog already seeded"
+python manage.py shell -c "
+from apps.sale.models import Role, User
+role, _ = Role.objects.get_or_create(name='bench')
+user, _ = User.objects.get_or_create(username='bench', defaults={'role': role})
+user.set_password('bench')
+user.save()
+"
+rm -f "$RESULTS"
+
+serve() {
+    "$@" > /dev/null 2>&1 &
+    SERVER_PID=$!
+    sleep 3
+}
+
+echo "🐢 WSGI: gunicorn --workers $WORKERS"
+serve gunicorn --bind 127.0.0.1:8001 --workers "$WORKERS" myproject.wsgi:application
+python -m benchmarks.serving --url http://127.0.0.1:8001 --user bench --password bench \
+    --duration "$DURATION" --label wsgi --output "$RESULTS"
+kill $SERVER_PID; wait $SERVER_PID 2>/dev/null || true
+
+echo "🚀 ASGI: gunicorn --workers $WORKERS --worker-class uvicorn.workers.UvicornWorker"
+ASYNC_SERVING=True serve gunicorn --bind 127.0.0.1:8002 --workers "$WORKERS" \
+    --worker-class uvicorn.workers.UvicornWorker myproject.asgi:application
+python -m benchmarks.serving --url http://127.0.0.1:8002 --user bench --password bench \
+    --duration "$DURATION" --label asgi --output "$RESULTS"
+kill $SERVER_PID; wait $SERVER_PID 2>/dev/null || true
+
+echo "✅ Results written to $RESULTS"
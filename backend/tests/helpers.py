@@ -0,0 +1,49 @@
+"""
+Small builders for the rows most tests need.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.sale.models import Category, Product, Promotion, PromotionProduct, Role, User
+
+
+def create_user(username='buyer'):
+    role, _ = Role.objects.get_or_create(name='customer')
+    return User.objects.create(username=username, role=role)
+
+
+def create_category(user, name='Gear', **kwargs):
+    return Category.objects.create(
+        name=name, slug=kwargs.pop('slug', name.lower()), created_by=user, **kwargs
+    )
+
+
+def create_product(user, category, sku='SKU-1', **kwargs):
+    kwargs.setdefault('name', f'Product {sku}')
+    kwargs.setdefault('price', Decimal('10.00'))
+    return Product.objects.create(
+        sku=sku, slug=sku.lower(), category=category, created_by=user, **kwargs
+    )
+
+
+def create_promotion(user, products, start=None, end=None, **kwargs):
+    today = timezone.localdate()
+    kwargs.setdefault('title', 'Half price')
+    kwargs.setdefault('discount_type', Promotion.DISCOUNT_PERCENT)
+    kwargs.setdefault('discount_value', Decimal('50'))
+    promotion = Promotion.objects.create(
+        slug=kwargs['title'].lower().replace(' ', '-'), created_by=user,
+        start_date=start or today, end_date=end or today + timedelta(days=7), **kwargs
+    )
+    for product in products:
+        PromotionProduct.objects.create(
+            promotion=promotion, product=product, created_by=user
+        )
+    return promotion
+
+
+def reset_cache():
+    cache.clear()
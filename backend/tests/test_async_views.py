@@ -0,0 +1,101 @@
+"""
+Tests for the async read path (``apps.sale.async_views``) and what it hands to the sync
+viewsets.
+"""
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+from apps.sale.async_views import AsyncReadView, async_urlpatterns
+from apps.sale.urls import router
+from apps.sale.views import ProductViewSet
+
+from .helpers import create_category, create_product, create_user, reset_cache
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        reset_cache()
+        self.user = create_user()
+        self.product = create_product(self.user, create_category(self.user))
+        self.client.force_login(self.user)
+        self.factory = RequestFactory()
+        self.factory.cookies[settings.SESSION_COOKIE_NAME] = self.client.cookies[
+            settings.SESSION_COOKIE_NAME
+        ].value
+
+    def call(self, view, method, path, data=None, **kwargs):
+        """
+        Run ``view`` on a request; returns ``(response, whether the sync view
+        answered)``.
+        """
+        sync_view = mock.AsyncMock(return_value=HttpResponse('sync'))
+        with mock.patch.object(view, 'sync_view', sync_view):
+            request = getattr(self.factory, method)(
+                path, data, **kwargs.pop('headers', {})
+            )
+            response = async_to_sync(view)(request, **kwargs)
+        return response, sync_view.called
+
+    def test_plain_json_reads_stay_async(self):
+        response, synced = self.call(
+            AsyncReadView(ProductViewSet, detail=False), 'get', '/api/products/'
+        )
+
+        self.assertFalse(synced)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row['id'] for row in json.loads(response.content)['results']],
+            [self.product.pk],
+        )
+
+    def test_unsupported_requests_fall_back_to_the_sync_view(self):
+        view = AsyncReadView(ProductViewSet, detail=False)
+        cases = [
+            ('post', {}, {}),
+            ('get', {}, {'HTTP_ACCEPT': 'text/html'}),
+            ('get', {'facets': 'true'}, {}),
+            ('get', {'ids': str(self.product.pk)}, {}),
+            # Nested relations need prefetch_related
+            ('get', {'include': 'images'}, {}),
+        ]
+        for method, data, headers in cases:
+            with self.subTest(method=method, data=data, headers=headers):
+                _, synced = self.call(
+                    view, method, '/api/products/', data, headers=headers
+                )
+                self.assertTrue(synced)
+
+    def test_detail_lookups(self):
+        view = AsyncReadView(ProductViewSet, detail=True)
+
+        response, synced = self.call(
+            view, 'get', f'/api/products/{self.product.pk}/', pk=str(self.product.pk)
+        )
+        self.assertFalse(synced)
+        self.assertEqual(json.loads(response.content)['id'], self.product.pk)
+
+        response, _ = self.call(view, 'get', '/api/products/abc/', pk='abc')
+        self.assertEqual(response.status_code, 404)
+
+    def test_anonymous_reads_are_refused(self):
+        del self.factory.cookies[settings.SESSION_COOKIE_NAME]
+
+        response, synced = self.call(
+            AsyncReadView(ProductViewSet, detail=False), 'get', '/api/products/'
+        )
+
+        self.assertFalse(synced)
+        self.assertEqual(response.status_code, 403)
+
+    def test_list_actions_still_reach_the_router(self):
+        patterns = {pattern.name: pattern for pattern in async_urlpatterns(router)}
+
+        detail = patterns['product-detail-async']
+        self.assertIsNotNone(detail.resolve(f'products/{self.product.pk}/'))
+        self.assertIsNone(detail.resolve('products/suggest/'))
+        self.assertIsNone(detail.resolve('products/changes/'))
@@ -0,0 +1,96 @@
+"""
+Tests for batch reads (``views.BatchGetMixin``).
+"""
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.sale import softdelete
+from apps.sale.models import ImageAsset
+
+from .helpers import create_category, create_product, create_user, reset_cache
+
+
+class ProductBatchGetTests(TestCase):
+    def setUp(self):
+        reset_cache()
+        self.user = create_user()
+        self.category = create_category(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_results_follow_request_order_and_list_what_is_missing(self):
+        first, second, deleted = (
+            create_product(self.user, self.category, sku=sku)
+            for sku in ('SKU-1', 'SKU-2', 'SKU-3')
+        )
+        softdelete.soft_delete(deleted)
+
+        response = self.client.post('/api/products/batch-get/', {
+            'ids': [second.pk, 'nope', first.pk, deleted.pk, second.pk, 999999],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row['id'] for row in response.data['results']], [second.pk, first.pk]
+        )
+        self.assertEqual(response.data['missing'], ['nope', deleted.pk, 999999])
+
+    def test_cache_hits_and_misses_keep_request_order(self):
+        products = [
+            create_product(self.user, self.category, sku=f'SKU-{n}') for n in range(4)
+        ]
+        ids = ','.join(str(product.pk) for product in products)
+        # Warm the cache for half of them
+        self.client.get('/api/products/', {'ids': f'{products[1].pk},{products[3].pk}'})
+
+        response = self.client.get('/api/products/', {'ids': ids})
+
+        self.assertEqual(
+            [row['id'] for row in response.data['results']],
+            [product.pk for product in products],
+        )
+        self.assertEqual(response.data['missing'], [])
+
+    def test_lookup_by_another_field(self):
+        product = create_product(self.user, self.category, sku='LAMP-1')
+
+        response = self.client.get(
+            '/api/products/', {'ids': 'GONE-1,LAMP-1', 'by': 'sku'}
+        )
+        self.assertEqual([row['id'] for row in response.data['results']], [product.pk])
+        self.assertEqual(response.data['missing'], ['GONE-1'])
+
+        response = self.client.get('/api/products/', {'ids': 'LAMP-1', 'by': 'name'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(BATCH_GET_MAX_KEYS=2)
+    def test_too_many_keys_is_a_bad_request(self):
+        response = self.client.post(
+            '/api/products/batch-get/', {'ids': [1, 2, 3]}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_cached_entries_are_not_served_to_another_host(self):
+        asset = ImageAsset.objects.create(
+            sha256='a' * 64,
+            original='assets/lamp.jpg',
+            width=800,
+            height=600,
+            format='JPEG',
+            size=1024,
+        )
+        product = create_product(self.user, self.category, image_asset=asset)
+
+        for host in ('localhost', '127.0.0.1'):
+            response = self.client.post(
+                '/api/products/batch-get/',
+                {'ids': [product.pk]},
+                format='json',
+                HTTP_HOST=host,
+            )
+            self.assertTrue(
+                response.data['results'][0]['image_srcset']['src'].startswith(
+                    f'http://{host}/'
+                )
+            )
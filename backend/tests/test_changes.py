@@ -0,0 +1,117 @@
+"""
+Tests for the incremental change feeds (``apps.sale.changes``).
+"""
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.sale import changes, pricing, softdelete
+from apps.sale.models import Product
+
+from .helpers import (
+    create_category,
+    create_product,
+    create_promotion,
+    create_user,
+    reset_cache,
+)
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0)
+class ProductChangeFeedTests(TestCase):
+    def setUp(self):
+        reset_cache()
+        self.user = create_user()
+        self.category = create_category(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, cursor='', limit=None):
+        """
+        Follow the feed to its end; returns ``(upserts, deleted ids, cursor)``.
+        """
+        upserts, deleted = [], []
+        params = {'limit': limit} if limit else {}
+        while True:
+            page = self.client.get(
+                '/api/products/changes/', {'since': cursor, **params}
+            ).json()
+            upserts += page['results']
+            deleted += page['deleted']
+            cursor = page['next']
+            if not page['has_more']:
+                return upserts, deleted, cursor
+
+    def test_price_refresh_shows_up_in_the_feed(self):
+        product = create_product(self.user, self.category, price='10.00')
+        today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_promotion(
+                self.user, [product], start=today - timedelta(days=3), end=today
+            )
+        upserts, _, cursor = self.sync()
+        self.assertEqual([row['effective_price'] for row in upserts], ['5.00'])
+
+        # The promotion ended yesterday; nothing but the price job touches the product
+        pricing.refresh_boundaries(on=today + timedelta(days=1))
+
+        upserts, _, _ = self.sync(cursor)
+        self.assertEqual(
+            [(row['id'], row['effective_price']) for row in upserts],
+            [(product.pk, '10.00')],
+        )
+
+    def test_pages_split_between_rows_with_the_same_timestamp(self):
+        products = [
+            create_product(self.user, self.category, sku=f'SKU-{n}') for n in range(5)
+        ]
+        # One bulk update stamps them all alike; the id breaks the tie
+        Product.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+
+        upserts, _, cursor = self.sync(limit=2)
+
+        self.assertEqual(
+            [row['id'] for row in upserts], [product.pk for product in products]
+        )
+        self.assertEqual(self.sync(cursor)[:2], ([], []))
+
+    def test_soft_and_hard_deletes_come_back_as_deleted_ids(self):
+        kept, soft, hard = (
+            create_product(self.user, self.category, sku=sku)
+            for sku in ('KEPT', 'SOFT', 'HARD')
+        )
+        _, _, cursor = self.sync()
+
+        softdelete.soft_delete(soft)
+        Product.all_objects.filter(pk=hard.pk).delete()
+
+        upserts, deleted, _ = self.sync(cursor)
+        self.assertEqual(upserts, [])
+        self.assertEqual(sorted(deleted), sorted([soft.pk, hard.pk]))
+        self.assertNotIn(kept.pk, deleted)
+
+    @override_settings(CHANGE_FEED_SETTLE_SECONDS=60)
+    def test_rows_younger_than_the_settle_time_are_held_back(self):
+        product = create_product(self.user, self.category)
+
+        upserts, _, cursor = self.sync()
+        self.assertEqual(upserts, [])
+
+        Product.objects.filter(pk=product.pk).update(
+            updated_at=timezone.now() - timedelta(minutes=2)
+        )
+        upserts, _, _ = self.sync(cursor)
+        self.assertEqual([row['id'] for row in upserts], [product.pk])
+
+    def test_malformed_and_expired_cursors_are_rejected(self):
+        response = self.client.get('/api/products/changes/', {'since': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+        long_ago = timezone.now() - timedelta(days=31)
+        expired = changes.encode_cursor(
+            {'rows': (long_ago, 0), 'deleted': (long_ago, 0)}
+        )
+        response = self.client.get('/api/products/changes/', {'since': expired})
+        self.assertEqual(response.status_code, 410)
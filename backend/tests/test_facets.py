@@ -0,0 +1,101 @@
+"""
+Tests for product listing facets (``apps.sale.facets``).
+"""
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from apps.sale import facets
+from apps.sale.models import Product
+
+from .helpers import (
+    create_category,
+    create_product,
+    create_promotion,
+    create_user,
+    reset_cache,
+)
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        reset_cache()
+        self.user = create_user()
+        self.gear = create_category(self.user, 'Gear')
+        self.books = create_category(self.user, 'Books')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        rows = [
+            (self.gear, '5.00', 0, True),
+            (self.gear, '25.00', 10, True),
+            (self.gear, '250.00', 3, False),
+            (self.books, '8.00', 7, True),
+            (self.books, '60.00', 0, False),
+        ]
+        products = [
+            create_product(
+                self.user,
+                category,
+                sku=f'SKU-{n}',
+                price=price,
+                stock_quantity=stock,
+                is_active=active,
+            )
+            for n, (category, price, stock, active) in enumerate(rows)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            create_promotion(self.user, [products[1], products[3]])
+
+    def listed(self, params):
+        response = self.client.get('/api/products/', {**params, 'facets': 'true'})
+        self.assertEqual(response.status_code, 200)
+        return response.data['facets']
+
+    def computed(self, **filters):
+        """
+        The facet block aggregated straight over the matching products.
+        """
+        return facets._fold(
+            facets._grouped(Product.objects.filter(**filters), 'category_id')
+        )
+
+    def test_summary_matches_the_live_aggregate(self):
+        cases = [
+            ({}, {}),
+            ({'category': self.gear.pk}, {'category': self.gear}),
+            ({'is_active': 'true'}, {'is_active': True}),
+            (
+                {'category': self.books.pk, 'is_active': 'false'},
+                {'category': self.books, 'is_active': False},
+            ),
+        ]
+        for params, filters in cases:
+            with self.subTest(params=params):
+                self.assertIsNotNone(
+                    facets._summary_filters(
+                        {key: str(value) for key, value in params.items()}
+                    )
+                )
+                self.assertEqual(self.listed(params), self.computed(**filters))
+
+    def test_other_filters_take_the_live_path(self):
+        params = {'price__gte': '20', 'category': self.gear.pk}
+
+        self.assertIsNone(
+            facets._summary_filters({key: str(value) for key, value in params.items()})
+        )
+        block = self.listed(params)
+
+        self.assertEqual(block, self.computed(price__gte=20, category=self.gear))
+        self.assertEqual(block['category'], [{'value': self.gear.pk, 'count': 2}])
+        self.assertEqual(block['on_promotion'], {'true': 1, 'false': 1})
+
+    def test_summary_buckets_prices_stock_and_promotions(self):
+        block = self.listed({})
+
+        self.assertEqual(block['category'], [
+            {'value': self.gear.pk, 'count': 3}, {'value': self.books.pk, 'count': 2},
+        ])
+        self.assertEqual(sum(bucket['count'] for bucket in block['price']), 5)
+        self.assertEqual(block['in_stock'], {'true': 3, 'false': 2})
+        self.assertEqual(block['on_promotion'], {'true': 2, 'false': 3})
@@ -0,0 +1,79 @@
+"""
+Tests for list pages built from cached row fragments (``views.FragmentListMixin``).
+"""
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.sale import fragments
+from apps.sale.models import ImageAsset, Product
+
+from .helpers import (
+    create_category,
+    create_product,
+    create_promotion,
+    create_user,
+    reset_cache,
+)
+
+
+class ProductFragmentTests(TestCase):
+    def setUp(self):
+        reset_cache()
+        self.user = create_user()
+        self.category = create_category(self.user)
+        self.product = create_product(self.user, self.category)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def row(self, **headers):
+        response = self.client.get('/api/products/', **headers)
+        self.assertEqual(response.status_code, 200)
+        [row] = response.json()['results']
+        return row
+
+    def test_rows_are_cached_as_fragments(self):
+        self.row()
+
+        self.assertIsNotNone(cache.get(fragments.key('product', self.product.pk)))
+
+    def test_writes_without_signals_change_the_version(self):
+        self.row()
+        # Counter bumps and bulk edits skip save(), so nothing drops the fragment
+        Product.objects.filter(pk=self.product.pk).update(comment_count=4)
+        self.assertEqual(self.row()['comment_count'], 4)
+
+        Product.objects.filter(pk=self.product.pk).update(
+            name='Renamed', updated_at=timezone.now()
+        )
+        self.assertEqual(self.row()['name'], 'Renamed')
+
+    def test_related_changes_change_the_version(self):
+        self.row()
+
+        self.category.name = 'Tools'
+        self.category.save()
+        self.assertEqual(self.row()['category_name'], 'Tools')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_promotion(self.user, [self.product])
+        self.assertEqual(self.row()['effective_price'], '5.00')
+
+    def test_fragments_are_not_shared_between_hosts(self):
+        asset = ImageAsset.objects.create(
+            sha256='b' * 64,
+            original='assets/lamp.jpg',
+            width=800,
+            height=600,
+            format='JPEG',
+            size=1024,
+        )
+        Product.objects.filter(pk=self.product.pk).update(image_asset=asset)
+
+        for host in ('localhost', '127.0.0.1'):
+            self.assertTrue(
+                self.row(HTTP_HOST=host)['image_srcset']['src'].startswith(
+                    f'http://{host}/'
+                )
+            )
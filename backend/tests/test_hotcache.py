@@ -0,0 +1,105 @@
+"""
+Tests for stampede-safe caching (``apps.sale.hotcache``).
+"""
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from apps.sale import hotcache
+
+from .helpers import reset_cache
+
+
+class Counter:
+    """
+    A ``compute`` that counts its calls and returns the call number.
+    """
+
+    def __init__(self, delay=0):
+        self.calls = 0
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls += 1
+            return self.calls
+
+
+# No early recomputation: an entry is due exactly at its expiry
+@mock.patch('apps.sale.hotcache.random.random', return_value=0.0)
+class HotCacheTests(TestCase):
+    def setUp(self):
+        reset_cache()
+
+    def test_cold_key_is_computed_once_for_concurrent_readers(self, _):
+        compute = Counter(delay=0.2)
+        values = []
+
+        def read():
+            values.append(hotcache.get_or_compute('hot', compute, 60))
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(values, [1] * 8)
+
+    def test_fresh_value_is_served_from_the_cache(self, _):
+        compute = Counter()
+        hotcache.get_or_compute('hot', compute, 60)
+
+        self.assertEqual(hotcache.get_or_compute('hot', compute, 60), 1)
+        self.assertEqual(compute.calls, 1)
+
+    def test_expired_value_is_served_stale_while_another_process_recomputes(self, _):
+        compute = Counter()
+        hotcache.get_or_compute('hot', compute, 60)
+        with self.captureOnCommitCallbacks(execute=True):
+            hotcache.expire(['hot'])
+
+        # Someone else holds the recompute lock
+        cache.add('hot_lock', True, 10)
+        self.assertEqual(hotcache.get_or_compute('hot', compute, 60), 1)
+        self.assertEqual(compute.calls, 1)
+
+        cache.delete('hot_lock')
+        self.assertEqual(hotcache.get_or_compute('hot', compute, 60), 2)
+        self.assertEqual(hotcache.get_or_compute('hot', compute, 60), 2)
+
+    def test_expire_waits_for_the_transaction_to_commit(self, _):
+        compute = Counter()
+        hotcache.get_or_compute('hot', compute, 60)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            hotcache.expire(['hot'])
+            self.assertEqual(hotcache.get_or_compute('hot', compute, 60), 1)
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(hotcache.get_or_compute('hot', compute, 60), 2)
+
+    def test_hot_keys_are_warmed_after_invalidation(self, _):
+        hotcache.get_or_compute(
+            'hot', lambda: 'old', 60, warm=('operator.add', ('n', 'ew'))
+        )
+        hotcache.get_or_compute(
+            'cold', lambda: 'old', 60, warm=('operator.add', ('n', 'ew'))
+        )
+        cache.set('hot_hits', 10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            hotcache.expire(['hot', 'cold'])
+
+        self.assertEqual(cache.get('hot').value, 'new')
+        self.assertGreater(cache.get('hot').expires, time.time())
+        # Not read enough to be worth warming: recomputed by its next reader instead
+        self.assertEqual(cache.get('cold').value, 'old')
+        self.assertEqual(cache.get('cold').expires, 0)
@@ -0,0 +1,200 @@
+"""
+Tests for stock reservations (``apps.sale.inventory``) and the reservations API.
+"""
+import threading
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.sale import inventory
+from apps.sale.models import Category, Product, Role, StockReservation, StockShard, User
+
+
+class InventoryFixtureMixin:
+    """
+    A user and a product with ``stock`` units, before anything was reserved.
+    """
+    stock = 40
+
+    def create_fixture(self):
+        cache.clear()
+        role = Role.objects.create(name='customer')
+        self.user = User.objects.create(username='buyer', role=role)
+        category = Category.objects.create(
+            name='Gear', slug='gear', created_by=self.user
+        )
+        self.product = Product.objects.create(
+            name='Lamp',
+            sku='LAMP-1',
+            price='9.99',
+            category=category,
+            created_by=self.user,
+            stock_quantity=self.stock,
+        )
+
+    def reserve(self, quantity, key, **kwargs):
+        # Every call may take the slow path: the one-rebalance-per-second
+        # gate is for production traffic
+        cache.clear()
+        return inventory.reserve(self.user, self.product.pk, quantity, key, **kwargs)
+
+    def held(self):
+        return StockReservation.objects.filter(
+            product=self.product, status=StockReservation.STATUS_HELD
+        ).aggregate(units=Sum('quantity'))['units'] or 0
+
+    def shard_units(self):
+        return (
+            StockShard.objects.filter(product=self.product).aggregate(
+                units=Sum('available')
+            )['units']
+            or 0
+        )
+
+    def available(self):
+        return inventory.availability([self.product.pk])[self.product.pk]
+
+
+@override_settings(INVENTORY_SHARDS=4, INVENTORY_HOLD_SECONDS=600)
+class ReserveTests(InventoryFixtureMixin, TestCase):
+    def setUp(self):
+        self.create_fixture()
+
+    def test_reservations_never_exceed_stock_across_shards(self):
+        # 40 units over 4 shards of 10: three holds of 3 fit each shard, and the
+        # 4 units left over on separate shards must still be found by a rebalance
+        reserved = 0
+        for attempt in range(20):
+            try:
+                self.reserve(3, f'attempt-{attempt}')
+            except inventory.InsufficientStock:
+                continue
+            reserved += 3
+
+        self.assertEqual(StockShard.objects.filter(product=self.product).count(), 4)
+        self.assertEqual(reserved, 39)
+        self.assertEqual(self.held(), 39)
+        self.assertEqual(self.available(), 1)
+        self.assertEqual(self.shard_units(), 1)
+        with self.assertRaises(inventory.InsufficientStock):
+            self.reserve(2, 'one-too-many')
+
+    def test_expired_hold_gives_its_units_back(self):
+        now = timezone.now()
+        reservation, _ = self.reserve(5, 'lapsing', now=now - timedelta(seconds=601))
+        self.assertEqual(self.available(), self.stock - 5)
+
+        self.assertEqual(inventory.expire_holds(now=now), 1)
+
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, StockReservation.STATUS_EXPIRED)
+        self.assertEqual(self.available(), self.stock)
+        self.assertEqual(self.shard_units(), self.stock)
+        with self.assertRaises(inventory.ReservationConflict):
+            inventory.commit(reservation, now=now)
+        # A second sweep finds nothing to give back twice
+        self.assertEqual(inventory.expire_holds(now=now), 0)
+        self.assertEqual(self.shard_units(), self.stock)
+
+    def test_reconcile_takes_sales_off_stock_quantity(self):
+        sold, _ = self.reserve(4, 'sold')
+        self.reserve(2, 'still-held')
+        inventory.commit(sold)
+
+        # Committing leaves the product row alone until reconcile
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, self.stock)
+        self.assertEqual(self.available(), self.stock - 6)
+
+        self.assertEqual(inventory.reconcile(), 1)
+
+        self.product.refresh_from_db()
+        sold.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, self.stock - 4)
+        self.assertTrue(sold.reconciled)
+        self.assertEqual(self.available(), self.stock - 6)
+        self.assertEqual(inventory.reconcile(), 0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, self.stock - 4)
+
+
+@override_settings(INVENTORY_SHARDS=4)
+class ReservationApiTests(InventoryFixtureMixin, TestCase):
+    def setUp(self):
+        self.create_fixture()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, data, key):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post('/api/reservations/', data, format='json', **headers)
+
+    def test_repeated_idempotency_key_returns_the_same_reservation(self):
+        first = self.post({'product': self.product.pk, 'quantity': 2}, 'checkout-1')
+        retry = self.post({'product': self.product.pk, 'quantity': 2}, 'checkout-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(StockReservation.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.held(), 2)
+
+    def test_idempotency_key_reused_for_another_reservation_conflicts(self):
+        self.post({'product': self.product.pk, 'quantity': 2}, 'checkout-1')
+        response = self.post({'product': self.product.pk, 'quantity': 3}, 'checkout-1')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.held(), 2)
+
+    def test_idempotency_key_is_required(self):
+        response = self.post({'product': self.product.pk, 'quantity': 1}, None)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+@override_settings(INVENTORY_SHARDS=4)
+class ConcurrentReserveTests(InventoryFixtureMixin, TransactionTestCase):
+    stock = 30
+
+    def setUp(self):
+        self.create_fixture()
+        inventory.rebalance(self.product.pk, create=True)
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        attempts = iter(range(80))
+        lock = threading.Lock()
+        errors = []
+
+        def checkout():
+            try:
+                while True:
+                    with lock:
+                        attempt = next(attempts, None)
+                    if attempt is None:
+                        return
+                    try:
+                        inventory.reserve(
+                            self.user, self.product.pk, 1, f'thread-{attempt}'
+                        )
+                    except inventory.InsufficientStock:
+                        pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(self.held(), self.stock)
+        self.assertEqual(self.held() + self.shard_units(), self.stock)
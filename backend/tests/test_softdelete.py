@@ -0,0 +1,107 @@
+"""
+Tests for soft deletes and archival (``apps.sale.softdelete``).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.sale import softdelete
+from apps.sale.models import (
+    ArchivedRow,
+    Category,
+    Product,
+    ProductImage,
+    PromotionProduct,
+)
+
+from .helpers import (
+    create_category,
+    create_product,
+    create_promotion,
+    create_user,
+    reset_cache,
+)
+
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        reset_cache()
+        self.user = create_user()
+        self.category = create_category(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_delete_hides_the_row_and_its_dependants(self):
+        product = create_product(self.user, self.category)
+        image = ProductImage.objects.create(
+            product=product, image_url='products/lamp.jpg', created_by=self.user
+        )
+
+        response = self.client.delete(f'/api/categories/{self.category.pk}/')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Category.objects.filter(pk=self.category.pk).exists())
+        self.assertFalse(Product.objects.filter(pk=product.pk).exists())
+        self.assertFalse(ProductImage.objects.filter(pk=image.pk).exists())
+        self.assertIsNotNone(ProductImage.all_objects.get(pk=image.pk).deleted_at)
+        self.assertEqual(
+            self.client.get(f'/api/products/{product.pk}/').status_code, 404
+        )
+
+    def test_deleted_rows_keep_their_slug_and_sku_reserved(self):
+        product = create_product(self.user, self.category, sku='LAMP-1')
+        softdelete.soft_delete(product)
+
+        response = self.client.post('/api/products/', {
+            'name': 'Lamp again', 'slug': 'lamp-1', 'price': '9.99', 'sku': 'LAMP-1',
+            'category': self.category.pk, 'created_by': self.user.pk,
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('sku', response.data)
+
+    def test_linking_a_product_again_revives_the_deleted_link(self):
+        product = create_product(self.user, self.category)
+        promotion = create_promotion(self.user, [product])
+        link = PromotionProduct.objects.get(promotion=promotion, product=product)
+        softdelete.soft_delete(link)
+
+        response = self.client.post(
+            '/api/promotion-products/',
+            {
+                'promotion': promotion.pk,
+                'product': product.pk,
+                'created_by': self.user.pk,
+            },
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['id'], link.pk)
+        self.assertEqual(
+            PromotionProduct.all_objects.filter(
+                promotion=promotion, product=product
+            ).count(),
+            1,
+        )
+        self.assertTrue(PromotionProduct.objects.filter(pk=link.pk).exists())
+
+    def test_archive_moves_rows_past_retention_out_of_the_table(self):
+        old = create_product(self.user, self.category, sku='OLD-1')
+        recent = create_product(self.user, self.category, sku='RECENT-1')
+        now = timezone.now()
+        softdelete.soft_delete(
+            old, when=now - timedelta(days=settings.SOFT_DELETE_RETENTION_DAYS + 1)
+        )
+        softdelete.soft_delete(recent, when=now)
+
+        archived = softdelete.archive(now=now)
+
+        self.assertEqual(archived['sale.product'], 1)
+        self.assertFalse(Product.all_objects.filter(pk=old.pk).exists())
+        self.assertTrue(Product.all_objects.filter(pk=recent.pk).exists())
+        row = ArchivedRow.objects.get(model='sale.product', object_id=old.pk)
+        self.assertEqual(row.data['sku'], 'OLD-1')
@@ -0,0 +1,59 @@
+"""
+Tests for the pre-rendered storefront document (``apps.sale.storefront``).
+"""
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.sale import pricing, storefront
+from apps.sale.models import ProductPrice
+
+from .helpers import (
+    create_category,
+    create_product,
+    create_promotion,
+    create_user,
+    reset_cache,
+)
+
+
+class StorefrontTests(TestCase):
+    def setUp(self):
+        reset_cache()
+        self.user = create_user()
+        self.product = create_product(self.user, create_category(self.user))
+
+    def promotions(self):
+        return json.loads(self.client.get('/api/storefront/').content)['promotions']
+
+    def test_promotion_drops_off_the_day_after_it_ended(self):
+        today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_promotion(
+                self.user, [self.product], start=today - timedelta(days=3), end=today
+            )
+        storefront.render()
+        self.assertEqual(len(self.promotions()), 1)
+
+        tomorrow = today + timedelta(days=1)
+        with mock.patch('django.utils.timezone.localdate', return_value=tomorrow):
+            with self.captureOnCommitCallbacks(execute=True):
+                pricing.refresh_boundaries(on=tomorrow)
+            self.assertTrue(storefront.refresh())
+            self.assertEqual(self.promotions(), [])
+
+    def test_price_refresh_marks_the_document_dirty(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_promotion(self.user, [self.product])
+        # Prices lost without any save signal, e.g. by a bulk delete
+        ProductPrice.objects.all().delete()
+        storefront.render()
+        self.assertFalse(storefront.refresh())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pricing.refresh([self.product.pk])
+
+        self.assertTrue(storefront.refresh())